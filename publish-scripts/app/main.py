@@ -1,5 +1,6 @@
 import sys
 import os
+import math
 from pathlib import Path
 from contextlib import asynccontextmanager
 from typing import Optional
@@ -9,19 +10,26 @@ current_dir = Path(__file__).parent
 if str(current_dir) not in sys.path:
     sys.path.insert(0, str(current_dir))
 
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Query
 from fastapi.responses import JSONResponse
 import logging
 from fastapi.staticfiles import StaticFiles
 
-from services import get_service_manager, get_ha_client, get_ngrok_manager
+from services import get_service_manager, get_ha_client, get_ha_prober, get_tunnel_backend, get_script_catalog, get_rate_limiter, get_run_queue
+from services.rate_limiter import get_client_ip
+from services.metrics import RUN_REQUESTS_TOTAL
+from services.tracing import span, TimingMiddleware, SLOW_REQUESTS
+from services.circuit_breaker import CircuitOpenError
+from services.responses import lean_run_response, lean_job_status, RUN_RESPONSE_LEAN
 from settings import get_settings, Settings
 
 # Import routers
-from routers import health, tunnels, scripts
+from routers import health, tunnels, scripts, metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
+# httpx logs every request at INFO; the services already log the calls that matter
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 def create_app(settings: Optional[Settings] = None) -> FastAPI:
@@ -37,6 +45,9 @@ def create_app(settings: Optional[Settings] = None) -> FastAPI:
         # Initialize services if not already done
         if not service_manager.is_initialized():
             service_manager.initialize_services()
+        # Bring back links handed out before a restart; the tunnel comes up in the background
+        await service_manager.restore_tunnels()
+        service_manager.start_tunnel_warm_up()
         
         # Use the injected settings here
         app.state.settings = settings
@@ -44,21 +55,55 @@ def create_app(settings: Optional[Settings] = None) -> FastAPI:
         # Validate configuration on startup
         validate_startup_configuration()
         
-        # Test Home Assistant connectivity
-        # TODO: Update this to check the HA API is reachable
-        # test_home_assistant_connectivity()  # Commented out for local development
+        # Keep the script catalog current from the Home Assistant event stream
+        script_catalog = get_script_catalog()
+        if script_catalog:
+            script_catalog.start()
+
+        # Workers for asynchronous /run calls
+        run_queue = get_run_queue()
+        if run_queue:
+            run_queue.start()
+
+        # Pick up configuration changes without a restart
+        service_manager.start_settings_watcher()
+
+        # Revoke expiring links exactly at their deadline
+        tunnel_backend = get_tunnel_backend()
+        if tunnel_backend:
+            tunnel_backend.start_cleanup_task()
+        
+        # Check the HA API is reachable in the background; health endpoints read the cached result
+        ha_prober = get_ha_prober()
+        if ha_prober:
+            ha_prober.start()
         
         logger.info("✅ Publish Scripts add-on started successfully!")
         
-        # TODO: Make sure the context manager is actually working and the ngrok is being stopped
+        # TODO: Make sure the context manager is actually working and the tunnel is being stopped
         yield
         
         # Cleanup on shutdown
-        ngrok_manager = get_ngrok_manager()
-        if ngrok_manager:
-            ngrok_manager.stop_cleanup_task()
-            ngrok_manager.stop_tunnel()
-            ngrok_manager.clear_all_tunnels()
+        await service_manager.stop_settings_watcher()
+        ha_prober = get_ha_prober()
+        if ha_prober:
+            await ha_prober.stop()
+        script_catalog = get_script_catalog()
+        if script_catalog:
+            await script_catalog.stop()
+        run_queue = get_run_queue()
+        if run_queue:
+            await run_queue.stop()
+        tunnel_backend = get_tunnel_backend()
+        if tunnel_backend:
+            await tunnel_backend.cancel_warm_up()
+            await tunnel_backend.stop_cleanup_task()
+            await tunnel_backend.shutdown()
+            # Links stay in the registry so they are restored on the next start
+            await tunnel_backend.aclose()
+        ha_client = get_ha_client()
+        if ha_client:
+            await ha_client.aclose()
         logger.info("🔄 Publish Scripts add-on shutting down...")
 
     app = FastAPI(
@@ -67,10 +112,15 @@ def create_app(settings: Optional[Settings] = None) -> FastAPI:
         lifespan=lifespan
     )
 
+    # Trace every request: Server-Timing header and the /debug/slow buffer
+    SLOW_REQUESTS.configure(settings.slow_request_threshold_ms, settings.slow_request_buffer_size)
+    app.add_middleware(TimingMiddleware, slow_log=SLOW_REQUESTS)
+
     # Include routers
     app.include_router(health.router)
     app.include_router(tunnels.router)
     app.include_router(scripts.router)
+    app.include_router(metrics.router)
 
     @app.exception_handler(Exception)
     async def global_exception_handler(request, exc):
@@ -81,29 +131,105 @@ def create_app(settings: Optional[Settings] = None) -> FastAPI:
             content={"detail": "Internal server error"}
         )
 
+    @app.exception_handler(CircuitOpenError)
+    async def circuit_open_handler(request, exc):
+        """Home Assistant calls are failing fast; tell the caller when to retry."""
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(exc)},
+            headers={"Retry-After": str(math.ceil(exc.retry_after))}
+        )
+
+    def too_many_requests(retry_after: float) -> JSONResponse:
+        """Cheap 429 response for callers over their rate limit."""
+        return JSONResponse(
+            {"detail": "Too many requests."},
+            status_code=429,
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
     # Add dynamic catch-all endpoint for /run/{unique_hash}
     @app.get("/run/{unique_hash}")
-    async def run_script_by_hash(unique_hash: str, request: Request):
-        ngrok_manager = get_ngrok_manager()
-        if not ngrok_manager:
-            raise HTTPException(status_code=503, detail="Ngrok manager not available.")
-        
-        script_id = ngrok_manager.get_script_id_by_hash(unique_hash)
-        if not script_id:
-            raise HTTPException(status_code=404, detail="Invalid or expired URL.")
+    async def run_script_by_hash(
+        unique_hash: str,
+        request: Request,
+        run_async: bool = Query(False, alias="async", description="Queue the run and return 202 with a job id"),
+        include_result: bool = Query(False, alias="result", description="Include the Home Assistant result when RUN_RESPONSE_MODE is lean")
+    ):
+        # Count every outcome, including rejections, by response status
+        try:
+            response = await _run_script_by_hash(unique_hash, request, run_async, include_result)
+        except HTTPException as e:
+            RUN_REQUESTS_TOTAL.inc(str(e.status_code))
+            raise
+        RUN_REQUESTS_TOTAL.inc(str(response.status_code))
+        return response
+
+    async def _run_script_by_hash(unique_hash: str, request: Request, run_async: bool,
+                                  include_result: bool = False) -> JSONResponse:
+        # Limit each client before the link lookup, so guessing hashes is throttled too
+        with span("lookup"):
+            rate_limiter = get_rate_limiter()
+            retry_after = rate_limiter.check_client(get_client_ip(request) or "unknown")
+            if retry_after:
+                return too_many_requests(retry_after)
+
+            tunnel_backend = get_tunnel_backend()
+            if not tunnel_backend:
+                raise HTTPException(status_code=503, detail="Tunnel backend not available.")
+            
+            script_id = await tunnel_backend.get_script_id_by_hash(unique_hash)
+            if not script_id:
+                raise HTTPException(status_code=404, detail="Invalid or expired URL.")
+
+            # Only known links get a bucket, so unknown hashes cannot evict real ones
+            retry_after = rate_limiter.check_link(unique_hash)
+            if retry_after:
+                return too_many_requests(retry_after)
         
+        if run_async:
+            run_queue = get_run_queue()
+            if not run_queue:
+                raise HTTPException(status_code=503, detail="Run queue not available.")
+            job = run_queue.submit(script_id)
+            if job is None:
+                return JSONResponse(
+                    {"detail": "Run queue is full, try again later."},
+                    status_code=503,
+                    headers={"Retry-After": "1"}
+                )
+            return JSONResponse({
+                "success": True,
+                "message": f"Script {script_id} queued",
+                "script_id": script_id,
+                "job_id": job.job_id,
+                "status": job.status,
+                "status_url": f"/jobs/{job.job_id}",
+                # Each worker has its own queue, so this is the depth seen by this worker only
+                "queue_depth": run_queue.get_queue_depth()
+            }, status_code=202)
+
         ha_client = get_ha_client()
         if not ha_client:
             raise HTTPException(status_code=503, detail="Home Assistant client not available.")
         
         try:
-            result = await ha_client.run_script_async(script_id)
+            with span("run"):
+                result = await ha_client.run_script_async(script_id)
+            if get_settings().run_response_mode == RUN_RESPONSE_LEAN and not include_result:
+                return lean_run_response(script_id, result)
             return JSONResponse({
                 "success": True,
                 "message": f"Script {script_id} executed successfully",
                 "script_id": script_id,
                 "result": result
             })
+        except CircuitOpenError as e:
+            return JSONResponse({
+                "success": False,
+                "message": str(e),
+                "script_id": script_id
+            }, status_code=503, headers={"Retry-After": str(math.ceil(e.retry_after))})
         except Exception as e:
             return JSONResponse({
                 "success": False,
@@ -111,6 +237,34 @@ def create_app(settings: Optional[Settings] = None) -> FastAPI:
                 "script_id": script_id
             }, status_code=500)
 
+    @app.get("/debug/slow")
+    async def get_slow_requests():
+        """Get the most recent requests slower than SLOW_REQUEST_THRESHOLD_MS, with their spans."""
+        requests = SLOW_REQUESTS.get_entries()
+        return {
+            "threshold_ms": SLOW_REQUESTS.threshold_ms,
+            "count": len(requests),
+            "requests": requests
+        }
+
+    @app.get("/jobs/{job_id}")
+    async def get_run_job(
+        job_id: str,
+        include_result: bool = Query(False, alias="result", description="Include the Home Assistant result when RUN_RESPONSE_MODE is lean")
+    ):
+        """Get the status and result of a queued run."""
+        run_queue = get_run_queue()
+        job = run_queue.get_job(job_id) if run_queue else None
+        if not job:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+        status = job.to_dict()
+        if get_settings().run_response_mode == RUN_RESPONSE_LEAN and not include_result:
+            status = lean_job_status(status)
+        # Per worker, like the queue itself
+        status['queue_depth'] = run_queue.get_queue_depth()
+        return status
+
     return app
 
 def validate_startup_configuration():
@@ -127,14 +281,16 @@ def validate_startup_configuration():
         logger.error("   Go to Settings → Add-ons → Publish Scripts → Configuration")
         sys.exit(1)
     
-    # Check Ngrok token (optional but recommended)
-    ngrok_manager = get_ngrok_manager()
-    if not ngrok_manager or not ngrok_manager.is_configured():
+    # Check the tunnel backend (the ngrok token is optional but recommended)
+    tunnel_backend = get_tunnel_backend()
+    if not tunnel_backend:
+        logger.warning("⚠️  Tunnel backend not available! Published links will be disabled.")
+    elif not tunnel_backend.is_configured():
         logger.warning("⚠️  NGROK_AUTH_TOKEN not configured!")
         logger.warning("   Ngrok functionality will be disabled.")
-        logger.warning("   To enable ngrok tunnels, add NGROK_AUTH_TOKEN to configuration.")
+        logger.warning("   To enable ngrok tunnels, add NGROK_AUTH_TOKEN to configuration, or set TUNNEL_BACKEND to local.")
     else:
-        logger.info("✅ Ngrok authentication token configured")
+        logger.info(f"✅ Tunnel backend configured: {tunnel_backend.name}")
     
     logger.info("✅ Configuration validation passed")
 
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Any, Optional
+from pydantic import BaseModel, Field
+from typing import Any, List, Optional
 
 # Pydantic model for script request
 class ScriptRequest(BaseModel):
@@ -10,6 +10,10 @@ class CreateTunnelRequest(BaseModel):
     script_id: str
     timeout_minutes: Optional[int] = None
 
+# Pydantic model for extending a tunnel's expiration
+class ExtendTunnelRequest(BaseModel):
+    minutes: int = Field(gt=0)
+
 # Pydantic model for tunnel response
 class TunnelResponse(BaseModel):
     success: bool
@@ -20,6 +24,16 @@ class TunnelResponse(BaseModel):
     error: Optional[str] = None
     note: Optional[str] = None
 
+# Pydantic model for an accepted tunnel creation job
+class TunnelJobResponse(BaseModel):
+    success: bool
+    message: str
+    job_id: str
+    script_id: str
+    status: str
+    status_url: str
+    events_url: str
+
 # Pydantic model for script execution response
 class ScriptResponse(BaseModel):
     success: bool
@@ -28,6 +42,27 @@ class ScriptResponse(BaseModel):
     result: Any  # Accept any type, not just dict
     error: Optional[str] = None
 
+# Pydantic model for running several scripts in one request
+class BatchRunRequest(BaseModel):
+    script_ids: List[str] = Field(min_length=1)
+
+# Pydantic model for the outcome of one script in a batch run
+class BatchRunItem(BaseModel):
+    script_id: str
+    success: bool
+    latency_ms: float
+    result: Any = None
+    error: Optional[str] = None
+
+# Pydantic model for batch run response
+class BatchRunResponse(BaseModel):
+    success: bool
+    message: str
+    succeeded: int
+    failed: int
+    latency_ms: float
+    results: List[BatchRunItem]
+
 class StartNgrokTunnelRequest(BaseModel):
     script_id: str
     port: int = 8099
@@ -20,8 +20,11 @@ async def root():
         "version": "1.0.0",
         "status": "running",
         "ngrok_configured": status["ngrok_configured"],
+        "tunnel_backend": status["tunnel_backend"],
+        "tunnel_state": status["tunnel_state"],
         "ha_configured": status["ha_configured"],
         "ha_connected": status["ha_connected"],
+        "ha_breaker": status["ha_breaker"]["state"] if status["ha_breaker"] else None,
         "services_initialized": status["initialized"]
     }
 
@@ -44,6 +47,7 @@ async def health_check():
             "status": "healthy",
             "ngrok_available": status["ngrok_configured"],
             "ha_connected": status["ha_connected"],
+            "ha_breaker": status["ha_breaker"],
             "services_initialized": status["initialized"]
         }
         
@@ -53,6 +57,33 @@ async def health_check():
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=503, detail="Health check failed") 
 
+@router.get("/live")
+async def liveness_check():
+    """Liveness endpoint. Answers as long as the event loop runs, without checking any dependency."""
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def readiness_check():
+    """Readiness endpoint. Reads the cached Home Assistant probe instead of calling Home Assistant."""
+    service_manager = get_service_manager()
+    status = service_manager.get_status()
+    
+    if not status["initialized"]:
+        raise HTTPException(status_code=503, detail="Services not initialized")
+    
+    probe = status["ha_probe"]
+    if not status["ha_connected"]:
+        reason = "Home Assistant not checked yet" if probe and probe["connected"] is None else "Cannot connect to Home Assistant"
+        raise HTTPException(status_code=503, detail={"message": reason, "ha_probe": probe})
+    
+    return {
+        "status": "ready",
+        "tunnel_backend": status["tunnel_backend"],
+        "tunnel_state": status["tunnel_state"],
+        "ha_probe": probe,
+        "ha_breaker": status["ha_breaker"]
+    }
+
 @router.get("/debug-paths")
 def debug_paths():
     return {
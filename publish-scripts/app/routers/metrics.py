@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+import logging
+
+from services import get_tunnel_backend
+from services.metrics import REGISTRY, ACTIVE_LINKS, TUNNEL_BACKEND_RUNNING
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Expose metrics in the Prometheus text format.
+    Gauges describing current state are sampled here, at scrape time.
+    """
+    tunnel_backend = get_tunnel_backend()
+    if tunnel_backend:
+        ACTIVE_LINKS.set(await tunnel_backend.get_tunnel_count())
+        TUNNEL_BACKEND_RUNNING.set(1 if tunnel_backend.is_running() else 0, tunnel_backend.name)
+
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
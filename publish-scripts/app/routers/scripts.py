@@ -1,27 +1,96 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from typing import Optional
+import asyncio
 import logging
+import math
+import time
 
-from models import ScriptResponse
-from services import get_service_manager, get_ha_client, get_ngrok_manager
+from models import ScriptResponse, BatchRunRequest, BatchRunItem, BatchRunResponse
+from services import get_service_manager, get_ha_client, get_tunnel_backend, get_script_catalog, get_settings
+from services.tracing import span
+from services.circuit_breaker import CircuitOpenError
+from services.responses import lean_run_response, RUN_RESPONSE_LEAN
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/scripts", tags=["scripts"])
 
+# Fields that can be requested with the fields= projection
+SCRIPT_FIELDS = ('entity_id', 'name', 'state', 'attributes')
+
+def service_unavailable(e: CircuitOpenError) -> HTTPException:
+    """503 telling the caller when Home Assistant calls will be tried again."""
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(math.ceil(e.retry_after))}
+    )
+
+def parse_fields(fields: Optional[str]) -> Optional[list]:
+    """
+    Parse a comma-separated fields= projection.
+    entity_id is always included because it identifies the script and is the pagination cursor.
+    """
+    if not fields:
+        return None
+    
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in SCRIPT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed fields: {', '.join(SCRIPT_FIELDS)}"
+        )
+    return [field for field in SCRIPT_FIELDS if field == 'entity_id' or field in requested]
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against the current ETag."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
 @router.get("/")
-async def get_scripts():
+async def get_scripts(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Maximum number of scripts to return"),
+    cursor: Optional[str] = Query(None, description="Cursor returned as next_cursor by the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to include")
+):
     """
     Get list of available scripts from Home Assistant.
+    Supports cursor pagination, field projection and conditional requests via ETag.
     """
     try:
-        ha_client = get_ha_client()
+        script_catalog = get_script_catalog()
+        projection = parse_fields(fields)
+        
+        with span("catalog"):
+            scripts, next_cursor = await script_catalog.get_scripts_page(cursor=cursor, limit=limit)
+            total = script_catalog.get_script_count()
+        
+        # The representation only changes when the catalog does
+        etag = script_catalog.get_etag()
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        
+        if projection:
+            scripts = [{field: script.get(field) for field in projection} for script in scripts]
         
-        scripts = await ha_client.get_scripts_async()
         return {
             "scripts": scripts,
-            "count": len(scripts)
+            "count": len(scripts),
+            "total": total,
+            "next_cursor": next_cursor
         }
         
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         logger.error(f"❌ Error getting scripts: {e}")
         raise HTTPException(
@@ -29,15 +98,52 @@ async def get_scripts():
             detail="Internal server error while retrieving scripts"
         )
 
+@router.get("/search")
+async def search_scripts(
+    q: str = Query(..., min_length=1, description="Search text matched against entity_id and friendly name"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results"),
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to include")
+):
+    """
+    Search scripts by entity_id and friendly name.
+    Results are ranked best match first and served from the in-memory index.
+    """
+    try:
+        script_catalog = get_script_catalog()
+        projection = parse_fields(fields)
+        
+        with span("search"):
+            scripts = await script_catalog.search(q, limit=limit)
+        if projection:
+            scripts = [{field: script.get(field) for field in projection} for script in scripts]
+        
+        return {
+            "scripts": scripts,
+            "count": len(scripts),
+            "query": q
+        }
+        
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
+    except Exception as e:
+        logger.error(f"❌ Error searching scripts for '{q}': {e}")
+        raise HTTPException(
+            status_code=500, 
+            detail="Internal server error while searching scripts"
+        )
+
 @router.get("/{script_id}")
 async def get_script(script_id: str):
     """
     Get information about a specific script.
     """
     try:
-        ha_client = get_ha_client()
+        script_catalog = get_script_catalog()
         
-        script_info = await ha_client.get_script_async(script_id)
+        with span("catalog"):
+            script_info = await script_catalog.get_script(script_id)
         
         if not script_info:
             raise HTTPException(
@@ -49,6 +155,8 @@ async def get_script(script_id: str):
         
     except HTTPException:
         raise
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         logger.error(f"❌ Error getting script {script_id}: {e}")
         raise HTTPException(
@@ -57,20 +165,28 @@ async def get_script(script_id: str):
         )
 
 @router.get("/run/{script_id}")
-async def run_script(script_id: str):
+async def run_script(
+    script_id: str,
+    include_result: bool = Query(False, alias="result", description="Include the Home Assistant result when RUN_RESPONSE_MODE is lean")
+):
     """
     Execute a script via the tunnel.
-    This endpoint is accessible through the ngrok tunnel.
+    This endpoint is accessible through the published tunnel.
+    With RUN_RESPONSE_MODE=lean the states changed by the script are only
+    returned when result=true is passed.
     """
     try:
         ha_client = get_ha_client()
         
         # Execute the script in Home Assistant
         # TODO: Add a check to see if the script has been executed successfully
-        result = await ha_client.run_script_async(script_id)
+        with span("run"):
+            result = await ha_client.run_script_async(script_id)
         
         logger.info(f"✅ Script {script_id} executed successfully")
         
+        if get_settings().run_response_mode == RUN_RESPONSE_LEAN and not include_result:
+            return lean_run_response(script_id, result)
         return ScriptResponse(
             success=True,
             message=f"Script {script_id} executed successfully",
@@ -80,9 +196,64 @@ async def run_script(script_id: str):
         
     except HTTPException:
         raise
+    except CircuitOpenError as e:
+        raise service_unavailable(e)
     except Exception as e:
         logger.error(f"❌ Error running script {script_id}: {e}")
         raise HTTPException(
             status_code=500, 
             detail="Internal server error while executing script"
-        ) 
\ No newline at end of file
+        ) 
+
+@router.post("/run-batch", response_model=BatchRunResponse)
+async def run_scripts_batch(request: BatchRunRequest):
+    """
+    Execute several scripts in one request.
+    Scripts run concurrently, at most BATCH_RUN_CONCURRENCY at a time, and
+    each one reports its own success, latency and result.
+    """
+    settings = get_settings()
+    if len(request.script_ids) > settings.batch_run_max_scripts:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many scripts in one batch (maximum {settings.batch_run_max_scripts})"
+        )
+
+    ha_client = get_ha_client()
+    semaphore = asyncio.Semaphore(settings.batch_run_concurrency)
+
+    async def run_one(script_id: str) -> BatchRunItem:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = await ha_client.run_script_async(script_id)
+                return BatchRunItem(
+                    script_id=script_id,
+                    success=True,
+                    latency_ms=round((time.perf_counter() - started) * 1000, 2),
+                    result=result
+                )
+            except Exception as e:
+                logger.error(f"❌ Error running script {script_id} in batch: {e}")
+                return BatchRunItem(
+                    script_id=script_id,
+                    success=False,
+                    latency_ms=round((time.perf_counter() - started) * 1000, 2),
+                    error=str(e)
+                )
+
+    started = time.perf_counter()
+    with span("run"):
+        results = await asyncio.gather(*(run_one(script_id) for script_id in request.script_ids))
+    succeeded = sum(1 for item in results if item.success)
+
+    logger.info(f"✅ Batch run finished: {succeeded}/{len(results)} scripts succeeded")
+
+    return BatchRunResponse(
+        success=succeeded == len(results),
+        message=f"{succeeded} of {len(results)} scripts executed successfully",
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        latency_ms=round((time.perf_counter() - started) * 1000, 2),
+        results=results
+    )
@@ -1,29 +1,35 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+import json
 import logging
-import asyncio
 
-from models import CreateTunnelRequest, TunnelResponse
-from services import get_ha_client, get_ngrok_manager, get_settings
+from models import CreateTunnelRequest, ExtendTunnelRequest, TunnelResponse, TunnelJobResponse
+from services import get_tunnel_backend, get_settings, get_tunnel_job_manager
+from services.tracing import span
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/tunnels", tags=["tunnels"])
 
-@router.post("/create", response_model=TunnelResponse)
-async def create_tunnel(request: CreateTunnelRequest, background_tasks: BackgroundTasks):
+@router.post("/create", response_model=TunnelResponse, status_code=202)
+async def create_tunnel(
+    request: CreateTunnelRequest,
+    wait: bool = Query(False, description="Wait for the tunnel instead of returning a job")
+):
     """
-    Create a new ngrok tunnel for a specific script.
+    Create a new tunnel for a specific script.
+    Returns 202 with a job id; follow progress at the job's status or events URL.
     """
     try:
-        ngrok_manager = get_ngrok_manager()
-        ha_client = get_ha_client()
+        tunnel_backend = get_tunnel_backend()
+        tunnel_job_manager = get_tunnel_job_manager()
         settings = get_settings()
         
         if not settings:
             raise HTTPException(status_code=500, detail="Settings not available.")
         
         # Runtime validation
-        if not ngrok_manager.is_configured():
+        if not tunnel_backend or not tunnel_backend.is_configured() or not tunnel_job_manager:
             raise HTTPException(
                 status_code=503, 
                 detail="Ngrok not configured. Please add NGROK_AUTH_TOKEN to add-on configuration."
@@ -32,55 +38,36 @@ async def create_tunnel(request: CreateTunnelRequest, background_tasks: Backgrou
         script_id = request.script_id
         
         # Check if tunnel already exists for this script
-        if ngrok_manager.is_tunnel_active_for_script(script_id):
-            existing_tunnel = ngrok_manager.get_tunnel_by_script_id(script_id)
+        if await tunnel_backend.is_tunnel_active_for_script(script_id):
+            existing_tunnel = await tunnel_backend.get_tunnel_by_script_id(script_id)
             if existing_tunnel:
-                return TunnelResponse(
+                return JSONResponse(TunnelResponse(
                     success=True,
                     message=f"Tunnel already exists for script {script_id}",
-                    tunnel_url=existing_tunnel.get('tunnel_url'),
-                    complete_url=existing_tunnel.get('complete_url'),
+                    tunnel_url=existing_tunnel.tunnel_url,
+                    complete_url=existing_tunnel.complete_url,
                     script_id=script_id
-                )
+                ).model_dump())
         
-        # Validate script exists in Home Assistant
-        if not await ha_client.script_exists_async(script_id):
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Script '{script_id}' not found in Home Assistant. Please check the script ID."
-            )
-        
-        # Start ngrok tunnel using configurable port
-        tunnel_url = ngrok_manager.start_tunnel_subprocess(settings.port, ngrok_manager.ngrok_token)
-        
-        if not tunnel_url:
-            raise HTTPException(
-                status_code=500, 
-                detail="Failed to create ngrok tunnel. Please check your ngrok configuration."
-            )
+        # Script validation and tunnel startup run in the background job
+        job = tunnel_job_manager.create_job(script_id, timeout_minutes=request.timeout_minutes)
         
-        # Store tunnel information
-        tunnel_info = {
-            'tunnel_url': tunnel_url,
-            'script_id': script_id,
-            'created_at': asyncio.get_event_loop().time()
-        }
-        # ngrok_manager.add_tunnel will now generate the unique hash and complete_url
-        ngrok_manager.add_tunnel(script_id, tunnel_info, timeout_minutes=request.timeout_minutes)
-        # Get the complete URL (now includes the unique hash)
-        complete_url = tunnel_info.get('complete_url')
+        if wait:
+            with span("tunnel_job"):
+                await job.wait()
+            if job.status != 'completed':
+                raise HTTPException(status_code=job.status_code or 500, detail=job.error)
+            return JSONResponse(TunnelResponse(**job.result).model_dump())
         
-        logger.info(f"✅ Created tunnel for script {script_id}: {tunnel_url}")
-        logger.info(f"🔗 Complete URL: {complete_url}")
-        logger.info(f"📡 Forwarding to port: {settings.port}")
-        
-        return TunnelResponse(
+        return JSONResponse(TunnelJobResponse(
             success=True,
-            message=f"Tunnel created successfully for script {script_id}",
-            tunnel_url=tunnel_url,
-            complete_url=complete_url,
-            script_id=script_id
-        )
+            message=f"Tunnel creation started for script {script_id}",
+            job_id=job.job_id,
+            script_id=script_id,
+            status=job.status,
+            status_url=f"tunnels/jobs/{job.job_id}",
+            events_url=f"tunnels/jobs/{job.job_id}/events"
+        ).model_dump(), status_code=202)
         
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -92,26 +79,85 @@ async def create_tunnel(request: CreateTunnelRequest, background_tasks: Backgrou
             detail="Internal server error while creating tunnel"
         )
 
+def get_job_or_404(job_id: str):
+    """Look up a tunnel creation job or raise 404."""
+    tunnel_job_manager = get_tunnel_job_manager()
+    job = tunnel_job_manager.get_job(job_id) if tunnel_job_manager else None
+    if not job:
+        raise HTTPException(status_code=404, detail=f"No tunnel job found with id {job_id}")
+    return job
+
+@router.get("/jobs/{job_id}")
+async def get_tunnel_job(job_id: str):
+    """
+    Get the status of a tunnel creation job.
+    """
+    return get_job_or_404(job_id).to_dict()
+
+@router.get("/jobs/{job_id}/events")
+async def stream_tunnel_job(job_id: str):
+    """
+    Stream the progress of a tunnel creation job as server-sent events.
+    Each step is sent as a 'progress' event, followed by a final 'completed' or 'failed' event.
+    """
+    job = get_job_or_404(job_id)
+    
+    async def event_stream():
+        seen_events = 0
+        while True:
+            while seen_events < len(job.events):
+                yield f"event: progress\ndata: {json.dumps(job.events[seen_events])}\n\n"
+                seen_events += 1
+            
+            if job.is_done():
+                yield f"event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n"
+                return
+            
+            # Keep the connection alive through proxies while waiting
+            if not await job.wait_for_update(seen_events, timeout=15):
+                yield ": keep-alive\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/agent-logs")
+async def get_agent_logs(
+    limit: int = Query(100, ge=0, le=5000, description="Maximum number of lines, most recent last"),
+    errors_only: bool = Query(False, description="Only return warnings and errors reported by the agent")
+):
+    """
+    Get the recent output of the tunnel agent and the state parsed from it.
+    With several workers, only the worker owning the agent has its output.
+    """
+    tunnel_backend = get_tunnel_backend()
+    if not tunnel_backend:
+        raise HTTPException(status_code=503, detail="Tunnel backend not available.")
+    if tunnel_backend.agent_logs is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"The {tunnel_backend.name} tunnel backend does not run an agent"
+        )
+
+    return {
+        "backend": tunnel_backend.name,
+        "owner": tunnel_backend.is_owner(),
+        "status": tunnel_backend.agent_logs.get_status(),
+        "lines": tunnel_backend.agent_logs.get_entries(limit=limit, errors_only=errors_only)
+    }
+
 @router.get("/")
 async def get_tunnels():
     """
     Get information about all active tunnels.
     """
     try:
-        ngrok_manager = get_ngrok_manager()
-        
-        tunnels = ngrok_manager.get_active_tunnels()
+        tunnel_backend = get_tunnel_backend()
         
         # Format response with complete URLs
-        tunnel_list = []
-        for script_id, tunnel_info in tunnels.items():
-            tunnel_list.append({
-                'script_id': script_id,
-                'tunnel_url': tunnel_info.get('tunnel_url'),
-                'complete_url': tunnel_info.get('complete_url'),
-                'created_at': tunnel_info.get('created_at'),
-                'expiration_time': tunnel_info.get('expiration_time')
-            })
+        tunnel_list = [link.to_dict() for link in await tunnel_backend.get_active_tunnels()]
         
         return {
             "tunnels": tunnel_list,
@@ -131,23 +177,17 @@ async def get_tunnel(script_id: str):
     Get information about a specific tunnel.
     """
     try:
-        ngrok_manager = get_ngrok_manager()
+        tunnel_backend = get_tunnel_backend()
         
-        tunnel_info = ngrok_manager.get_tunnel_by_script_id(script_id)
+        link = await tunnel_backend.get_tunnel_by_script_id(script_id)
         
-        if not tunnel_info:
+        if not link:
             raise HTTPException(
                 status_code=404, 
                 detail=f"No tunnel found for script {script_id}"
             )
         
-        return {
-            'script_id': script_id,
-            'tunnel_url': tunnel_info.get('tunnel_url'),
-            'complete_url': tunnel_info.get('complete_url'),
-            'created_at': tunnel_info.get('created_at'),
-            'expiration_time': tunnel_info.get('expiration_time')
-        }
+        return link.to_dict()
         
     except HTTPException:
         raise
@@ -158,28 +198,53 @@ async def get_tunnel(script_id: str):
             detail="Internal server error while retrieving tunnel"
         )
 
+@router.post("/{script_id}/extend")
+async def extend_tunnel(script_id: str, request: ExtendTunnelRequest):
+    """
+    Push back the expiration of a tunnel by the given number of minutes.
+    """
+    tunnel_backend = get_tunnel_backend()
+    if not tunnel_backend:
+        raise HTTPException(status_code=503, detail="Tunnel backend not available.")
+
+    extended = await tunnel_backend.extend_tunnel(script_id, request.minutes)
+    # The link may also be revoked by another request before it is read back
+    link = await tunnel_backend.get_tunnel_by_script_id(script_id) if extended else None
+    if not link:
+        raise HTTPException(
+            status_code=404, 
+            detail=f"No tunnel found for script {script_id}"
+        )
+
+    logger.info(f"⌛ Tunnel for script {script_id} extended by {request.minutes} minutes")
+
+    return {
+        "success": True,
+        "message": f"Tunnel for script {script_id} extended by {request.minutes} minutes",
+        "expiration_time": link.expiration_time
+    }
+
 @router.delete("/{script_id}")
 async def delete_tunnel(script_id: str):
     """
     Delete a specific tunnel.
     """
     try:
-        ngrok_manager = get_ngrok_manager()
-        
-        tunnel_info = ngrok_manager.get_tunnel_by_script_id(script_id)
+        tunnel_backend = get_tunnel_backend()
         
-        if not tunnel_info:
+        if not await tunnel_backend.is_tunnel_active_for_script(script_id):
             raise HTTPException(
                 status_code=404, 
                 detail=f"No tunnel found for script {script_id}"
             )
         
         # Remove from active tunnels
-        ngrok_manager.remove_tunnel(script_id)
+        await tunnel_backend.remove_tunnel(script_id)
         
-        # If this was the last tunnel, stop ngrok process
-        if ngrok_manager.get_tunnel_count() == 0:
-            ngrok_manager.stop_tunnel()
+        # If this was the last tunnel, close the shared tunnel
+        if await tunnel_backend.get_tunnel_count() == 0:
+            with span("agent"):
+                await tunnel_backend.stop_tunnel()
         
         logger.info(f"✅ Tunnel for script {script_id} deleted successfully")
         
@@ -203,9 +268,9 @@ async def delete_all_tunnels():
     Delete all active tunnels.
     """
     try:
-        ngrok_manager = get_ngrok_manager()
+        tunnel_backend = get_tunnel_backend()
         
-        tunnel_count = ngrok_manager.get_tunnel_count()
+        tunnel_count = await tunnel_backend.get_tunnel_count()
         
         if tunnel_count == 0:
             return {
@@ -213,11 +278,12 @@ async def delete_all_tunnels():
                 "message": "No active tunnels to delete"
             }
         
-        # Stop all tunnels
-        ngrok_manager.stop_tunnel()
-        
         # Clear all tunnels from the active tunnels list
-        ngrok_manager.clear_all_tunnels()
+        await tunnel_backend.clear_all_tunnels()
+        
+        # Close the shared tunnel
+        with span("agent"):
+            await tunnel_backend.stop_tunnel()
         
         logger.info(f"✅ Deleted {tunnel_count} active tunnels")
         
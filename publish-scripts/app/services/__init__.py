@@ -1,18 +1,63 @@
 # Services package
 from .ha_client import HomeAssistantClient
+from .ha_prober import HomeAssistantProber
+from .tunnel_backend import TunnelBackend
 from .ngrok_manager import NgrokManager
-from settings import Settings, get_settings
+from .local_proxy import LocalProxyBackend
+from .script_catalog import ScriptCatalog
+from .tunnel_jobs import TunnelJobManager
+from .rate_limiter import RunRateLimiter
+from .run_queue import RunQueue
+from .settings_watcher import SettingsWatcher
+from .tracing import SLOW_REQUESTS
+from settings import Settings, get_settings as get_settings_snapshot, get_settings_files
 import logging
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+# Settings each service re-reads when the configuration changes
+HA_CLIENT_SETTINGS = {
+    'hassio_token', 'ha_base_url', 'ha_request_timeout', 'ha_max_connections',
+    'ha_max_concurrency', 'script_dedup_window', 'ha_retry_attempts', 'ha_retry_backoff',
+    'ha_retry_max_backoff', 'ha_breaker_failure_rate', 'ha_breaker_slow_call_seconds',
+    'ha_breaker_window', 'ha_breaker_min_calls', 'ha_breaker_open_seconds'
+}
+SCRIPT_CATALOG_SETTINGS = {'hassio_token', 'ha_base_url', 'ha_websocket_url'}
+TUNNEL_BACKEND_SETTINGS = {
+    'ngrok_auth_token', 'ngrok_bin', 'ngrok_api_url', 'local_public_url', 'agent_log_buffer_size'
+}
+RATE_LIMITER_SETTINGS = {
+    'run_rate_limit_per_link', 'run_rate_limit_link_burst', 'run_rate_limit_per_client',
+    'run_rate_limit_client_burst', 'rate_limit_max_keys'
+}
+SLOW_REQUEST_SETTINGS = {'slow_request_threshold_ms', 'slow_request_buffer_size'}
+HA_PROBER_SETTINGS = {'ha_probe_interval', 'ha_probe_timeout'}
+# Settings that only take effect after a restart
+RESTART_SETTINGS = {
+    'port', 'web_workers', 'tunnel_backend', 'local_proxy_host', 'local_proxy_port',
+    'tunnel_registry_path', 'tunnel_registry_flush_interval', 'run_queue_workers',
+    'run_queue_max_size', 'settings_reload_interval'
+}
+
+# Tunnel backends selectable with TUNNEL_BACKEND
+TUNNEL_BACKENDS = {
+    NgrokManager.name: NgrokManager,
+    LocalProxyBackend.name: LocalProxyBackend,
+}
+
 class ServiceManager:
     """Manages service instances and provides access to them."""
     
     def __init__(self):
         self._ha_client = None
-        self._ngrok_manager = None
+        self._ha_prober = None
+        self._tunnel_backend = None
+        self._script_catalog = None
+        self._tunnel_job_manager = None
+        self._rate_limiter = None
+        self._run_queue = None
+        self._settings_watcher = None
         self._settings = None
         self._initialized = False
     
@@ -23,30 +68,56 @@ class ServiceManager:
         
         try:
             # Get settings
-            self._settings = Settings()
+            self._settings = get_settings_snapshot()
             logger.info(f"✅ Settings loaded - port: {self._settings.port}")
             
             # Initialize Home Assistant client
             self._ha_client = HomeAssistantClient()
             logger.info("✅ Home Assistant client initialized")
             
-            # Initialize Ngrok manager (this might fail if token is not configured)
+            # Initialize the background connectivity probe read by the health endpoints
+            self._ha_prober = HomeAssistantProber(
+                self._ha_client,
+                interval=self._settings.ha_probe_interval,
+                timeout=self._settings.ha_probe_timeout
+            )
+            logger.info("✅ Home Assistant prober initialized")
+            
+            # Initialize the script catalog backed by the Home Assistant client
+            self._script_catalog = ScriptCatalog(self._ha_client)
+            self._ha_client.set_script_lookup(self._script_catalog.is_known)
+            logger.info("✅ Script catalog initialized")
+            
+            # Initialize the tunnel backend chosen for this deployment (ngrok might fail if token is not configured)
             try:
-                self._ngrok_manager = NgrokManager()
-                logger.info("✅ Ngrok manager initialized")
+                backend_class = TUNNEL_BACKENDS.get(self._settings.tunnel_backend)
+                if backend_class is None:
+                    raise Exception(f"Unknown TUNNEL_BACKEND '{self._settings.tunnel_backend}', expected one of: {', '.join(TUNNEL_BACKENDS)}")
+                self._tunnel_backend = backend_class()
+                logger.info(f"✅ Tunnel backend initialized: {self._tunnel_backend.name}")
                 
-                # Warm up ngrok for faster first tunnel creation
-                if self._ngrok_manager.is_configured():
-                    logger.info("🚀 Starting ngrok warm-up...")
-                    warm_up_success = self._ngrok_manager.warm_up_ngrok(self._settings.port)
-                    if warm_up_success:
-                        logger.info("✅ ngrok warm-up completed successfully")
-                    else:
-                        logger.warning("⚠️ ngrok warm-up failed, but service will continue")
+                self._tunnel_job_manager = TunnelJobManager(
+                    self._tunnel_backend, self._script_catalog, self._settings.port,
+                    job_store=self._get_job_store()
+                )
             except Exception as e:
-                logger.warning(f"⚠️  Ngrok manager initialization failed: {e}")
-                logger.warning("   Ngrok functionality will be disabled")
-                self._ngrok_manager = None
+                logger.warning(f"⚠️  Tunnel backend initialization failed: {e}")
+                logger.warning("   Tunnel functionality will be disabled")
+                self._tunnel_backend = None
+                self._tunnel_job_manager = None
+            
+            # Initialize rate limiting for the public run endpoint
+            self._rate_limiter = RunRateLimiter(self._settings)
+            logger.info("✅ Run rate limiter initialized")
+            
+            # Initialize the queue for asynchronous /run calls
+            self._run_queue = RunQueue(
+                self._ha_client,
+                workers=self._settings.run_queue_workers,
+                max_queue=self._settings.run_queue_max_size,
+                job_store=self._get_job_store()
+            )
+            logger.info("✅ Run queue initialized")
             
             self._initialized = True
             logger.info("✅ Service manager initialized successfully")
@@ -55,6 +126,71 @@ class ServiceManager:
             logger.error(f"❌ Service manager initialization failed: {e}")
             raise
     
+    def _get_job_store(self):
+        """Get the store sharing job progress between workers, or None with a single worker."""
+        if self._tunnel_backend and self._tunnel_backend.shared:
+            return self._tunnel_backend.registry
+        return None
+
+    async def restore_tunnels(self):
+        """Reload the links persisted before the last restart."""
+        if not self._tunnel_backend:
+            return
+        
+        restored = await self._tunnel_backend.restore_tunnels()
+        if restored:
+            logger.info(f"✅ {restored} published links recovered")
+    
+    def start_settings_watcher(self):
+        """Start reloading the settings when options.json or .env change."""
+        if self._settings_watcher is None:
+            self._settings_watcher = SettingsWatcher(
+                get_settings_files(), self._settings.settings_reload_interval, self.apply_settings
+            )
+        self._settings_watcher.start()
+
+    async def stop_settings_watcher(self):
+        """Stop watching the settings files."""
+        if self._settings_watcher is not None:
+            await self._settings_watcher.stop()
+
+    async def apply_settings(self, old_settings: Settings, new_settings: Settings):
+        """Switch to a new settings snapshot, reconfiguring only the services whose settings changed."""
+        changed = {
+            name for name in Settings.model_fields
+            if getattr(old_settings, name) != getattr(new_settings, name)
+        }
+        self._settings = new_settings
+        if not changed:
+            return
+        logger.info(f"🔄 Settings changed: {', '.join(sorted(changed))}")
+
+        if changed & HA_CLIENT_SETTINGS and self._ha_client:
+            await self._ha_client.reconfigure(new_settings)
+        if changed & SCRIPT_CATALOG_SETTINGS and self._script_catalog:
+            await self._script_catalog.reconfigure(new_settings)
+        if changed & TUNNEL_BACKEND_SETTINGS and self._tunnel_backend:
+            await self._tunnel_backend.reconfigure(new_settings)
+        if changed & RATE_LIMITER_SETTINGS and self._rate_limiter:
+            self._rate_limiter.reconfigure(new_settings)
+        if changed & HA_PROBER_SETTINGS and self._ha_prober:
+            self._ha_prober.interval = new_settings.ha_probe_interval
+            self._ha_prober.timeout = new_settings.ha_probe_timeout
+        if changed & SLOW_REQUEST_SETTINGS:
+            SLOW_REQUESTS.configure(new_settings.slow_request_threshold_ms, new_settings.slow_request_buffer_size)
+
+        needs_restart = changed & RESTART_SETTINGS
+        if needs_restart:
+            logger.warning(f"⚠️  Restart the add-on to apply: {', '.join(sorted(needs_restart))}")
+
+    def start_tunnel_warm_up(self):
+        """Warm up the tunnel backend in the background, so startup does not wait for it."""
+        if not self._tunnel_backend or not self._tunnel_backend.is_configured():
+            return
+        
+        logger.info(f"🚀 Starting {self._tunnel_backend.name} warm-up in the background...")
+        self._tunnel_backend.start_warm_up(self._settings.port)
+    
     @property
     def ha_client(self) -> Optional[HomeAssistantClient]:
         """Get the Home Assistant client instance."""
@@ -63,12 +199,52 @@ class ServiceManager:
         return self._ha_client
     
     @property
-    def ngrok_manager(self) -> Optional[NgrokManager]:
-        """Get the Ngrok manager instance."""
+    def ha_prober(self) -> Optional[HomeAssistantProber]:
+        """Get the Home Assistant prober instance."""
+        if not self._initialized:
+            self.initialize_services()
+        return self._ha_prober
+
+    @property
+    def tunnel_backend(self) -> Optional[TunnelBackend]:
+        """Get the tunnel backend instance."""
+        if not self._initialized:
+            self.initialize_services()
+        return self._tunnel_backend
+
+    @property
+    def ngrok_manager(self) -> Optional[TunnelBackend]:
+        """Get the tunnel backend instance (kept for backward compatibility)."""
+        return self.tunnel_backend
+    
+    @property
+    def script_catalog(self) -> Optional[ScriptCatalog]:
+        """Get the script catalog instance."""
         if not self._initialized:
             self.initialize_services()
-        return self._ngrok_manager
+        return self._script_catalog
     
+    @property
+    def tunnel_job_manager(self) -> Optional[TunnelJobManager]:
+        """Get the tunnel job manager instance."""
+        if not self._initialized:
+            self.initialize_services()
+        return self._tunnel_job_manager
+    
+    @property
+    def rate_limiter(self) -> Optional[RunRateLimiter]:
+        """Get the run rate limiter instance."""
+        if not self._initialized:
+            self.initialize_services()
+        return self._rate_limiter
+
+    @property
+    def run_queue(self) -> Optional[RunQueue]:
+        """Get the run queue instance."""
+        if not self._initialized:
+            self.initialize_services()
+        return self._run_queue
+
     @property
     def settings(self):
         """Get the settings instance."""
@@ -81,31 +257,33 @@ class ServiceManager:
         return self._initialized
     
     def get_status(self) -> dict:
-        """Get the status of all services. Initializes services if needed."""
-        # Initialize services if not already done
+        """Get the status of all services. Never initializes services or calls Home Assistant."""
         if not self._initialized:
-            try:
-                self.initialize_services()
-            except Exception as e:
-                logger.error(f"Failed to initialize services for status check: {e}")
-                return {
-                    "initialized": False,
-                    "ha_configured": False,
-                    "ha_connected": False,
-                    "ngrok_configured": False,
-                    "error": str(e)
-                }
+            return {
+                "initialized": False,
+                "ha_configured": False,
+                "ha_connected": False,
+                "ngrok_configured": False,
+                "tunnel_backend": None,
+                "tunnel_state": None,
+                "ha_probe": None,
+                "ha_breaker": None
+            }
         
         ha_configured = self._ha_client.is_configured() if self._ha_client else False
-        # Don't test connection during startup to avoid worker timeouts
-        ha_connected = ha_configured  # Assume connected if configured
-        ngrok_configured = self._ngrok_manager.is_configured() if self._ngrok_manager else False
+        # Connectivity comes from the background probe, so status checks never wait on Home Assistant
+        ha_connected = bool(self._ha_prober and self._ha_prober.connected)
+        tunnel_configured = self._tunnel_backend.is_configured() if self._tunnel_backend else False
         
         return {
             "initialized": True,
             "ha_configured": ha_configured,
             "ha_connected": ha_connected,
-            "ngrok_configured": ngrok_configured,
+            "ngrok_configured": tunnel_configured,
+            "tunnel_backend": self._tunnel_backend.name if self._tunnel_backend else None,
+            "tunnel_state": self._tunnel_backend.warm_up_state if self._tunnel_backend else None,
+            "ha_probe": self._ha_prober.get_status() if self._ha_prober else None,
+            "ha_breaker": self._ha_client.breaker.get_status() if self._ha_client else None,
             "port": self._settings.port if self._settings else 8099
         }
 
@@ -117,9 +295,33 @@ def get_ha_client() -> Optional[HomeAssistantClient]:
     """Get the Home Assistant client instance."""
     return service_manager.ha_client
 
-def get_ngrok_manager() -> Optional[NgrokManager]:
-    """Get the Ngrok manager instance."""
-    return service_manager.ngrok_manager
+def get_ha_prober() -> Optional[HomeAssistantProber]:
+    """Get the Home Assistant prober instance."""
+    return service_manager.ha_prober
+
+def get_tunnel_backend() -> Optional[TunnelBackend]:
+    """Get the tunnel backend instance."""
+    return service_manager.tunnel_backend
+
+def get_ngrok_manager() -> Optional[TunnelBackend]:
+    """Get the tunnel backend instance (kept for backward compatibility)."""
+    return service_manager.tunnel_backend
+
+def get_script_catalog() -> Optional[ScriptCatalog]:
+    """Get the script catalog instance."""
+    return service_manager.script_catalog
+
+def get_tunnel_job_manager() -> Optional[TunnelJobManager]:
+    """Get the tunnel job manager instance."""
+    return service_manager.tunnel_job_manager
+
+def get_rate_limiter() -> Optional[RunRateLimiter]:
+    """Get the run rate limiter instance."""
+    return service_manager.rate_limiter
+
+def get_run_queue() -> Optional[RunQueue]:
+    """Get the run queue instance."""
+    return service_manager.run_queue
 
 def get_service_manager() -> ServiceManager:
     """Get the service manager instance."""
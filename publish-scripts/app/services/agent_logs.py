@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from typing import Optional, Dict, Any, List
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# key=value or key="quoted value" pairs of a logfmt line
+_LOGFMT_FIELD = re.compile(r'([\w.\-]+)=("(?:[^"\\]|\\.)*"|\S*)')
+
+# ngrok spells its levels dbug, info, warn, eror and crit
+ERROR_LEVELS = {"eror", "error", "crit"}
+
+# Longest line kept in the buffer; the rest is cut off
+MAX_LINE_LENGTH = 2000
+
+def parse_logfmt(line: str) -> Dict[str, str]:
+    """Parse a logfmt line such as `t=... lvl=info msg="started tunnel" url=https://...`."""
+    fields = {}
+    for key, value in _LOGFMT_FIELD.findall(line):
+        if value.startswith('"') and len(value) >= 2:
+            value = value[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+        fields[key] = value
+    return fields
+
+class AgentLogPump:
+    """
+    Drains the tunnel agent's stdout and stderr while it runs.
+    Reading both pipes continuously keeps the agent from blocking on a full
+    pipe. The last `max_lines` lines are kept in a ring buffer, and ngrok's
+    logfmt events are tracked: the agent is ready once its web service is
+    listening and its session with the ngrok service is established.
+    """
+
+    def __init__(self, max_lines: int = 500):
+        self._lines = deque(maxlen=max_lines)
+        self._tasks: List[asyncio.Task] = []
+        self._exit_task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._exited: Optional[asyncio.Event] = None
+        self._reset()
+
+    def _reset(self):
+        self.web_addr: Optional[str] = None
+        self.session_established = False
+        self.tunnel_urls: Dict[str, str] = {}
+        self.last_error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+
+    def resize(self, max_lines: int):
+        """Change how many lines are kept, keeping the most recent ones."""
+        if max_lines != self._lines.maxlen:
+            self._lines = deque(self._lines, maxlen=max_lines)
+
+    def start(self, process: asyncio.subprocess.Process):
+        """Start draining a freshly spawned agent process."""
+        self._cancel_tasks()
+        self._reset()
+        self.started_at = time.time()
+        self._ready = asyncio.Event()
+        self._exited = asyncio.Event()
+        streams = [(name, stream) for name, stream in (("stdout", process.stdout), ("stderr", process.stderr)) if stream]
+        self._tasks = [asyncio.create_task(self._drain(name, stream)) for name, stream in streams]
+        self._exit_task = asyncio.create_task(self._watch_exit(list(self._tasks), self._exited))
+
+    async def _drain(self, name: str, stream: asyncio.StreamReader):
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                # Longer than the stream limit; the reader has already discarded it
+                continue
+            if not line:
+                return
+            self._handle_line(name, line.decode(errors='replace').rstrip()[:MAX_LINE_LENGTH])
+
+    @staticmethod
+    async def _watch_exit(tasks: List[asyncio.Task], exited: asyncio.Event):
+        """Flag the agent as gone once both of its pipes are closed."""
+        await asyncio.gather(*tasks, return_exceptions=True)
+        exited.set()
+
+    def _handle_line(self, stream: str, line: str):
+        if not line:
+            return
+        fields = parse_logfmt(line)
+        level = fields.get("lvl")
+        message = fields.get("msg")
+        self._lines.append({
+            "received_at": time.time(),
+            "stream": stream,
+            "level": level,
+            "msg": message,
+            "line": line
+        })
+
+        if message == "starting web service":
+            self.web_addr = fields.get("addr")
+        elif message == "client session established":
+            self.session_established = True
+        elif message == "started tunnel" and fields.get("name"):
+            self.tunnel_urls[fields["name"]] = fields.get("url")
+        elif message == "stopped tunnel" and fields.get("name"):
+            self.tunnel_urls.pop(fields["name"], None)
+
+        if level in ERROR_LEVELS or (level is None and stream == "stderr"):
+            self.last_error = fields.get("err") or message or line
+            logger.warning(f"⚠️  ngrok agent: {self.last_error}")
+
+        if self.web_addr and self.session_established and not self._ready.is_set():
+            self.ready_at = time.time()
+            self._ready.set()
+
+    def is_ready(self) -> bool:
+        """Check if the agent reported itself ready and has not exited since."""
+        return (self._ready is not None and self._ready.is_set()
+                and not self._exited.is_set())
+
+    async def wait_ready(self, timeout: float) -> bool:
+        """
+        Wait until the agent reports it is ready.
+        Returns False if it exits first or does not get ready within timeout.
+        """
+        if self._ready is None:
+            return False
+        ready = asyncio.ensure_future(self._ready.wait())
+        exited = asyncio.ensure_future(self._exited.wait())
+        try:
+            await asyncio.wait({ready, exited}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            ready.cancel()
+            exited.cancel()
+        return self._ready.is_set()
+
+    async def wait_exited(self, timeout: float):
+        """Give the pumps a moment to read what an exiting agent wrote last."""
+        if self._exited is not None:
+            try:
+                await asyncio.wait_for(self._exited.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_tail(self, count: int = 5) -> str:
+        """Get the last lines as text, e.g. to explain why the agent did not start."""
+        return "\n".join(entry["line"] for entry in list(self._lines)[-count:])
+
+    def get_entries(self, limit: Optional[int] = None, errors_only: bool = False) -> List[Dict[str, Any]]:
+        """Get the buffered lines, oldest first."""
+        entries = list(self._lines)
+        if errors_only:
+            entries = [entry for entry in entries
+                       if entry["level"] in ERROR_LEVELS or (entry["level"] is None and entry["stream"] == "stderr")]
+        if limit is not None:
+            entries = entries[-limit:] if limit > 0 else []
+        return entries
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.is_ready(),
+            "web_addr": self.web_addr,
+            "session_established": self.session_established,
+            "tunnels": dict(self.tunnel_urls),
+            "last_error": self.last_error,
+            "started_at": self.started_at,
+            "ready_after_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "buffered_lines": len(self._lines),
+            "buffer_size": self._lines.maxlen
+        }
+
+    def _cancel_tasks(self):
+        for task in self._tasks:
+            if not task.done():
+                task.cancel()
+        self._tasks = []
+
+    async def stop(self):
+        """Stop draining, e.g. after the agent was terminated."""
+        tasks = self._tasks
+        self._cancel_tasks()
+        for task in tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
@@ -0,0 +1,146 @@
+import math
+import random
+import time
+import logging
+from collections import deque
+from typing import Optional, Dict, Any
+
+from services.metrics import HA_BREAKER_STATE
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+# Values of the breaker state gauge
+BREAKER_STATE_VALUES = {BREAKER_CLOSED: 0, BREAKER_HALF_OPEN: 1, BREAKER_OPEN: 2}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Home Assistant while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Home Assistant is unavailable, retry in {math.ceil(retry_after)}s")
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: a random delay up to base * 2^attempt, capped."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class CircuitBreaker:
+    """
+    Stops calling Home Assistant while it is failing or too slow.
+    The outcome of the last `window_size` calls is kept; once at least
+    `min_calls` were made and the share of failed or slow ones reaches
+    `failure_rate`, the breaker opens and calls fail fast. After
+    `open_seconds` it lets one trial call through (half-open): success
+    closes it again, failure reopens it.
+    """
+
+    def __init__(self, name: str, failure_rate: float = 0.5, slow_call_seconds: float = 5.0,
+                 window_size: int = 20, min_calls: int = 5, open_seconds: float = 30.0):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._outcomes = deque(maxlen=window_size)  # True for each failed or slow call
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.state = BREAKER_CLOSED
+        self.times_opened = 0
+        self.rejected_calls = 0
+        HA_BREAKER_STATE.set(BREAKER_STATE_VALUES[self.state], self.name)
+
+    def configure(self, failure_rate: float, slow_call_seconds: float, window_size: int,
+                  min_calls: int, open_seconds: float):
+        """Apply new thresholds, keeping the current state and recent outcomes."""
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        if window_size != self._outcomes.maxlen:
+            self._outcomes = deque(self._outcomes, maxlen=window_size)
+            self._failures = sum(self._outcomes)
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        self.state = state
+        HA_BREAKER_STATE.set(BREAKER_STATE_VALUES[state], self.name)
+
+    def _open(self, now: float):
+        self._set_state(BREAKER_OPEN)
+        self._opened_at = now
+        self._trial_in_flight = False
+        self.times_opened += 1
+        logger.warning(f"🔥 {self.name} circuit breaker opened, failing fast for {self.open_seconds:g}s")
+
+    def _close(self):
+        self._set_state(BREAKER_CLOSED)
+        self._opened_at = None
+        self._outcomes.clear()
+        self._failures = 0
+        logger.info(f"✅ {self.name} circuit breaker closed")
+
+    def before_call(self):
+        """Check that a call may go ahead, or raise CircuitOpenError."""
+        if self.state == BREAKER_CLOSED:
+            return
+
+        now = time.monotonic()
+        if self.state == BREAKER_OPEN:
+            remaining = self._opened_at + self.open_seconds - now
+            if remaining > 0:
+                self.rejected_calls += 1
+                raise CircuitOpenError(remaining)
+            self._set_state(BREAKER_HALF_OPEN)
+            logger.info(f"🔄 {self.name} circuit breaker half-open, trying one call")
+
+        # Half-open: only one trial call at a time, the rest keep failing fast
+        if self._trial_in_flight:
+            self.rejected_calls += 1
+            raise CircuitOpenError(1.0)
+        self._trial_in_flight = True
+
+    def after_call(self, healthy: Optional[bool], duration: float):
+        """
+        Record the outcome of a call let through by before_call.
+        healthy is None when the call was cancelled before it had an outcome.
+        """
+        if self.state == BREAKER_HALF_OPEN:
+            self._trial_in_flight = False
+            if healthy is None:
+                return
+            if healthy and duration < self.slow_call_seconds:
+                self._close()
+            else:
+                self._open(time.monotonic())
+            return
+        if healthy is None or self.state == BREAKER_OPEN:
+            return
+
+        failed = not healthy or duration >= self.slow_call_seconds
+        if len(self._outcomes) == self._outcomes.maxlen:
+            self._failures -= self._outcomes[0]
+        self._outcomes.append(failed)
+        self._failures += failed
+
+        if (len(self._outcomes) >= self.min_calls
+                and self._failures / len(self._outcomes) >= self.failure_rate):
+            self._open(time.monotonic())
+
+    def get_status(self) -> Dict[str, Any]:
+        retry_after = None
+        if self.state == BREAKER_OPEN:
+            retry_after = round(max(0.0, self._opened_at + self.open_seconds - time.monotonic()), 1)
+        return {
+            "state": self.state,
+            "failure_rate": round(self._failures / len(self._outcomes), 2) if self._outcomes else 0.0,
+            "calls_in_window": len(self._outcomes),
+            "retry_after": retry_after,
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected_calls
+        }
@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Optional, Callable, Awaitable, Dict, List, Any
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class ExpiryScheduler:
+    """
+    Fires a callback for each key exactly at its deadline.
+    Deadlines live in a min-heap on the monotonic clock, so
+    scheduling, cancelling and extending are O(log n) and the single
+    background task sleeps until the next deadline instead of polling.
+    Cancelled entries are dropped lazily when they reach the top of the heap.
+    """
+
+    def __init__(self, on_expire: Callable[[str], Awaitable[None]]):
+        self.on_expire = on_expire
+        self._heap: List[list] = []  # [deadline, sequence, key, active]
+        self._entries: Dict[str, list] = {}  # key -> live heap entry
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _now(self) -> float:
+        return time.monotonic()
+
+    def _wake(self):
+        """Wake the scheduler task so it recomputes how long to sleep."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def schedule(self, key: str, delay_seconds: float):
+        """Schedule key to expire after delay_seconds, replacing any existing deadline."""
+        if self._remove_entry(key):
+            self._compact()
+        entry = [self._now() + delay_seconds, next(self._counter), key, True]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+
+        # Only a new earliest deadline changes how long the task should sleep
+        if self._heap[0] is entry:
+            self._wake()
+
+    def cancel(self, key: str) -> bool:
+        """Cancel the deadline for key. Returns False if it was not scheduled."""
+        removed = self._remove_entry(key)
+        self._compact()
+        return removed
+
+    def extend(self, key: str, extra_seconds: float) -> Optional[float]:
+        """
+        Push the deadline for key back by extra_seconds.
+        Returns the seconds remaining until the new deadline, or None if key is not scheduled.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        remaining = max(entry[0] - self._now(), 0) + extra_seconds
+        self.schedule(key, remaining)
+        return remaining
+
+    def get_remaining(self, key: str) -> Optional[float]:
+        """Get the seconds left before key expires, or None if it is not scheduled."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return max(entry[0] - self._now(), 0)
+
+    def clear(self):
+        """Cancel every deadline."""
+        self._heap.clear()
+        self._entries.clear()
+        self._wake()
+
+    def _remove_entry(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry[3] = False
+        return True
+
+    def _compact(self):
+        """Rebuild the heap once cancelled entries outnumber live ones."""
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._entries):
+            self._heap = [entry for entry in self._heap if entry[3]]
+            heapq.heapify(self._heap)
+
+    def _pop_due(self) -> List[str]:
+        """Pop every live entry whose deadline has passed."""
+        now = self._now()
+        due = []
+        while self._heap and (not self._heap[0][3] or self._heap[0][0] <= now):
+            entry = heapq.heappop(self._heap)
+            if entry[3]:
+                del self._entries[entry[2]]
+                due.append(entry[2])
+        return due
+
+    def _seconds_until_next(self) -> Optional[float]:
+        while self._heap and not self._heap[0][3]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - self._now(), 0)
+
+    async def _run(self):
+        """Sleep until the next deadline, then fire every expired key."""
+        try:
+            while True:
+                self._wakeup.clear()
+                timeout = self._seconds_until_next()
+                if timeout is None or timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                        continue
+                    except asyncio.TimeoutError:
+                        pass
+
+                for key in self._pop_due():
+                    try:
+                        await self.on_expire(key)
+                    except Exception as e:
+                        logger.error(f"Error expiring {key}: {e}")
+        except asyncio.CancelledError:
+            logger.info("Expiry scheduler cancelled.")
+            raise
+
+    def start(self):
+        """Start the background scheduler task."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info("🔥 Expiry scheduler started.")
+
+    async def stop(self):
+        """Stop the background scheduler task."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            logger.info("🔥 Expiry scheduler stopped.")
+        self._task = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "running": self.is_running(),
+            "scheduled": len(self._entries),
+            "next_expiry_in": self._seconds_until_next() if self._heap else None
+        }
@@ -1,17 +1,38 @@
 import os
+import asyncio
+import time
 import requests
+import httpx
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
 from settings import get_settings
+from services.single_flight import SingleFlight
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError, backoff_delay
+from services.json_stream import JsonArrayStream
+from services.metrics import HA_REQUEST_SECONDS, SCRIPT_RUN_SECONDS
+from services.tracing import span
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Bytes read at a time when streaming large responses such as /api/states
+STREAM_CHUNK_SIZE = 64 * 1024
+
 class HomeAssistantClient:
     def __init__(self):
         settings = get_settings()
-        self.ha_token = os.getenv("HASSIO_TOKEN", default=settings.hassio_token)
-        self.ha_base_url = settings.ha_base_url
+        # Fails calls fast while Home Assistant is down instead of waiting for each timeout
+        self.breaker = CircuitBreaker("home_assistant")
+        # Only scripts known to the lookup get their own metric series; see set_script_lookup
+        self._is_known_script: Optional[Callable[[str], bool]] = None
+        self._apply_settings(settings)
+        
+        # Async client and concurrency limiter are created lazily on first use
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # Concurrent runs of the same script share one Home Assistant call
+        self._script_runs = SingleFlight(settings.script_dedup_window)
         
         # Validate that the token is available
         if not self.ha_token:
@@ -22,6 +43,45 @@ class HomeAssistantClient:
         
         logger.info(f"Home Assistant Base URL: {self.ha_base_url}")
 
+    def _apply_settings(self, settings):
+        self.ha_token = settings.hassio_token
+        self.ha_base_url = settings.ha_base_url
+        self.request_timeout = settings.ha_request_timeout
+        self.max_connections = settings.ha_max_connections
+        self.max_concurrency = settings.ha_max_concurrency
+        self.retry_attempts = settings.ha_retry_attempts
+        self.retry_backoff = settings.ha_retry_backoff
+        self.retry_max_backoff = settings.ha_retry_max_backoff
+        self.breaker.configure(
+            failure_rate=settings.ha_breaker_failure_rate,
+            slow_call_seconds=settings.ha_breaker_slow_call_seconds,
+            window_size=settings.ha_breaker_window,
+            min_calls=settings.ha_breaker_min_calls,
+            open_seconds=settings.ha_breaker_open_seconds
+        )
+        
+        # Headers are built once and shared by every request
+        self._headers = {
+            "Authorization": f"Bearer {self.ha_token}",
+            "Content-Type": "application/json"
+        }
+
+    async def reconfigure(self, settings):
+        """
+        Apply new settings without a restart.
+        New calls use a fresh connection pool; calls already in flight finish
+        on the old one, which is closed once they have had time to complete.
+        """
+        self._apply_settings(settings)
+        self._script_runs.window = settings.script_dedup_window
+        old_client, self._async_client = self._async_client, None
+        self._semaphore = None
+        if old_client is not None and not old_client.is_closed:
+            asyncio.get_running_loop().call_later(
+                self.request_timeout, lambda: asyncio.ensure_future(old_client.aclose())
+            )
+        logger.info(f"✅ Home Assistant client reconfigured (base URL: {self.ha_base_url})")
+
     def test_connection(self) -> bool:
         """
         Test connectivity to Home Assistant.
@@ -30,16 +90,11 @@ class HomeAssistantClient:
             logger.error("Cannot test connection: Home Assistant token not configured")
             return False
         
-        headers = {
-            "Authorization": f"Bearer {self.ha_token}",
-            "Content-Type": "application/json"
-        }
-        
         url = f"{self.ha_base_url}/"
         logger.info(f"Testing Home Assistant connectivity: {url}")
         
         try:
-            response = requests.get(url, headers=headers, timeout=10)
+            response = requests.get(url, headers=self._headers, timeout=self.request_timeout)
             response.raise_for_status()
             logger.info("✅ Home Assistant connectivity test successful")
             return True
@@ -54,24 +109,13 @@ class HomeAssistantClient:
         if not self.ha_token:
             raise Exception("Home Assistant token not configured")
         
-        headers = {
-            "Authorization": f"Bearer {self.ha_token}",
-            "Content-Type": "application/json"
-        }
-        
         payload = data or {}
         
         url = f"{self.ha_base_url}/services/{service}"
         logger.info(f"Calling Home Assistant API: {url}")
         logger.info(f"Payload: {payload}")
         
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Home Assistant API call failed: {e}")
-            raise Exception(f"Failed to call Home Assistant API: {e}")
+        return self._request_sync("POST", url, payload)
 
     def get_api(self, endpoint: str) -> dict:
         """
@@ -80,21 +124,226 @@ class HomeAssistantClient:
         if not self.ha_token:
             raise Exception("Home Assistant token not configured")
         
-        headers = {
-            "Authorization": f"Bearer {self.ha_token}",
-            "Content-Type": "application/json"
-        }
-        
         url = f"{self.ha_base_url}/{endpoint}"
         logger.info(f"Calling Home Assistant API: {url}")
         
+        return self._request_sync("GET", url)
+
+    def _get_attempts(self, method: str) -> int:
+        # Only idempotent reads are retried; retrying a service call could run a script twice
+        return 1 + self.retry_attempts if method == "GET" else 1
+
+    def _request_sync(self, method: str, url: str, payload: Optional[dict] = None,
+                      item_filter: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Perform a request with the blocking client, through the circuit breaker.
+        Failed GETs are retried with jittered backoff. With item_filter the
+        response must be a JSON array; it is parsed as it arrives and only
+        the items item_filter accepts are kept.
+        """
+        attempts = self._get_attempts(method)
+        for attempt in range(attempts):
+            self.breaker.before_call()
+            started = time.perf_counter()
+            healthy = None
+            try:
+                with requests.request(method, url, headers=self._headers, json=payload,
+                                      timeout=self.request_timeout, stream=item_filter is not None) as response:
+                    # Client errors mean Home Assistant answered; only server errors count against it
+                    healthy = response.status_code < 500
+                    response.raise_for_status()
+                    if item_filter is None:
+                        return response.json()
+                    return self._read_array(response.iter_content(STREAM_CHUNK_SIZE), item_filter)
+            except requests.exceptions.RequestException as e:
+                if healthy is None:
+                    healthy = False
+                if healthy or attempt + 1 >= attempts:
+                    logger.error(f"Home Assistant API call failed: {e}")
+                    raise Exception(f"Failed to call Home Assistant API: {e}")
+                delay = backoff_delay(attempt, self.retry_backoff, self.retry_max_backoff)
+                logger.warning(f"⚠️  Home Assistant API call failed ({e}), retrying in {delay:.2f}s")
+            finally:
+                self.breaker.after_call(healthy, time.perf_counter() - started)
+            time.sleep(delay)
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """
+        Get the shared async HTTP client, creating it on first use.
+        Connections to the supervisor are kept alive and reused across calls.
+        """
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(
+                headers=self._headers,
+                timeout=httpx.Timeout(self.request_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._async_client
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Get the semaphore bounding concurrent in-flight Home Assistant calls."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _request_async(self, method: str, url: str, payload: Optional[dict] = None,
+                             timeout: Optional[float] = None, endpoint: str = "other",
+                             use_breaker: bool = True,
+                             item_filter: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Perform a request against the Home Assistant API on the shared pool.
+        endpoint is the low-cardinality label its latency is recorded under.
+        Calls go through the circuit breaker unless use_breaker is False, and
+        failed GETs are retried with jittered backoff. With item_filter the
+        response is streamed as described in _request_sync.
+        """
+        if not self.ha_token:
+            raise Exception("Home Assistant token not configured")
+        
+        attempts = self._get_attempts(method) if use_breaker else 1
+        for attempt in range(attempts):
+            try:
+                return await self._request_once(method, url, payload, timeout, endpoint, use_breaker, item_filter)
+            except httpx.HTTPError as e:
+                retryable = not (isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500)
+                if not retryable or attempt + 1 >= attempts:
+                    logger.error(f"Home Assistant API call failed: {e!r}")
+                    raise Exception(f"Failed to call Home Assistant API: {e!r}")
+                delay = backoff_delay(attempt, self.retry_backoff, self.retry_max_backoff)
+                logger.warning(f"⚠️  Home Assistant API call failed ({e!r}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def _request_once(self, method: str, url: str, payload: Optional[dict],
+                            timeout: Optional[float], endpoint: str, use_breaker: bool,
+                            item_filter: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Perform a single attempt of a request, recording it with the circuit breaker."""
+        if use_breaker:
+            self.breaker.before_call()
+        client = self._get_async_client()
+        request_timeout = timeout if timeout is not None else self.request_timeout
+        
+        started = time.perf_counter()
+        outcome = "error"
+        healthy = None
         try:
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Home Assistant API call failed: {e}")
-            raise Exception(f"Failed to call Home Assistant API: {e}")
+            with span("ha_api"):
+                async with self._get_semaphore():
+                    if item_filter is None:
+                        response = await client.request(method, url, json=payload, timeout=request_timeout)
+                        # Client errors mean Home Assistant answered; only server errors count against it
+                        healthy = response.status_code < 500
+                        response.raise_for_status()
+                        result = response.json()
+                    else:
+                        # The body is read while the connection is held, so stay inside the limiter
+                        async with client.stream(method, url, json=payload, timeout=request_timeout) as response:
+                            healthy = response.status_code < 500
+                            response.raise_for_status()
+                            result = await self._read_array_async(response, item_filter)
+            outcome = "success"
+            return result
+        except httpx.HTTPError:
+            if healthy is None:
+                healthy = False
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            if use_breaker:
+                self.breaker.after_call(healthy, duration)
+            HA_REQUEST_SECONDS.observe(duration, method, endpoint, outcome)
+
+    @staticmethod
+    def _read_array(chunks, item_filter: Callable[[Any], bool]) -> List[Any]:
+        """Parse a JSON array from byte chunks, keeping only the items item_filter accepts."""
+        stream = JsonArrayStream()
+        kept = []
+        for chunk in chunks:
+            kept.extend(item for item in stream.feed(chunk) if item_filter(item))
+        stream.close()
+        return kept
+
+    @staticmethod
+    async def _read_array_async(response: httpx.Response, item_filter: Callable[[Any], bool]) -> List[Any]:
+        """Parse a streamed JSON array response, keeping only the items item_filter accepts."""
+        stream = JsonArrayStream()
+        kept = []
+        async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+            kept.extend(item for item in stream.feed(chunk) if item_filter(item))
+        stream.close()
+        return kept
+
+    async def call_api_async(self, service: str, data: Optional[dict] = None,
+                             timeout: Optional[float] = None) -> dict:
+        """
+        Make a call to the Home Assistant API to execute services (async version).
+        """
+        payload = data or {}
+        
+        url = f"{self.ha_base_url}/services/{service}"
+        logger.info(f"Calling Home Assistant API: {url}")
+        logger.info(f"Payload: {payload}")
+        
+        return await self._request_async("POST", url, payload=payload, timeout=timeout,
+                                         endpoint=f"services/{service}")
+
+    async def get_api_async(self, endpoint: str, timeout: Optional[float] = None) -> Any:
+        """
+        Make a GET call to the Home Assistant API (async version).
+        """
+        url = f"{self.ha_base_url}/{endpoint}"
+        logger.info(f"Calling Home Assistant API: {url}")
+        
+        # Label states/<entity_id> as one endpoint rather than one per entity
+        resource, _, entity_id = endpoint.partition('/')
+        label = f"{resource}/{{entity_id}}" if entity_id else resource
+        return await self._request_async("GET", url, timeout=timeout, endpoint=label)
+
+    async def get_api_items_async(self, endpoint: str, item_filter: Callable[[Any], bool],
+                                  timeout: Optional[float] = None) -> List[Any]:
+        """
+        GET a JSON array from the Home Assistant API, keeping only the items item_filter accepts.
+        The response is parsed as it arrives, so the rejected items are never all held in memory.
+        """
+        url = f"{self.ha_base_url}/{endpoint}"
+        logger.info(f"Calling Home Assistant API: {url}")
+        return await self._request_async("GET", url, timeout=timeout, endpoint=endpoint,
+                                         item_filter=item_filter)
+
+    async def ping_async(self, timeout: Optional[float] = None) -> Any:
+        """
+        Check that the Home Assistant API answers, without logging every call.
+        Pings bypass the circuit breaker so they see Home Assistant recover while it is open.
+        """
+        return await self._request_async("GET", f"{self.ha_base_url}/", timeout=timeout,
+                                         endpoint="ping", use_breaker=False)
+
+    async def aclose(self):
+        """
+        Close the shared async HTTP client and its pooled connections.
+        """
+        if self._async_client is not None and not self._async_client.is_closed:
+            await self._async_client.aclose()
+        self._async_client = None
+
+    @staticmethod
+    def is_script(state: dict) -> bool:
+        """Check if a Home Assistant state object belongs to a script."""
+        return isinstance(state, dict) and str(state.get('entity_id', '')).startswith('script.')
+
+    @staticmethod
+    def format_script(state: dict) -> Dict[str, Any]:
+        """
+        Convert a Home Assistant state object into the script format used by the API.
+        """
+        return {
+            'entity_id': state['entity_id'],
+            'name': state.get('attributes', {}).get('friendly_name', state['entity_id']),
+            'state': state.get('state'),
+            'attributes': state.get('attributes', {})
+        }
 
     def run_script(self, script_id: str) -> dict:
         """
@@ -109,8 +358,38 @@ class HomeAssistantClient:
     async def run_script_async(self, script_id: str) -> dict:
         """
         Execute a Home Assistant script by its entity ID (async version).
+        Triggers of the same script that arrive while a run is in flight share
+        that run and its result, as do those within SCRIPT_DEDUP_WINDOW after it
+        when the window is set.
         """
-        return self.run_script(script_id)
+        return await self._script_runs.run(script_id, lambda: self._run_script_once(script_id))
+
+    async def _run_script_once(self, script_id: str) -> dict:
+        logger.info(f"Executing Home Assistant script: {script_id}")
+        
+        payload = {"entity_id": script_id}
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await self.call_api_async("script/turn_on", payload)
+            outcome = "success"
+            return result
+        finally:
+            SCRIPT_RUN_SECONDS.observe(time.perf_counter() - started, self._script_label(script_id), outcome)
+
+    def set_script_lookup(self, is_known_script: Optional[Callable[[str], bool]]):
+        """Set the lookup deciding which script ids get their own metric label."""
+        self._is_known_script = is_known_script
+
+    def _script_label(self, script_id: str) -> str:
+        """
+        Metric label for a script.
+        Callers can pass any id, so ids outside the catalog are grouped as
+        "other" to keep the number of series bounded.
+        """
+        if self._is_known_script is not None and self._is_known_script(script_id):
+            return script_id
+        return "other"
 
     def script_exists(self, script_id: str) -> bool:
         """
@@ -128,27 +407,23 @@ class HomeAssistantClient:
         """
         Check if a script exists in Home Assistant (async version).
         """
-        return self.script_exists(script_id)
+        try:
+            response = await self.get_api_async(f"states/{script_id}")
+            return response.get('state') is not None
+        except Exception as e:
+            logger.error(f"Error checking if script {script_id} exists: {e}")
+            return False
 
     def get_scripts(self) -> List[Dict[str, Any]]:
         """
         Get all available scripts from Home Assistant.
         """
         try:
-            # Get all states and filter for scripts
-            states = self.get_api("states")
-            scripts = []
-            
-            for state in states:
-                if state.get('entity_id', '').startswith('script.'):
-                    scripts.append({
-                        'entity_id': state['entity_id'],
-                        'name': state.get('attributes', {}).get('friendly_name', state['entity_id']),
-                        'state': state.get('state'),
-                        'attributes': state.get('attributes', {})
-                    })
-            
-            return scripts
+            # Stream all states, keeping only the scripts
+            url = f"{self.ha_base_url}/states"
+            logger.info(f"Calling Home Assistant API: {url}")
+            states = self._request_sync("GET", url, item_filter=self.is_script)
+            return [self.format_script(state) for state in states]
         except Exception as e:
             logger.error(f"Error getting scripts: {e}")
             return []
@@ -157,7 +432,12 @@ class HomeAssistantClient:
         """
         Get all available scripts from Home Assistant (async version).
         """
-        return self.get_scripts()
+        try:
+            states = await self.get_api_items_async("states", self.is_script)
+            return [self.format_script(state) for state in states]
+        except Exception as e:
+            logger.error(f"Error getting scripts: {e}")
+            return []
 
     def get_script(self, script_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -168,12 +448,7 @@ class HomeAssistantClient:
             response = self.get_api(f"states/{script_id}")
             
             if response.get('state') is not None:
-                return {
-                    'entity_id': response['entity_id'],
-                    'name': response.get('attributes', {}).get('friendly_name', response['entity_id']),
-                    'state': response.get('state'),
-                    'attributes': response.get('attributes', {})
-                }
+                return self.format_script(response)
             return None
         except Exception as e:
             logger.error(f"Error getting script {script_id}: {e}")
@@ -183,7 +458,15 @@ class HomeAssistantClient:
         """
         Get information about a specific script (async version).
         """
-        return self.get_script(script_id)
+        try:
+            response = await self.get_api_async(f"states/{script_id}")
+            
+            if response.get('state') is not None:
+                return self.format_script(response)
+            return None
+        except Exception as e:
+            logger.error(f"Error getting script {script_id}: {e}")
+            return None
 
     def is_configured(self) -> bool:
         """
@@ -195,4 +478,4 @@ class HomeAssistantClient:
         """
         Get the Home Assistant base URL.
         """
-        return self.ha_base_url 
\ No newline at end of file
+        return self.ha_base_url
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Dict, Any
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class HomeAssistantProber:
+    """
+    Checks in the background that the Home Assistant API answers.
+    The last result is cached with its latency and time, so health checks
+    read it instead of calling Home Assistant themselves.
+    """
+
+    def __init__(self, ha_client, interval: float = 15.0, timeout: float = 5.0):
+        self.ha_client = ha_client
+        self.interval = interval
+        self.timeout = timeout
+        self.connected: Optional[bool] = None  # None until the first probe finishes
+        self.latency_ms: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.consecutive_failures = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def probe(self) -> bool:
+        """Call the Home Assistant API once and cache the result."""
+        started = time.perf_counter()
+        try:
+            await self.ha_client.ping_async(timeout=self.timeout)
+            connected, error = True, None
+        except Exception as e:
+            connected, error = False, str(e)
+        self.latency_ms = (time.perf_counter() - started) * 1000
+        self.checked_at = time.time()
+
+        if connected:
+            if self.connected is False:
+                logger.info(f"✅ Home Assistant reachable again ({self.latency_ms:.0f} ms)")
+            self.consecutive_failures = 0
+        else:
+            if self.connected is not False:
+                logger.warning(f"⚠️  Home Assistant unreachable: {error}")
+            self.consecutive_failures += 1
+        self.connected = connected
+        self.error = error
+        return connected
+
+    async def _run(self):
+        try:
+            while True:
+                if self.ha_client.is_configured():
+                    await self.probe()
+                await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            logger.info("Home Assistant prober cancelled.")
+            raise
+
+    def start(self):
+        """Start probing in the background."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"🔥 Home Assistant prober started (every {self.interval:g}s).")
+
+    async def stop(self):
+        """Stop probing."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            logger.info("🔥 Home Assistant prober stopped.")
+        self._task = None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "connected": self.connected,
+            "latency_ms": round(self.latency_ms, 2) if self.latency_ms is not None else None,
+            "checked_at": self.checked_at,
+            "age_seconds": round(time.time() - self.checked_at, 1) if self.checked_at is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "error": self.error
+        }
@@ -0,0 +1,78 @@
+import codecs
+import json
+import re
+from typing import Any, List
+
+_WHITESPACE = re.compile(r'\s*')
+# Characters that can follow a complete number inside an array
+_NUMBER_END = frozenset(' \t\r\n,]')
+
+# Parser states
+_START = 0        # expecting '['
+_FIRST = 1        # after '[': first item or ']'
+_ITEM = 2         # after ',': an item
+_SEPARATOR = 3    # after an item: ',' or ']'
+_DONE = 4         # after ']'
+
+class JsonArrayStream:
+    """
+    Incremental parser for a JSON array received in chunks.
+    feed() returns the items completed by each chunk, so only the item
+    still being received is buffered, never the whole document. Each item
+    is decoded with the standard json module.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._state = _START
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """Add a chunk of the document and return the items it completed."""
+        buffer = self._buffer + self._text.decode(chunk)
+        items = []
+        pos = 0
+        end_of_buffer = len(buffer)
+
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos >= end_of_buffer:
+                break
+            char = buffer[pos]
+
+            if self._state == _START:
+                if char != '[':
+                    raise ValueError(f"Expected a JSON array, got {char!r}")
+                self._state = _FIRST
+                pos += 1
+            elif self._state == _DONE:
+                raise ValueError("Unexpected data after the JSON array")
+            elif char == ']' and self._state in (_FIRST, _SEPARATOR):
+                self._state = _DONE
+                pos += 1
+            elif self._state == _SEPARATOR:
+                if char != ',':
+                    raise ValueError(f"Expected ',' or ']' in JSON array, got {char!r}")
+                self._state = _ITEM
+                pos += 1
+            else:
+                try:
+                    item, end = self._decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break  # The item is not complete yet
+                if end >= end_of_buffer or (
+                        isinstance(item, (int, float)) and buffer[end] not in _NUMBER_END):
+                    break  # A number could still continue in the next chunk
+                items.append(item)
+                self._state = _SEPARATOR
+                pos = end
+
+        self._buffer = buffer[pos:]
+        return items
+
+    def close(self):
+        """Check the document ended with the end of the array."""
+        remaining = (self._buffer + self._text.decode(b"", final=True)).strip()
+        if self._state != _DONE or remaining:
+            raise ValueError("Truncated or invalid JSON array")
@@ -0,0 +1,145 @@
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterable, Iterator
+
+from services.expiry_scheduler import ExpiryScheduler
+
+class LinkRecord:
+    """
+    One published link.
+    __slots__ keeps every record the same small size, with no per-instance dict.
+    script_id and unique_hash are indexed by LinkStore and must not be changed
+    in place; the other fields can be.
+    """
+
+    __slots__ = ('script_id', 'unique_hash', 'tunnel_url', 'complete_url', 'created_at', 'expires_at')
+
+    def __init__(self, script_id: str, unique_hash: str, tunnel_url: Optional[str] = None,
+                 complete_url: Optional[str] = None, created_at: Optional[float] = None,
+                 expires_at: Optional[float] = None):
+        self.script_id = script_id
+        self.unique_hash = unique_hash
+        self.tunnel_url = tunnel_url
+        self.complete_url = complete_url
+        self.created_at = created_at
+        self.expires_at = expires_at  # Wall-clock timestamp, None for links that never expire
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "LinkRecord":
+        """Build a link from a registry row."""
+        return cls(**{name: record.get(name) for name in cls.__slots__})
+
+    def to_record(self) -> Dict[str, Any]:
+        """Get the registry row for this link."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @property
+    def expiration_time(self) -> Optional[datetime]:
+        """Expiry as a naive UTC datetime, as the API returns it."""
+        if self.expires_at is None:
+            return None
+        return datetime.utcfromtimestamp(self.expires_at)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the link as returned by the tunnels API."""
+        return {
+            'script_id': self.script_id,
+            'tunnel_url': self.tunnel_url,
+            'complete_url': self.complete_url,
+            'created_at': self.created_at,
+            'expiration_time': self.expiration_time
+        }
+
+    def __repr__(self) -> str:
+        return f"LinkRecord({self.script_id!r}, {self.unique_hash!r}, expires_at={self.expires_at!r})"
+
+class LinkStore:
+    """
+    Published links, indexed by script, by hash and by expiry.
+    The expiry index is the ExpiryScheduler, keyed by script_id. Every change
+    updates all three indexes in one synchronous step, with any validation
+    done first, so a lookup never sees a hash without its link or a link
+    without its deadline. Lookups by script and by hash are dict lookups.
+    """
+
+    def __init__(self, expiry_index: ExpiryScheduler):
+        self._by_script: Dict[str, LinkRecord] = {}
+        self._by_hash: Dict[str, LinkRecord] = {}
+        self._expiry = expiry_index
+
+    def __len__(self) -> int:
+        return len(self._by_script)
+
+    def __contains__(self, script_id: str) -> bool:
+        return script_id in self._by_script
+
+    def __iter__(self) -> Iterator[LinkRecord]:
+        return iter(list(self._by_script.values()))
+
+    def get(self, script_id: str) -> Optional[LinkRecord]:
+        """Get the link for a script."""
+        return self._by_script.get(script_id)
+
+    def get_by_hash(self, unique_hash: str) -> Optional[LinkRecord]:
+        """Get the link a hash resolves to."""
+        return self._by_hash.get(unique_hash)
+
+    def has_hash(self, unique_hash: str) -> bool:
+        return unique_hash in self._by_hash
+
+    def _index_expiry(self, record: LinkRecord):
+        if record.expires_at is None:
+            self._expiry.cancel(record.script_id)
+        else:
+            self._expiry.schedule(record.script_id, record.expires_at - time.time())
+
+    def put(self, record: LinkRecord):
+        """Add a link, replacing the script's previous link and its hash."""
+        owner = self._by_hash.get(record.unique_hash)
+        if owner is not None and owner.script_id != record.script_id:
+            raise ValueError(f"Hash {record.unique_hash} is already used by {owner.script_id}")
+
+        previous = self._by_script.get(record.script_id)
+        if previous is not None and previous.unique_hash != record.unique_hash:
+            del self._by_hash[previous.unique_hash]
+        self._by_script[record.script_id] = record
+        self._by_hash[record.unique_hash] = record
+        self._index_expiry(record)
+
+    def set_expiry(self, script_id: str, expires_at: Optional[float]) -> Optional[LinkRecord]:
+        """Change when a link expires. Returns the link, or None if there is none for the script."""
+        record = self._by_script.get(script_id)
+        if record is None:
+            return None
+        record.expires_at = expires_at
+        self._index_expiry(record)
+        return record
+
+    def remove(self, script_id: str) -> Optional[LinkRecord]:
+        """Remove a script's link. Returns the removed link, or None if there was none."""
+        record = self._by_script.pop(script_id, None)
+        if record is None:
+            return None
+        del self._by_hash[record.unique_hash]
+        self._expiry.cancel(script_id)
+        return record
+
+    def clear(self):
+        """Remove every link."""
+        self._by_script.clear()
+        self._by_hash.clear()
+        self._expiry.clear()
+
+    def replace_all(self, records: Iterable[LinkRecord]):
+        """Replace every link at once, e.g. with the ones another worker stored."""
+        by_script = {record.script_id: record for record in records}
+        by_hash = {record.unique_hash: record for record in by_script.values()}
+        if len(by_hash) != len(by_script):
+            raise ValueError("Several links share the same hash")
+
+        self._by_script = by_script
+        self._by_hash = by_hash
+        self._expiry.clear()
+        for record in by_script.values():
+            if record.expires_at is not None:
+                self._expiry.schedule(record.script_id, record.expires_at - time.time())
@@ -0,0 +1,197 @@
+import asyncio
+import contextlib
+import logging
+from typing import Optional
+
+import httpx
+import uvicorn
+
+from settings import get_settings
+from services.tunnel_backend import TunnelBackend, WARM_UP_COLD
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Only the public endpoints of published links are reachable through the proxy
+PROXIED_PREFIXES = ("/run/", "/jobs/")
+
+# Headers that describe one hop and must not be copied to the next
+HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host", "content-length", "content-encoding"
+}
+
+SERVER_START_TIMEOUT = 10
+# Added to HA_REQUEST_TIMEOUT for the add-on's own work around the Home Assistant call
+PROXY_TIMEOUT_MARGIN = 5.0
+
+class _ProxyServer(uvicorn.Server):
+    """uvicorn server that leaves signal handling to the add-on's own server."""
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+class LocalProxyBackend(TunnelBackend):
+    """
+    Tunnel backend for the local network, with no external agent.
+    A small reverse proxy runs inside the add-on on its own port and forwards
+    only the published-link endpoints to the app, so the rest of the API
+    stays behind Home Assistant ingress.
+    """
+
+    name = "local"
+
+    def __init__(self):
+        super().__init__()
+        settings = get_settings()
+        self.host = settings.local_proxy_host
+        self.proxy_port = settings.local_proxy_port
+        self.public_url = (settings.local_public_url or f"http://homeassistant.local:{self.proxy_port}").rstrip('/')
+        self.request_timeout = settings.ha_request_timeout + PROXY_TIMEOUT_MARGIN
+        self._target_port = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._server: Optional[_ProxyServer] = None
+        self._server_task: Optional[asyncio.Task] = None
+        self._start_lock = asyncio.Lock()
+        logger.info(f"Local proxy configured on {self.host}:{self.proxy_port}, public URL: {self.public_url}")
+
+    async def reconfigure(self, settings):
+        """Apply a new public URL to links created from now on, and the new request timeout."""
+        await super().reconfigure(settings)
+        self.public_url = (settings.local_public_url or f"http://homeassistant.local:{self.proxy_port}").rstrip('/')
+        self.request_timeout = settings.ha_request_timeout + PROXY_TIMEOUT_MARGIN
+
+    def is_configured(self) -> bool:
+        """The local proxy needs no credentials."""
+        return True
+
+    def is_running(self) -> bool:
+        return self._server_task is not None and not self._server_task.done()
+
+    async def start_tunnel(self, port) -> str:
+        """Start the reverse proxy in front of the given local port if needed and return its public URL."""
+        async with self._start_lock:
+            if self.is_running() and self._target_port == port:
+                return self.public_url
+            if not self.claim_ownership():
+                # Another worker serves the proxy; the links it forwards reach any worker
+                return self.public_url
+            await self._stop_server()
+
+            self._target_port = port
+            self._client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}")
+            config = uvicorn.Config(self._proxy, host=self.host, port=self.proxy_port, interface="asgi3", lifespan="off", log_level="warning")
+            self._server = _ProxyServer(config)
+            self._server_task = asyncio.create_task(self._server.serve())
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + SERVER_START_TIMEOUT
+            while not self._server.started:
+                if self._server_task.done() or loop.time() > deadline:
+                    await self._stop_server()
+                    raise Exception(f"Local proxy failed to start on {self.host}:{self.proxy_port}")
+                await asyncio.sleep(0.05)
+
+            logger.info(f"✅ Local proxy listening on {self.host}:{self.proxy_port}")
+            return self.public_url
+
+    async def stop_tunnel(self) -> bool:
+        """
+        Stop the reverse proxy once no worker has links on it.
+        Only the worker that serves the proxy stops it; the others just forget it.
+        """
+        self.warm_up_state = WARM_UP_COLD
+        if not self.is_owner():
+            return True
+        # Another worker may have published a link since this one last looked
+        await self._sync()
+        if self.links:
+            logger.info("Links are still active, keeping the local proxy running.")
+            return True
+        return await self.shutdown()
+
+    async def shutdown(self) -> bool:
+        """Stop the reverse proxy, whatever links are left."""
+        try:
+            async with self._start_lock:
+                await self._stop_server()
+            self.warm_up_state = WARM_UP_COLD
+            return True
+        except Exception as e:
+            logger.error(f"Failed to stop local proxy: {e}")
+            return False
+
+    async def _stop_server(self):
+        if self._server is not None:
+            self._server.should_exit = True
+        if self._server_task is not None:
+            try:
+                await asyncio.wait_for(self._server_task, timeout=SERVER_START_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self._server_task.cancel()
+            except Exception as e:
+                logger.error(f"Local proxy stopped with an error: {e}")
+            logger.info("Local proxy stopped.")
+        if self._client is not None:
+            await self._client.aclose()
+        self._server = None
+        self._server_task = None
+        self._client = None
+
+    async def _proxy(self, scope, receive, send):
+        """ASGI app forwarding published-link requests to the add-on."""
+        if scope['type'] != 'http':
+            return
+
+        path = scope['path']
+        if not path.startswith(PROXIED_PREFIXES):
+            await self._respond(send, 404, b'{"detail":"Not Found"}', [(b'content-type', b'application/json')])
+            return
+
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        headers = [(k, v) for k, v in scope['headers'] if k.decode('latin-1').lower() not in HOP_HEADERS]
+        client = scope.get('client')
+        if client:
+            # The app trusts X-Forwarded-For from loopback peers, which the proxy is
+            headers = [(k, v) for k, v in headers if k.lower() != b'x-forwarded-for']
+            headers.append((b'x-forwarded-for', client[0].encode('latin-1')))
+
+        url = path
+        if scope.get('query_string'):
+            url += '?' + scope['query_string'].decode('latin-1')
+
+        try:
+            response = await self._client.request(scope['method'], url, headers=headers, content=body, timeout=self.request_timeout)
+        except httpx.TimeoutException:
+            logger.error(f"⌛ Local proxy gave up on {path} after {self.request_timeout:g}s")
+            await self._respond(send, 504, b'{"detail":"Gateway Timeout"}', [(b'content-type', b'application/json')])
+            return
+        except Exception as e:
+            logger.error(f"Local proxy failed to reach the add-on: {e!r}")
+            await self._respond(send, 502, b'{"detail":"Bad Gateway"}', [(b'content-type', b'application/json')])
+            return
+
+        response_headers = [
+            (k.encode('latin-1'), v.encode('latin-1'))
+            for k, v in response.headers.multi_items()
+            if k.lower() not in HOP_HEADERS
+        ]
+        await self._respond(send, response.status_code, response.content, response_headers)
+
+    @staticmethod
+    async def _respond(send, status: int, body: bytes, headers):
+        headers = list(headers) + [(b'content-length', str(len(body)).encode('latin-1'))]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def aclose(self):
+        """Stop the proxy and flush the registry."""
+        await self.shutdown()
+        await super().aclose()
@@ -0,0 +1,171 @@
+import bisect
+import math
+from typing import Dict, List, Tuple, Sequence
+
+# Latency buckets in seconds, from local calls up to the Home Assistant request timeout
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    """
+    Base class for metrics rendered in the Prometheus text format.
+    Updates are plain dict and list operations on the event loop thread,
+    so recording a value takes no locks.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+class Counter(Metric):
+    """Monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in sorted(self._values.items())]
+
+class Gauge(Metric):
+    """Value that can go up and down, optionally split by labels."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in sorted(self._values.items())]
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in fixed buckets.
+    Each observation increments a single bucket; the cumulative counts
+    Prometheus expects are only computed when the metrics are scraped.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts, sum, count]
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def get_count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Collection of metrics exposed together on /metrics."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+HA_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "publish_scripts_ha_request_seconds",
+    "Latency of Home Assistant API calls by endpoint.",
+    ("method", "endpoint", "outcome")
+))
+SCRIPT_RUN_SECONDS = REGISTRY.register(Histogram(
+    "publish_scripts_script_run_seconds",
+    "Execution time of Home Assistant scripts.",
+    ("script_id", "outcome")
+))
+RUN_REQUESTS_TOTAL = REGISTRY.register(Counter(
+    "publish_scripts_run_requests_total",
+    "Requests to /run/{unique_hash} by response status.",
+    ("status",)
+))
+ACTIVE_LINKS = REGISTRY.register(Gauge(
+    "publish_scripts_active_links",
+    "Published links currently active."
+))
+TUNNEL_BACKEND_RUNNING = REGISTRY.register(Gauge(
+    "publish_scripts_tunnel_backend_running",
+    "Whether the process or server carrying the tunnel is running (1) or not (0).",
+    ["backend"]
+))
+TUNNEL_READY_SECONDS = REGISTRY.register(Gauge(
+    "publish_scripts_tunnel_ready_seconds",
+    "Time it took the last ngrok tunnel start to return a public URL."
+))
+HA_BREAKER_STATE = REGISTRY.register(Gauge(
+    "publish_scripts_ha_breaker_state",
+    "State of the circuit breaker around Home Assistant calls: 0 closed, 1 half-open, 2 open.",
+    ["name"]
+))
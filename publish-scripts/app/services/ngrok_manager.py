@@ -1,25 +1,53 @@
-import subprocess
-import time
-import requests
+import httpx
 import logging
 import asyncio
-from datetime import datetime, timedelta
+import fcntl
+import os
+import shlex
+import signal
+import time
 from settings import get_settings
-import secrets
+from services.tunnel_backend import TunnelBackend, WARM_UP_COLD
+from services.metrics import TUNNEL_READY_SECONDS
+from services.agent_logs import AgentLogPump
 from typing import Optional
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-class NgrokManager:
+# Name of the agent tunnel shared by all published links
+TUNNEL_NAME = "publish-scripts"
+
+# How long to wait for a freshly started agent, ours or the owning worker's
+AGENT_START_TIMEOUT = 30
+# How often a worker waiting for the agent start lock checks it again
+START_LOCK_POLL_INTERVAL = 0.1
+
+# Arguments every agent spawned by the add-on runs with, used to recognize a recorded PID
+AGENT_ARGS = ['start', '--none', '--log=stdout', '--log-format=logfmt']
+
+class NgrokManager(TunnelBackend):
+    """Tunnel backend that publishes links through an ngrok agent."""
+
+    name = "ngrok"
+
     def __init__(self):
+        super().__init__()
         settings = get_settings()
         self.ngrok_token = settings.ngrok_auth_token
-        self.active_tunnels = {}  # Store active tunnels by script_id
-        self.hash_to_script = {}  # Map unique hash to script_id
+        self.ngrok_bin = settings.ngrok_bin
+        self.api_url = settings.ngrok_api_url.rstrip('/')
+        self.tunnel_name = TUNNEL_NAME
         self.ngrok_process = None
-        self.cleanup_task = None # To hold the cleanup task
-        self._warmed_up = False  # Track if ngrok has been warmed up
+        self._adopted = False  # Using an agent started by another worker or a previous run
+        self._start_lock: Optional[asyncio.Lock] = None
+        # Held by the owning worker while its agent starts, so other workers can wait on it
+        self._agent_start_lock_path = os.path.join(os.path.dirname(self._owner_lock_path), "ngrok-start.lock")
+        # PID of the agent the add-on started, so a leftover one can be stopped without touching other processes
+        self._agent_pid_path = os.path.join(os.path.dirname(self._owner_lock_path), "ngrok-agent.pid")
+        self._api_client: Optional[httpx.AsyncClient] = None
+        # Drains the agent's output and tells when it is ready
+        self.agent_logs = AgentLogPump(settings.agent_log_buffer_size)
         
         # Log ngrok token status (don't raise exception for missing token)
         if not self.ngrok_token:
@@ -30,359 +58,385 @@ class NgrokManager:
             logger.info(f"✅ ngrok Token (first 5 chars): {self.ngrok_token[:5]}...")
         
         logger.info(f"ngrok Token configured: {bool(self.ngrok_token)}")
-        # Don't start cleanup task automatically - only when needed
 
-    def warm_up_ngrok(self, port):
+    async def reconfigure(self, settings):
         """
-        Pre-initialize ngrok to avoid first-time startup delays.
-        This starts ngrok in the background and waits for it to be ready.
+        Apply a new token, agent command or agent API URL.
+        A running agent keeps serving the live links; the new token and
+        command are used the next time the agent starts.
         """
-        if self._warmed_up or not self.ngrok_token:
-            return True
-            
-        try:
-            logger.info("🔥 Warming up ngrok for faster first tunnel creation...")
-            
-            # Start ngrok in background
-            cmd = ['ngrok', 'http', str(port), '--log=stdout']
-            if self.ngrok_token:
-                cmd.extend(['--authtoken', self.ngrok_token])
-            
-            self.ngrok_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            # Wait for ngrok to be ready with retry logic
-            max_retries = 8
-            retry_delay = 1
-            
-            for attempt in range(max_retries):
-                logger.info(f"Warming up ngrok (attempt {attempt + 1}/{max_retries})...")
-                time.sleep(retry_delay)
-                
-                # Check if process is still running
-                if self.ngrok_process.poll() is not None:
-                    stderr_output = ""
-                    if self.ngrok_process.stderr:
-                        stderr_output = self.ngrok_process.stderr.read()
-                    logger.error(f"ngrok warm-up failed. stderr: {stderr_output}")
-                    return False
-                
-                # Try to get the URL to confirm ngrok is ready
-                url = self.get_existing_tunnel_url()
-                if url:
-                    logger.info(f"✅ ngrok warmed up successfully: {url}")
-                    self._warmed_up = True
-                    return True
-                
-                # Increase delay for next attempt
-                retry_delay = min(retry_delay * 1.2, 4)
-                
-                if attempt < max_retries - 1:
-                    logger.info(f"ngrok not ready yet, retrying in {retry_delay:.1f} seconds...")
-            
-            # If warm-up fails, clean up and return False
-            logger.warning("❌ ngrok warm-up failed after all attempts")
-            if self.ngrok_process:
-                self.ngrok_process.terminate()
-                self.ngrok_process = None
-            return False
-            
-        except Exception as e:
-            logger.error(f"Error during ngrok warm-up: {e}")
-            if self.ngrok_process:
-                self.ngrok_process.terminate()
-                self.ngrok_process = None
-            return False
+        await super().reconfigure(settings)
+        self.ngrok_token = settings.ngrok_auth_token
+        self.ngrok_bin = settings.ngrok_bin
+        self.agent_logs.resize(settings.agent_log_buffer_size)
+        api_url = settings.ngrok_api_url.rstrip('/')
+        if api_url != self.api_url:
+            self.api_url = api_url
+            if self._api_client is not None and not self._api_client.is_closed:
+                await self._api_client.aclose()
+            self._api_client = None
+        logger.info(f"ngrok Token configured: {bool(self.ngrok_token)}")
 
-    def start_cleanup_task(self):
-        """Start the background task to clean up expired tunnels."""
-        # Only start if there are tunnels with expiration times
-        has_expiring_tunnels = any(
-            'expiration_time' in tunnel_info 
-            for tunnel_info in self.active_tunnels.values()
+    async def _spawn_ngrok(self, token=None):
+        """
+        Start the ngrok agent as an asyncio subprocess.
+        The agent starts without tunnels; they are added through its local API.
+        """
+        cmd = shlex.split(self.ngrok_bin) + AGENT_ARGS
+        env = dict(os.environ)
+        if token:
+            # Passed through the environment so the token does not show up in the process list
+            env['NGROK_AUTHTOKEN'] = token
+        
+        self.ngrok_process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env
         )
+        # Both pipes are read for as long as the agent runs, so it never blocks on a full pipe
+        self.agent_logs.start(self.ngrok_process)
+        self._adopted = False
+        try:
+            with open(self._agent_pid_path, "w") as pid_file:
+                pid_file.write(str(self.ngrok_process.pid))
+        except OSError as e:
+            logger.warning(f"⚠️  Could not record the ngrok agent PID: {e}")
+
+    async def _terminate_process(self):
+        """Terminate the ngrok process we own and wait for it to exit."""
+        process = self.ngrok_process
+        self.ngrok_process = None
+        if process is None:
+            return
+        self._forget_agent_pid(process.pid)
+        if process.returncode is not None:
+            return
         
-        if has_expiring_tunnels and (self.cleanup_task is None or self.cleanup_task.done()):
-            try:
-                self.cleanup_task = asyncio.create_task(self._cleanup_expired_tunnels())
-                logger.info("🔥 Tunnel cleanup task started.")
-            except Exception as e:
-                logger.error(f"Failed to start cleanup task: {e}")
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning("ngrok did not exit after terminate, killing it.")
+            process.kill()
+            await process.wait()
+        await self.agent_logs.wait_exited(timeout=1)
+        await self.agent_logs.stop()
 
-    async def _cleanup_expired_tunnels(self):
-        """Periodically check for and remove expired tunnels."""
+    def _forget_agent_pid(self, pid: int):
+        """Remove the recorded agent PID if it is the given one."""
         try:
-            while True:
-                await asyncio.sleep(60) # Check every 60 seconds
-                now = datetime.utcnow()
-                expired_scripts = []
-                
-                # Using list() to avoid issues with modifying dict during iteration
-                for script_id, tunnel_info in list(self.active_tunnels.items()):
-                    if 'expiration_time' in tunnel_info and now > tunnel_info['expiration_time']:
-                        expired_scripts.append(script_id)
-                
-                if expired_scripts:
-                    logger.info(f"⌛ Found {len(expired_scripts)} expired tunnels: {', '.join(expired_scripts)}")
-                    for script_id in expired_scripts:
-                        self.remove_tunnel(script_id)
-                    
-                    # If no tunnels are left, stop the main ngrok process
-                    if not self.active_tunnels:
-                        logger.info("All tunnels expired or removed, stopping ngrok process.")
-                        self.stop_tunnel()
-                        break  # Exit the loop since no more tunnels
-        except asyncio.CancelledError:
-            logger.info("Cleanup task cancelled.")
-        except Exception as e:
-            logger.error(f"Error in cleanup task: {e}")
+            with open(self._agent_pid_path) as pid_file:
+                if pid_file.read().strip() != str(pid):
+                    return
+            os.remove(self._agent_pid_path)
+        except OSError:
+            pass
+
+    async def _stop_recorded_agent(self):
+        """
+        Stop an agent the add-on started earlier that no longer answers.
+        Only the recorded PID is signalled, and only if it still runs with
+        our agent arguments, so unrelated processes are never touched.
+        """
+        try:
+            with open(self._agent_pid_path) as pid_file:
+                pid = int(pid_file.read().strip())
+        except (OSError, ValueError):
+            return
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as cmdline_file:
+                cmdline = cmdline_file.read().decode(errors='replace').split('\0')
+        except OSError:
+            cmdline = []
+        if not set(AGENT_ARGS).issubset(cmdline):
+            # Gone already, or the PID now belongs to something else
+            self._forget_agent_pid(pid)
+            return
+
+        logger.info(f"Stopping ngrok agent {pid} left over from a previous run")
+        try:
+            os.kill(pid, signal.SIGTERM)
+            for _ in range(50):
+                await asyncio.sleep(0.1)
+                os.kill(pid, 0)
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        except PermissionError as e:
+            logger.warning(f"⚠️  Could not stop ngrok agent {pid}: {e}")
+        self._forget_agent_pid(pid)
 
-    def stop_cleanup_task(self):
-        """Stop the background cleanup task."""
-        if self.cleanup_task and not self.cleanup_task.done():
-            self.cleanup_task.cancel()
-            logger.info("🔥 Tunnel cleanup task stopped.")
+    def _is_process_running(self) -> bool:
+        """Check if the ngrok process we own is still running."""
+        return self.ngrok_process is not None and self.ngrok_process.returncode is None
+
+    def is_agent_running(self) -> bool:
+        """Check if the ngrok agent started by the add-on is running."""
+        return self._is_process_running()
+
+    def is_running(self) -> bool:
+        return self.is_agent_running()
+
+    async def start_tunnel(self, port) -> str:
+        return await self.start_tunnel_subprocess(port, self.ngrok_token)
+
+    async def shutdown(self) -> bool:
+        return await self.shutdown_agent()
 
     def is_configured(self) -> bool:
         """Check if ngrok is properly configured."""
         return bool(self.ngrok_token)
 
-    def get_existing_tunnel_url(self):
-        """Check for an existing tunnel URL from the ngrok API."""
+    def _get_api_client(self) -> httpx.AsyncClient:
+        """Get the HTTP client used to talk to the local ngrok agent API."""
+        if self._api_client is None or self._api_client.is_closed:
+            self._api_client = httpx.AsyncClient(base_url=self.api_url, timeout=2)
+        return self._api_client
+
+    async def _is_agent_ready(self) -> bool:
+        """Check once if an ngrok agent API is answering, to adopt an agent we did not start."""
         try:
-            response = requests.get('http://localhost:4040/api/tunnels', timeout=2)
-            if response.status_code == 200:
-                tunnels = response.json().get('tunnels', [])
-                if tunnels:
-                    return tunnels[0].get('public_url')
-        except requests.ConnectionError:
-            logger.info("Ngrok API not available. Assuming no active tunnel.")
-        except Exception as e:
-            logger.error(f"Error checking ngrok API: {e}")
-        return None
+            response = await self._get_api_client().get("/tunnels")
+            return response.status_code == 200
+        except httpx.HTTPError:
+            return False
 
-    def start_tunnel_subprocess(self, port, token=None):
+    async def _wait_for_agent(self, timeout: float) -> bool:
         """
-        Start ngrok tunnel using subprocess (command line) if not already running.
-        This is more reliable than the Python SDK.
+        Wait for a freshly started agent to be ready.
+        Readiness comes from the agent's own log events, so its API is not polled.
         """
-        # If process exists and is running, try to get its URL
-        if self.ngrok_process and self.ngrok_process.poll() is None:
-            logger.info("ngrok process is already running.")
-            url = self.get_existing_tunnel_url()
-            if url:
-                return url
-            logger.warning("ngrok process running, but couldn't get URL. Will attempt to restart.")
-            
-        # If ngrok was warmed up, try to use the existing process
-        if self._warmed_up and self.ngrok_process and self.ngrok_process.poll() is None:
-            url = self.get_existing_tunnel_url()
-            if url:
-                logger.info("✅ Using warmed-up ngrok process")
-                return url
+        return await self.agent_logs.wait_ready(timeout)
+
+    async def _ensure_agent(self, token=None):
+        """
+        Make sure the long-lived ngrok agent is running, starting it if needed.
+        Our own agent is ready once its log says so. An agent that is already
+        answering on the API URL is adopted after a single check.
+        """
+        if self._is_process_running():
+            if self.agent_logs.is_ready():
+                return
+            logger.warning("ngrok agent running, but it never reported ready. Restarting it.")
+            await self._terminate_process()
+        elif self._adopted:
+            return
+        elif await self._is_agent_ready():
+            # Started by the owning worker or left over from a previous run; reuse it instead of restarting
+            logger.info(f"Adopting ngrok agent already running at {self.api_url}")
+            self._adopted = True
+            return
+
+        start_fd = None
+        if self.shared:
+            if self.is_owner():
+                start_fd = await self._acquire_agent_start_lock(fcntl.LOCK_EX, AGENT_START_TIMEOUT)
             else:
-                logger.warning("Warmed-up ngrok process not responding, will restart")
-                self._warmed_up = False
-            
+                # Taken before ownership, so a worker that finds an owner can always wait for its start
+                start_fd = self._try_agent_start_lock(fcntl.LOCK_EX)
+                if start_fd is None or not self.claim_ownership():
+                    self._unlock_agent_start(start_fd)
+                    if await self._wait_for_owner_agent(AGENT_START_TIMEOUT):
+                        return
+                    # The owner went away; we own the agent now
+                    start_fd = await self._acquire_agent_start_lock(fcntl.LOCK_EX, AGENT_START_TIMEOUT)
+            if start_fd is None:
+                raise Exception("Timed out waiting for another worker to release the ngrok start lock")
+
         try:
-            # Kill any orphaned ngrok processes before starting a new one
-            subprocess.run(['pkill', '-f', 'ngrok'], capture_output=True)
-            time.sleep(1)
-            
-            # Start ngrok tunnel
-            cmd = ['ngrok', 'http', str(port), '--log=stdout']
-            if token:
-                cmd.extend(['--authtoken', token])
-            
-            self.ngrok_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            # Wait for ngrok to start and get the URL with retry logic
-            max_retries = 5
-            retry_delay = 2  # Start with 2 seconds
-            
-            for attempt in range(max_retries):
-                logger.info(f"Waiting for ngrok to start (attempt {attempt + 1}/{max_retries})...")
-                time.sleep(retry_delay)
-                
-                # Check if process is still running
-                if self.ngrok_process.poll() is not None:
-                    # Process died, check stderr for error
-                    stderr_output = ""
-                    if self.ngrok_process.stderr:
-                        stderr_output = self.ngrok_process.stderr.read()
-                    logger.error(f"ngrok process died. stderr: {stderr_output}")
-                    raise Exception("ngrok process failed to start")
-                
-                # Try to get the URL
-                url = self.get_existing_tunnel_url()
-                if url:
-                    logger.info(f"✅ ngrok tunnel started successfully: {url}")
-                    return url
-                
-                # Increase delay for next attempt (exponential backoff)
-                retry_delay = min(retry_delay * 1.5, 8)  # Cap at 8 seconds
-                
-                if attempt < max_retries - 1:
-                    logger.info(f"ngrok API not ready yet, retrying in {retry_delay:.1f} seconds...")
-            
-            # If we get here, all retries failed
-            stderr_output = ""
-            if self.ngrok_process.stderr:
-                stderr_output = self.ngrok_process.stderr.read()
-            logger.error(f"Failed to get tunnel URL after {max_retries} attempts. stderr: {stderr_output}")
-            raise Exception(f"Failed to get tunnel URL after {max_retries} attempts. ngrok may not have started properly.")
-                
-        except Exception as e:
-            logger.error(f"Error starting ngrok tunnel: {e}")
-            if self.ngrok_process:
-                self.ngrok_process.terminate()
-                self.ngrok_process = None
-            raise
+            # An agent we started before that does not answer would hold the API port
+            await self._stop_recorded_agent()
 
-    def stop_tunnel(self):
+            logger.info("Starting ngrok agent...")
+            await self._spawn_ngrok(token)
+
+            if not await self._wait_for_agent(AGENT_START_TIMEOUT):
+                await self.agent_logs.wait_exited(timeout=1)
+                logger.error(f"ngrok agent failed to start. Last output:\n{self.agent_logs.get_tail()}")
+                await self._terminate_process()
+                error = self.agent_logs.last_error
+                raise Exception(f"ngrok agent failed to start: {error}" if error else "ngrok agent failed to start")
+        finally:
+            self._unlock_agent_start(start_fd)
+
+        logger.info("✅ ngrok agent started")
+
+    def _try_agent_start_lock(self, operation: int) -> Optional[int]:
+        """Take the agent start lock without blocking. Returns its descriptor, or None if it is held."""
+        fd = os.open(self._agent_start_lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    async def _acquire_agent_start_lock(self, operation: int, timeout: float) -> Optional[int]:
         """
-        Stop the active ngrok tunnel process.
+        Take the agent start lock, checking again until timeout.
+        Nothing blocks in the meantime, so giving up leaves no thread behind.
         """
-        try:
-            if self.ngrok_process:
-                logger.info("Terminating ngrok process...")
-                self.ngrok_process.terminate()
-                self.ngrok_process.wait(timeout=5)
-                self.ngrok_process = None
-            
-            # Also kill any lingering ngrok processes just in case
-            subprocess.run(['pkill', '-f', 'ngrok'], capture_output=True)
-            logger.info("ngrok process stopped.")
-            
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            fd = self._try_agent_start_lock(operation)
+            if fd is not None or asyncio.get_running_loop().time() >= deadline:
+                return fd
+            await asyncio.sleep(START_LOCK_POLL_INTERVAL)
+
+    @staticmethod
+    def _unlock_agent_start(fd: Optional[int]):
+        if fd is not None:
+            os.close(fd)
+
+    async def _wait_for_owner_agent(self, timeout: float) -> bool:
+        """
+        Wait for the agent started by the worker that owns it.
+        The owner holds the start lock until its agent is ready or has failed,
+        so this waits for the lock and then checks the agent API once.
+        Returns True if the agent was adopted, False if we took over ownership.
+        """
+        logger.info("Waiting for the ngrok agent owned by another worker...")
+        fd = await self._acquire_agent_start_lock(fcntl.LOCK_SH, timeout)
+        if fd is None:
+            raise Exception("ngrok agent owned by another worker did not start in time")
+        self._unlock_agent_start(fd)
+        if await self._is_agent_ready():
+            self._adopted = True
             return True
-        except Exception as e:
-            logger.error(f"Failed to stop ngrok tunnel: {e}")
+        if self.claim_ownership():
             return False
+        raise Exception("ngrok agent owned by another worker is not answering")
 
-    def generate_complete_url(self, tunnel_url: str, script_id: str) -> str:
+    async def get_agent_tunnel_url(self, name: str) -> Optional[str]:
+        """Get the public URL of a named tunnel on the agent, or None if it does not exist."""
+        try:
+            response = await self._get_api_client().get(f"/tunnels/{name}")
+            if response.status_code == 200:
+                return response.json().get('public_url')
+        except httpx.ConnectError:
+            logger.info("Ngrok API not available. Assuming no active tunnel.")
+        except Exception as e:
+            logger.error(f"Error checking ngrok API: {e!r}")
+        return None
+
+    async def open_agent_tunnel(self, name: str, port) -> str:
         """
-        Generate the complete URL that directly executes a script.
+        Add a named HTTP tunnel to the running agent and return its public URL.
         """
-        return f"{tunnel_url}/scripts/run/{script_id}"
-
-    def get_active_tunnels(self):
-        """Get all active tunnels"""
-        return self.active_tunnels
-    
-    def get_tunnel_by_script_id(self, script_id: str):
-        """Get tunnel information for a specific script"""
-        return self.active_tunnels.get(script_id)
-    
-    def generate_unique_hash(self, length=12):
-        """Generate a unique hash for the dynamic endpoint."""
-        while True:
-            hash_str = secrets.token_urlsafe(length)[:length]
-            if hash_str not in self.hash_to_script:
-                return hash_str
-
-    def add_tunnel(self, script_id: str, tunnel_info: dict, timeout_minutes: Optional[int] = None):
-        """Add a tunnel to active tunnels with complete_url and optional expiration."""
-        # Generate a unique hash for this tunnel
-        if 'unique_hash' not in tunnel_info:
-            unique_hash = self.generate_unique_hash()
-            tunnel_info['unique_hash'] = unique_hash
-        else:
-            unique_hash = tunnel_info['unique_hash']
-        self.hash_to_script[unique_hash] = script_id
-
-        # Generate complete_url if not present
-        if 'complete_url' not in tunnel_info and 'tunnel_url' in tunnel_info:
-            tunnel_info['complete_url'] = f"{tunnel_info['tunnel_url']}/run/{unique_hash}"
-        if timeout_minutes:
-            tunnel_info['expiration_time'] = datetime.utcnow() + timedelta(minutes=timeout_minutes)
-            logger.info(f"Tunnel for {script_id} will expire at {tunnel_info['expiration_time'].strftime('%Y-%m-%d %H:%M:%S UTC')}")
-        self.active_tunnels[script_id] = tunnel_info
+        response = await self._get_api_client().post("/tunnels", json={
+            "name": name,
+            "proto": "http",
+            "addr": str(port)
+        })
+        if response.status_code in (200, 201):
+            url = response.json().get('public_url')
+            logger.info(f"✅ ngrok tunnel '{name}' opened: {url}")
+            return url
         
-        # Start cleanup task if this tunnel has an expiration time
-        if timeout_minutes:
-            self.start_cleanup_task()
-
-    def get_script_id_by_hash(self, unique_hash: str):
-        """Get the script_id associated with a unique hash."""
-        return self.hash_to_script.get(unique_hash)
-
-    def remove_tunnel(self, script_id: str):
-        """Remove a tunnel from active tunnels and hash mapping."""
-        tunnel_info = self.active_tunnels.get(script_id)
-        if tunnel_info and 'unique_hash' in tunnel_info:
-            unique_hash = tunnel_info['unique_hash']
-            if unique_hash in self.hash_to_script:
-                del self.hash_to_script[unique_hash]
-        if script_id in self.active_tunnels:
-            del self.active_tunnels[script_id]
-            logger.info(f"Removed tunnel for script {script_id}.")
-            return True
-        return False
-    
-    def is_tunnel_active_for_script(self, script_id: str):
-        """Check if there's an active tunnel for a specific script"""
-        return script_id in self.active_tunnels
-    
-    def get_tunnel_url_for_script(self, script_id: str):
-        """Get the tunnel URL for a specific script"""
-        tunnel_info = self.active_tunnels.get(script_id)
-        if tunnel_info:
-            return tunnel_info.get('tunnel_url')
-        return None
-    
-    def get_complete_url_for_script(self, script_id: str):
-        """Get the complete URL for a specific script"""
-        tunnel_info = self.active_tunnels.get(script_id)
-        if tunnel_info:
-            return tunnel_info.get('complete_url')
-        return None
-    
-    def get_tunnel_count(self):
-        """Get the number of active tunnels"""
-        return len(self.active_tunnels)
-    
-    def clear_all_tunnels(self):
-        """Clear all active tunnels"""
-        self.active_tunnels.clear()
-
-    # Legacy methods for backward compatibility
-    def get_tunnel_info(self):
+        # The tunnel may already exist, e.g. after a concurrent start
+        url = await self.get_agent_tunnel_url(name)
+        if url:
+            return url
+        raise Exception(f"Failed to open ngrok tunnel '{name}': {response.status_code} {response.text}")
+
+    async def close_agent_tunnel(self, name: str) -> bool:
         """
-        Get information about the active tunnel (legacy method).
-        Returns the first tunnel if multiple exist.
+        Remove a named tunnel from the running agent. Other tunnels are untouched.
         """
-        if self.active_tunnels:
-            return next(iter(self.active_tunnels.values()))
-        return None
+        try:
+            response = await self._get_api_client().delete(f"/tunnels/{name}")
+            if response.status_code in (200, 204, 404):
+                logger.info(f"ngrok tunnel '{name}' closed.")
+                return True
+            logger.error(f"Failed to close ngrok tunnel '{name}': {response.status_code} {response.text}")
+        except httpx.ConnectError:
+            logger.info("Ngrok API not available. Assuming no active tunnel.")
+            return True
+        except Exception as e:
+            logger.error(f"Error closing ngrok tunnel '{name}': {e!r}")
+        return False
+
+    async def get_existing_tunnel_url(self):
+        """Get the public URL of the shared tunnel from the ngrok API."""
+        return await self.get_agent_tunnel_url(self.tunnel_name)
 
-    def set_tunnel_info(self, tunnel_info):
+    async def start_tunnel_subprocess(self, port, token=None):
         """
-        Set the active tunnel information (legacy method).
+        Make sure the shared tunnel is open and return its public URL.
+        Starts the ngrok agent if it is not running yet; otherwise the tunnel
+        is added through the agent API without restarting anything.
+        Concurrent callers share a single agent start.
         """
-        if tunnel_info and 'script_id' in tunnel_info:
-            self.active_tunnels[tunnel_info['script_id']] = tunnel_info
+        started = time.perf_counter()
+        async with self._get_start_lock():
+            try:
+                await self._ensure_agent(token or self.ngrok_token)
+                
+                url = await self.get_existing_tunnel_url()
+                if url:
+                    return url
+                url = await self.open_agent_tunnel(self.tunnel_name, port)
+                TUNNEL_READY_SECONDS.set(time.perf_counter() - started)
+                return url
+            except Exception as e:
+                # An adopted agent may be gone; check again next time
+                self._adopted = False
+                logger.error(f"Error starting ngrok tunnel: {e}")
+                raise
+
+    def _get_start_lock(self) -> asyncio.Lock:
+        """Get the lock serializing ngrok agent starts."""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        return self._start_lock
 
-    def is_tunnel_active(self):
+    async def stop_tunnel(self):
         """
-        Check if there's an active tunnel (legacy method).
+        Close the shared tunnel once no worker has links on it.
+        The agent keeps running so the next link is fast. Only the worker
+        that owns the agent closes the tunnel; the others just forget it.
         """
-        return len(self.active_tunnels) > 0
+        self.warm_up_state = WARM_UP_COLD
+        if not self.is_owner():
+            return True
+        # Another worker may have published a link since this one last looked
+        await self._sync()
+        if self.links:
+            logger.info("Links are still active, keeping the shared ngrok tunnel open.")
+            return True
+        try:
+            await self.close_agent_tunnel(self.tunnel_name)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to stop ngrok tunnel: {e}")
+            return False
 
-    def get_tunnel_url(self):
+    async def shutdown_agent(self):
         """
-        Get the current tunnel URL (legacy method).
-        Returns the first tunnel URL if multiple exist.
+        Stop the ngrok agent process.
+        An agent this instance did not start is left alone, together with the
+        shared tunnel: its live links belong to whoever owns the agent.
         """
-        if self.active_tunnels:
-            first_tunnel = next(iter(self.active_tunnels.values()))
-            return first_tunnel.get('tunnel_url')
-        return None 
\ No newline at end of file
+        if not self.is_owner():
+            # The agent and its tunnel belong to the worker that owns them
+            return True
+        try:
+            if not self.ngrok_process:
+                logger.info("ngrok agent was adopted, leaving it and its tunnel running.")
+                return True
+            logger.info("Terminating ngrok process...")
+            await self._terminate_process()
+            self.warm_up_state = WARM_UP_COLD
+            logger.info("ngrok process stopped.")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to stop ngrok agent: {e}")
+            return False
+
+    async def aclose(self):
+        """Close the HTTP client used for the ngrok agent API and flush the registry."""
+        if self._api_client is not None and not self._api_client.is_closed:
+            await self._api_client.aclose()
+        self._api_client = None
+        await super().aclose()
@@ -0,0 +1,89 @@
+import ipaddress
+import time
+from collections import OrderedDict
+from typing import Optional
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by an arbitrary string.
+    Each key may burst up to `burst` calls and refills at `per_minute` calls
+    per minute. At most `max_keys` buckets are kept; the least recently used
+    bucket is evicted first, so memory stays bounded under key floods.
+    """
+
+    def __init__(self, per_minute: float, burst: int, max_keys: int = 10000):
+        self.rate = per_minute / 60.0
+        self.burst = max(burst, 1)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, last refill]
+
+    def is_enabled(self) -> bool:
+        return self.rate > 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def acquire(self, key: str) -> float:
+        """
+        Take one token for key.
+        Returns 0 if the call is allowed, otherwise the seconds until a token is available.
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[key] = [float(self.burst), now]
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+class RunRateLimiter:
+    """Per-client and per-link limits for the public /run endpoint."""
+
+    def __init__(self, settings):
+        self.reconfigure(settings)
+
+    def reconfigure(self, settings):
+        """Apply new limits. Buckets start full again."""
+        self.client_limiter = TokenBucketLimiter(
+            settings.run_rate_limit_per_client, settings.run_rate_limit_client_burst, settings.rate_limit_max_keys
+        )
+        self.link_limiter = TokenBucketLimiter(
+            settings.run_rate_limit_per_link, settings.run_rate_limit_link_burst, settings.rate_limit_max_keys
+        )
+
+    def check_client(self, client_ip: str) -> float:
+        """Take a token for the client. Returns the seconds to wait, 0 if allowed."""
+        return self.client_limiter.acquire(client_ip)
+
+    def check_link(self, unique_hash: str) -> float:
+        """Take a token for the link. Returns the seconds to wait, 0 if allowed."""
+        return self.link_limiter.acquire(unique_hash)
+
+def get_client_ip(request) -> Optional[str]:
+    """
+    Get the address of the caller.
+    Public traffic arrives through the local tunnel agent, which appends the
+    address it accepted the connection from to X-Forwarded-For. For loopback
+    peers the last entry is therefore the real client; earlier entries are
+    whatever the caller sent and cannot be trusted.
+    """
+    peer = request.client.host if request.client else None
+    forwarded_for = request.headers.get('x-forwarded-for')
+    if forwarded_for and peer:
+        try:
+            if ipaddress.ip_address(peer).is_loopback:
+                return forwarded_for.rsplit(',', 1)[-1].strip() or peer
+        except ValueError:
+            pass
+    return peer
@@ -0,0 +1,36 @@
+from typing import Any, Dict
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+try:
+    import orjson
+except ImportError:  # Not every board has an orjson wheel; fall back to the standard encoder
+    orjson = None
+
+# JSON response rendered with orjson when it is installed
+FastJSONResponse = ORJSONResponse if orjson is not None else JSONResponse
+
+# Values of RUN_RESPONSE_MODE
+RUN_RESPONSE_FULL = "full"
+RUN_RESPONSE_LEAN = "lean"
+
+def count_changed_states(result: Any) -> int:
+    """Count the states a service call changed; Home Assistant returns them as a list."""
+    return len(result) if isinstance(result, list) else 0
+
+def lean_run_response(script_id: str, result: Any) -> JSONResponse:
+    """
+    Small fixed-shape body for a successful run.
+    The states the script changed are only counted, not echoed back.
+    """
+    return FastJSONResponse({
+        "success": True,
+        "script_id": script_id,
+        "changed_states": count_changed_states(result)
+    })
+
+def lean_job_status(status: Dict[str, Any]) -> Dict[str, Any]:
+    """Job status with the run result replaced by its changed state count, as for lean runs."""
+    lean = {key: value for key, value in status.items() if key != 'result'}
+    lean['changed_states'] = count_changed_states(status.get('result'))
+    return lean
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class RunJob:
+    """State of a single queued script run."""
+
+    def __init__(self, script_id: str):
+        self.job_id = secrets.token_urlsafe(12)
+        self.script_id = script_id
+        self.status = 'queued'
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.enqueued_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def is_done(self) -> bool:
+        """Check if the run has finished, successfully or not."""
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'script_id': self.script_id,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'enqueued_at': self.enqueued_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunJob":
+        job = cls(data['script_id'])
+        for key, value in data.items():
+            setattr(job, key, value)
+        return job
+
+class RunQueue:
+    """
+    Bounded queue of script runs drained by a fixed pool of workers.
+    Callers get a job right away and follow it by id, so slow scripts or a
+    slow supervisor don't hold their connection open.
+    """
+
+    def __init__(self, ha_client, workers: int = 4, max_queue: int = 100, max_jobs: int = 1000, job_store=None):
+        self.ha_client = ha_client
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_jobs = max_jobs
+        self.job_store = job_store  # Shares job status with other worker processes
+        self._queue: Optional[asyncio.Queue] = None
+        self._jobs: "OrderedDict[str, RunJob]" = OrderedDict()
+        self._tasks: List[asyncio.Task] = []
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        return self._queue
+
+    def get_queue_depth(self) -> int:
+        """
+        Get the number of runs waiting for a worker.
+        With several WEB_WORKERS each process has its own queue, so this only
+        counts the runs queued in this process.
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def get_job(self, job_id: str) -> Optional[RunJob]:
+        """Get a job by its id, including jobs queued in other workers."""
+        job = self._jobs.get(job_id)
+        if job is None and self.job_store is not None:
+            data = self.job_store.get_job('run', job_id)
+            if data:
+                return RunJob.from_dict(data)
+        return job
+
+    def _publish(self, job: RunJob):
+        """Store the job's status for the other workers."""
+        if self.job_store is not None:
+            self.job_store.put_job('run', job.job_id, job.to_dict())
+
+    def submit(self, script_id: str) -> Optional[RunJob]:
+        """
+        Queue a run of the script.
+        Returns None if the queue is full.
+        """
+        job = RunJob(script_id)
+        try:
+            self._get_queue().put_nowait(job)
+        except asyncio.QueueFull:
+            logger.warning(f"⚠️  Run queue full, rejecting run of {script_id}")
+            return None
+
+        self._jobs[job.job_id] = job
+        self._prune()
+        self._publish(job)
+        return job
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_jobs."""
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id].is_done():
+                del self._jobs[job_id]
+
+    async def _worker(self):
+        """Run queued scripts one at a time."""
+        queue = self._get_queue()
+        while True:
+            job = await queue.get()
+            job.status = 'running'
+            job.started_at = time.time()
+            self._publish(job)
+            try:
+                job.result = await self.ha_client.run_script_async(job.script_id)
+                job.status = 'completed'
+                logger.info(f"✅ Queued run {job.job_id} of {job.script_id} completed")
+            except asyncio.CancelledError:
+                job.status = 'failed'
+                job.error = "Run cancelled during shutdown"
+                raise
+            except Exception as e:
+                job.status = 'failed'
+                job.error = f"Failed to execute script: {e}"
+                logger.error(f"❌ Queued run {job.job_id} of {job.script_id} failed: {e}")
+            finally:
+                job.finished_at = time.time()
+                self._publish(job)
+                queue.task_done()
+
+    def start(self):
+        """Start the worker pool."""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"🔥 Run queue started with {self.workers} workers.")
+
+    async def stop(self):
+        """Stop the worker pool."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._tasks:
+            logger.info("🔥 Run queue stopped.")
+        self._tasks = []
@@ -0,0 +1,291 @@
+import asyncio
+import bisect
+import json
+import logging
+import secrets
+from typing import Optional, List, Dict, Any
+
+import websockets
+
+from settings import get_settings
+from .script_index import ScriptIndex
+from .circuit_breaker import CircuitOpenError
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class ScriptCatalog:
+    """
+    In-memory catalog of Home Assistant scripts.
+    The catalog is loaded once from the REST API and then kept current by
+    subscribing to state_changed events over the Home Assistant websocket API.
+    """
+
+    def __init__(self, ha_client):
+        settings = get_settings()
+        self.ha_client = ha_client
+        self.websocket_url = settings.ha_websocket_url or self._derive_websocket_url(ha_client.get_base_url())
+        self._scripts: Dict[str, Dict[str, Any]] = {}
+        self._index = ScriptIndex()
+        self._loaded = False
+        self._live = False  # True while the websocket subscription is active
+        self._version = 0
+        self._epoch = secrets.token_hex(4)  # Keeps ETags unique across restarts
+        self._sorted_version = -1
+        self._sorted_ids: List[str] = []
+        self._sorted_scripts: List[Dict[str, Any]] = []
+        self._load_count = 0
+        self._task: Optional[asyncio.Task] = None
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._message_id = 0
+
+        logger.info(f"Home Assistant websocket URL: {self.websocket_url}")
+
+    async def reconfigure(self, settings):
+        """Point the subscription at a new websocket URL or token and restart it."""
+        self.websocket_url = settings.ha_websocket_url or self._derive_websocket_url(self.ha_client.get_base_url())
+        await self.stop()
+        self.start()
+        logger.info(f"Home Assistant websocket URL: {self.websocket_url}")
+
+    @staticmethod
+    def _derive_websocket_url(base_url: str) -> str:
+        """
+        Derive the websocket endpoint from the REST base URL.
+        The supervisor proxies the websocket at /core/websocket, while a
+        direct Home Assistant instance serves it at /api/websocket.
+        """
+        url = base_url.rstrip('/')
+        if url.startswith('https://'):
+            url = 'wss://' + url[len('https://'):]
+        elif url.startswith('http://'):
+            url = 'ws://' + url[len('http://'):]
+
+        if url.endswith('/core/api'):
+            return url[:-len('/api')] + '/websocket'
+        return f"{url}/websocket"
+
+    def _next_id(self) -> int:
+        """Get the next websocket message id."""
+        self._message_id += 1
+        return self._message_id
+
+    def start(self):
+        """Start the background websocket subscription task."""
+        if not self.ha_client.is_configured():
+            logger.warning("⚠️  Script catalog live updates disabled: Home Assistant token not configured")
+            return
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info("🔥 Script catalog subscription task started.")
+
+    async def stop(self):
+        """Stop the background websocket subscription task."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            logger.info("🔥 Script catalog subscription task stopped.")
+        self._task = None
+        self._live = False
+
+    def is_live(self) -> bool:
+        """Check if the catalog is receiving live updates from Home Assistant."""
+        return self._live
+
+    def get_version(self) -> int:
+        """Get the catalog version. It changes every time the script list changes."""
+        return self._version
+
+    def get_script_count(self) -> int:
+        """Get the number of scripts in the current snapshot."""
+        return len(self._scripts)
+
+    def get_etag(self) -> str:
+        """Get an ETag identifying the current catalog contents."""
+        return f'"{self._epoch}-{self._version}"'
+
+    async def load(self):
+        """
+        Load the full script list from Home Assistant, replacing the current snapshot.
+        """
+        # Other entities are dropped while the response streams in
+        states = await self.ha_client.get_api_items_async("states", self.ha_client.is_script)
+        scripts = {state['entity_id']: self.ha_client.format_script(state) for state in states}
+
+        if scripts != self._scripts or not self._loaded:
+            self._scripts = scripts
+            self._index.rebuild(scripts.values())
+            self._version += 1
+        self._loaded = True
+        self._load_count += 1
+        logger.info(f"📚 Script catalog loaded with {len(scripts)} scripts (version {self._version})")
+
+    async def _ensure_current(self):
+        """
+        Make sure the snapshot can be trusted.
+        While the websocket subscription is live the in-memory copy is always
+        current. Otherwise it is refreshed from the REST API, so the catalog
+        never serves data older than the previous behaviour did.
+        """
+        if self._live and self._loaded:
+            return
+
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+
+        # Concurrent callers share a single refresh
+        load_count = self._load_count
+        async with self._load_lock:
+            if (self._live and self._loaded) or self._load_count != load_count:
+                return
+            try:
+                await self.load()
+            except CircuitOpenError as e:
+                # Without a snapshot there is nothing to serve; let callers answer 503
+                if not self._loaded:
+                    raise
+                logger.warning(f"⚠️  Serving the last script catalog snapshot: {e}")
+            except Exception as e:
+                logger.error(f"Error loading script catalog: {e}")
+
+    async def get_scripts(self) -> List[Dict[str, Any]]:
+        """Get all available scripts."""
+        await self._ensure_current()
+        return list(self._scripts.values())
+
+    async def get_sorted_scripts(self) -> List[Dict[str, Any]]:
+        """
+        Get all scripts ordered by entity_id.
+        The ordering is cached per catalog version so paging through the list
+        does not re-sort it on every request.
+        """
+        await self._ensure_current()
+        self._refresh_sorted()
+        return self._sorted_scripts
+
+    async def get_scripts_page(self, cursor: Optional[str] = None, limit: Optional[int] = None):
+        """
+        Get a page of scripts ordered by entity_id.
+        The cursor is the entity_id of the last script of the previous page.
+        Returns the page and the cursor for the next page (None on the last page).
+        """
+        scripts = await self.get_sorted_scripts()
+        start = bisect.bisect_right(self._sorted_ids, cursor) if cursor else 0
+
+        if limit is None:
+            return scripts[start:], None
+
+        page = scripts[start:start + limit]
+        next_cursor = page[-1]['entity_id'] if page and start + limit < len(scripts) else None
+        return page, next_cursor
+
+    def _refresh_sorted(self):
+        """Rebuild the sorted view if the catalog changed since it was built."""
+        if self._sorted_version == self._version:
+            return
+        self._sorted_ids = sorted(self._scripts)
+        self._sorted_scripts = [self._scripts[entity_id] for entity_id in self._sorted_ids]
+        self._sorted_version = self._version
+
+    async def get_script(self, script_id: str) -> Optional[Dict[str, Any]]:
+        """Get information about a specific script."""
+        await self._ensure_current()
+        return self._scripts.get(script_id)
+
+    async def search(self, query: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Search scripts by entity_id and friendly name, best matches first."""
+        await self._ensure_current()
+        return [self._scripts[entity_id] for entity_id in self._index.search(query, limit)]
+
+    async def script_exists(self, script_id: str) -> bool:
+        """Check if a script exists."""
+        await self._ensure_current()
+        return script_id in self._scripts
+
+    def is_known(self, script_id: str) -> bool:
+        """Check the current snapshot for a script without refreshing it."""
+        return script_id in self._scripts
+
+    def apply_state_change(self, entity_id: str, new_state: Optional[dict]):
+        """
+        Apply a single state_changed event to the catalog.
+        A missing new_state means the entity was removed.
+        """
+        if not entity_id or not entity_id.startswith('script.'):
+            return
+
+        if new_state is None:
+            if self._scripts.pop(entity_id, None) is not None:
+                self._index.remove(entity_id)
+                self._version += 1
+                logger.info(f"Script {entity_id} removed from catalog.")
+            return
+
+        script = self.ha_client.format_script(new_state)
+        if self._scripts.get(entity_id) != script:
+            self._scripts[entity_id] = script
+            self._index.add(script)
+            self._version += 1
+
+    async def _subscribe(self, websocket):
+        """Authenticate and subscribe to state_changed events."""
+        message = json.loads(await websocket.recv())
+        if message.get('type') != 'auth_required':
+            raise Exception(f"Unexpected websocket message: {message.get('type')}")
+
+        await websocket.send(json.dumps({
+            "type": "auth",
+            "access_token": self.ha_client.ha_token
+        }))
+        message = json.loads(await websocket.recv())
+        if message.get('type') != 'auth_ok':
+            raise Exception(f"Websocket authentication failed: {message.get('message', message.get('type'))}")
+
+        subscription_id = self._next_id()
+        await websocket.send(json.dumps({
+            "id": subscription_id,
+            "type": "subscribe_events",
+            "event_type": "state_changed"
+        }))
+        message = json.loads(await websocket.recv())
+        if not message.get('success'):
+            raise Exception(f"Failed to subscribe to state_changed events: {message.get('error')}")
+
+        return subscription_id
+
+    async def _run(self):
+        """Keep a websocket subscription open, reconnecting with backoff."""
+        retry_delay = 1
+
+        while True:
+            try:
+                async with websockets.connect(self.websocket_url, max_size=None) as websocket:
+                    self._message_id = 0
+                    subscription_id = await self._subscribe(websocket)
+
+                    # Reload after subscribing so no change between the two is lost
+                    await self.load()
+                    self._live = True
+                    retry_delay = 1
+                    logger.info("✅ Script catalog subscribed to Home Assistant state changes")
+
+                    async for raw in websocket:
+                        message = json.loads(raw)
+                        if message.get('type') != 'event' or message.get('id') != subscription_id:
+                            continue
+                        data = message.get('event', {}).get('data', {})
+                        self.apply_state_change(data.get('entity_id'), data.get('new_state'))
+
+                    raise Exception("Websocket connection closed")
+            except asyncio.CancelledError:
+                self._live = False
+                raise
+            except Exception as e:
+                self._live = False
+                logger.warning(f"⚠️  Script catalog websocket unavailable: {e!r}. Retrying in {retry_delay}s")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
@@ -0,0 +1,129 @@
+import bisect
+import heapq
+import re
+from typing import Optional, List, Dict, Set, Any
+
+# Split entity ids and names into lowercase words
+TOKEN_PATTERN = re.compile(r"[^\w]+|_")
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase search tokens."""
+    return [token for token in TOKEN_PATTERN.split(text.lower()) if token]
+
+def tokenize_entity_id(entity_id: str) -> List[str]:
+    """Tokenize an entity id without its 'script.' domain, which every script shares."""
+    return tokenize(entity_id.lower().removeprefix('script.'))
+
+class ScriptIndex:
+    """
+    Prefix/token search index over script entity ids and friendly names.
+    Tokens are kept in a sorted list so every prefix lookup is a binary search
+    followed by a scan over only the matching tokens.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[str]] = {}  # token -> entity ids
+        self._tokens: List[str] = []  # sorted distinct tokens
+        self._entries: Dict[str, tuple] = {}  # entity_id -> (tokens, lowercase name)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        """Remove every script from the index."""
+        self._postings.clear()
+        self._tokens.clear()
+        self._entries.clear()
+
+    def rebuild(self, scripts: List[Dict[str, Any]]):
+        """Replace the index contents with the given scripts."""
+        self.clear()
+        for script in scripts:
+            tokens = set(tokenize_entity_id(script['entity_id'])) | set(tokenize(script.get('name') or ''))
+            for token in tokens:
+                self._postings.setdefault(token, set()).add(script['entity_id'])
+            self._entries[script['entity_id']] = (tokens, (script.get('name') or script['entity_id']).lower())
+        self._tokens = sorted(self._postings)
+
+    def add(self, script: Dict[str, Any]):
+        """Add or update a single script."""
+        entity_id = script['entity_id']
+        name = (script.get('name') or entity_id).lower()
+        existing = self._entries.get(entity_id)
+        if existing and existing[1] == name:
+            return
+
+        self.remove(entity_id)
+        tokens = set(tokenize_entity_id(entity_id)) | set(tokenize(name))
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                bisect.insort(self._tokens, token)
+            postings.add(entity_id)
+        self._entries[entity_id] = (tokens, name)
+
+    def remove(self, entity_id: str):
+        """Remove a single script."""
+        entry = self._entries.pop(entity_id, None)
+        if entry is None:
+            return
+
+        for token in entry[0]:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(entity_id)
+            if not postings:
+                del self._postings[token]
+                position = bisect.bisect_left(self._tokens, token)
+                if position < len(self._tokens) and self._tokens[position] == token:
+                    del self._tokens[position]
+
+    def _match_prefix(self, prefix: str) -> Dict[str, int]:
+        """Score every script with a token starting with prefix (2 for an exact token, 1 for a prefix)."""
+        scores: Dict[str, int] = {}
+        position = bisect.bisect_left(self._tokens, prefix)
+        while position < len(self._tokens) and self._tokens[position].startswith(prefix):
+            token = self._tokens[position]
+            score = 2 if token == prefix else 1
+            for entity_id in self._postings[token]:
+                if scores.get(entity_id, 0) < score:
+                    scores[entity_id] = score
+            position += 1
+        return scores
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """
+        Find scripts matching every word of the query, ranked best first.
+        Exact entity id matches rank highest, then names or ids starting with
+        the query, then exact word matches over prefix matches.
+        """
+        query = query.strip().lower()
+        query_tokens = tokenize_entity_id(query)
+        if not query_tokens:
+            return []
+
+        scores: Optional[Dict[str, int]] = None
+        for query_token in query_tokens:
+            matches = self._match_prefix(query_token)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {entity_id: score + matches[entity_id]
+                          for entity_id, score in scores.items() if entity_id in matches}
+            if not scores:
+                return []
+
+        query_entity_id = f"script.{query.removeprefix('script.')}"
+        ranked = []
+        for entity_id, score in scores.items():
+            name = self._entries[entity_id][1]
+            if entity_id == query_entity_id:
+                score += 100
+            if name.startswith(query) or entity_id.startswith(query_entity_id):
+                score += 10
+            ranked.append((-score, name, entity_id))
+
+        ranked = heapq.nsmallest(limit, ranked) if limit is not None else sorted(ranked)
+        return [entity_id for _, _, entity_id in ranked]
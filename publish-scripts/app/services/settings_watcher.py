@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from settings import Settings, reload_settings
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class SettingsWatcher:
+    """
+    Watches the settings files and reloads the settings snapshot when they change.
+    Files are polled by modification time and size, which is cheap and needs
+    no file-system notification support. on_change is called with the
+    previous and the new snapshot.
+    """
+
+    def __init__(self, paths: List[str], interval: float, on_change: Callable[[Settings, Settings], Awaitable[None]]):
+        self.paths = paths
+        self.interval = interval
+        self.on_change = on_change
+        self._fingerprint = self._read_fingerprint()
+        self._task: Optional[asyncio.Task] = None
+
+    def _read_fingerprint(self) -> Tuple:
+        fingerprint = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                fingerprint.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                fingerprint.append(None)
+        return tuple(fingerprint)
+
+    async def check(self) -> bool:
+        """Reload the settings if a file changed. Returns True if they were reloaded."""
+        fingerprint = self._read_fingerprint()
+        if fingerprint == self._fingerprint:
+            return False
+        self._fingerprint = fingerprint
+
+        try:
+            old_settings, new_settings = reload_settings()
+        except Exception as e:
+            logger.error(f"❌ Invalid settings, keeping the current ones: {e}")
+            return False
+
+        try:
+            await self.on_change(old_settings, new_settings)
+        except Exception as e:
+            logger.error(f"❌ Failed to apply new settings: {e}")
+        return True
+
+    async def _run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                await self.check()
+        except asyncio.CancelledError:
+            logger.info("Settings watcher cancelled.")
+            raise
+
+    def start(self):
+        """Start watching the settings files."""
+        if self.interval <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"🔥 Settings watcher started ({', '.join(self.paths)}).")
+
+    async def stop(self):
+        """Stop watching the settings files."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            logger.info("🔥 Settings watcher stopped.")
+        self._task = None
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key.
+    While a call for a key is in flight, every other caller for that key
+    awaits the same result instead of starting its own. A successful result
+    is also shared with callers arriving within `window` seconds after it
+    finished; failures are never shared beyond the callers already waiting.
+    """
+
+    def __init__(self, window: float = 0.0):
+        self.window = window
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run func for key, or join the call already running or just finished for it."""
+        future = self._calls.get(key)
+        if future is not None:
+            logger.debug(f"Joining in-flight call for {key}")
+        else:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._finished(key, done))
+
+        # Shield the shared call so one caller disconnecting doesn't cancel it for the rest
+        return await asyncio.shield(future)
+
+    def _finished(self, key: str, future: asyncio.Future):
+        """Keep a successful result around for the dedup window, then forget it."""
+        if self._calls.get(key) is not future:
+            return
+        if self.window > 0 and not future.cancelled() and future.exception() is None:
+            asyncio.get_running_loop().call_later(self.window, self._forget, key, future)
+        else:
+            self._forget(key, future)
+
+    def _forget(self, key: str, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
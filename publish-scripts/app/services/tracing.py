@@ -0,0 +1,114 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, List, Any
+
+class RequestTrace:
+    """Timings of the spans recorded while handling one request."""
+
+    __slots__ = ('method', 'path', 'started', 'started_at', 'spans', 'status_code', 'duration_ms')
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.spans: Dict[str, float] = {}  # span name -> total milliseconds
+        self.status_code: Optional[int] = None
+        self.duration_ms: Optional[float] = None
+
+    def add_span(self, name: str, duration_ms: float):
+        self.spans[name] = self.spans.get(name, 0.0) + duration_ms
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self) -> str:
+        """Format the spans and the total so far as a Server-Timing header value."""
+        entries = [f"{name};dur={duration:.1f}" for name, duration in self.spans.items()]
+        entries.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'method': self.method,
+            'path': self.path,
+            'status_code': self.status_code,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration_ms, 2) if self.duration_ms is not None else None,
+            'spans': {name: round(duration, 2) for name, duration in self.spans.items()}
+        }
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar('current_trace', default=None)
+
+@contextmanager
+def span(name: str):
+    """
+    Time a block of work and record it on the current request's trace.
+    Outside of a request this does nothing beyond reading the clock.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, (time.perf_counter() - started) * 1000)
+
+class SlowRequestLog:
+    """Rolling buffer of the most recent requests slower than a threshold."""
+
+    def __init__(self, threshold_ms: float = 500, size: int = 100):
+        self.threshold_ms = threshold_ms
+        self._entries: deque = deque(maxlen=size)
+
+    def configure(self, threshold_ms: float, size: int):
+        self.threshold_ms = threshold_ms
+        if size != self._entries.maxlen:
+            self._entries = deque(self._entries, maxlen=size)
+
+    def record(self, trace: RequestTrace):
+        if trace.duration_ms is not None and trace.duration_ms >= self.threshold_ms:
+            self._entries.append(trace)
+
+    def get_entries(self) -> List[Dict[str, Any]]:
+        """Get the slow requests, most recent first."""
+        return [trace.to_dict() for trace in reversed(self._entries)]
+
+SLOW_REQUESTS = SlowRequestLog()
+
+class TimingMiddleware:
+    """
+    ASGI middleware that traces each HTTP request.
+    Spans recorded with span() during the request are reported in a
+    Server-Timing response header, and slow requests are kept in
+    SLOW_REQUESTS for /debug/slow.
+    """
+
+    def __init__(self, app, slow_log: SlowRequestLog = SLOW_REQUESTS):
+        self.app = app
+        self.slow_log = slow_log
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope['method'], scope['path'])
+        token = _current_trace.set(trace)
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                trace.status_code = message['status']
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', trace.server_timing().encode('latin-1')))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            trace.duration_ms = trace.elapsed_ms()
+            _current_trace.reset(token)
+            self.slow_log.record(trace)
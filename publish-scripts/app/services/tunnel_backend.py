@@ -0,0 +1,436 @@
+import asyncio
+import fcntl
+import logging
+import os
+import secrets
+import time
+from abc import ABC, abstractmethod
+from typing import Optional, List
+from settings import get_settings
+from services.expiry_scheduler import ExpiryScheduler
+from services.link_store import LinkRecord, LinkStore
+from services.tunnel_registry import TunnelRegistry
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Warm-up states of the shared tunnel
+WARM_UP_COLD = "cold"
+WARM_UP_WARMING = "warming"
+WARM_UP_READY = "ready"
+WARM_UP_FAILED = "failed"
+
+class TunnelBackend(ABC):
+    """
+    Base class for the ways published links are exposed.
+    It owns the links themselves (hashes, expirations and the on-disk
+    registry). Subclasses only provide the transport: opening and closing
+    the shared tunnel that every link is served through.
+
+    When the app runs in several worker processes, the registry is the
+    source of truth: writes are flushed to it right away, each worker
+    reloads its in-memory links when another worker has committed a change,
+    and a lock file elects the one worker that owns the tunnel process.
+    Reads and writes of the registry run in a worker thread, so lookups
+    only await them when the links actually changed.
+    """
+
+    # Name used to select the backend with TUNNEL_BACKEND
+    name = "base"
+    # Output of the agent process carrying the tunnel, for backends that run one
+    agent_logs = None
+
+    def __init__(self):
+        settings = get_settings()
+        self.expiry_scheduler = ExpiryScheduler(self._expire_tunnel)
+        # Active links by script, by hash and, through the scheduler, by expiry
+        self.links = LinkStore(self.expiry_scheduler)
+        multi_worker = settings.web_workers > 1
+        self.registry = TunnelRegistry(
+            settings.tunnel_registry_path,
+            settings.tunnel_registry_flush_interval,
+            write_through=multi_worker
+        )
+        # Opening the shared tunnel runs in the background; see start_warm_up
+        self.warm_up_state = WARM_UP_COLD
+        self._warm_up_task: Optional[asyncio.Task] = None
+        self._warm_up_error: Optional[str] = None
+        self._warm_up_seconds: Optional[float] = None
+
+        # Link state shared with the other workers through the registry
+        self.shared = multi_worker and self.registry.enabled
+        self._synced_version = None
+        self._sync_lock: Optional[asyncio.Lock] = None
+        self._owner_lock_path = os.path.join(os.path.dirname(os.path.abspath(settings.tunnel_registry_path or ".")), "tunnel-owner.lock")
+        self._owner_lock_fd = None
+        if multi_worker and not self.registry.enabled:
+            logger.warning(f"⚠️  {settings.web_workers} workers configured without a tunnel registry, links will not be shared between workers")
+
+    async def reconfigure(self, settings):
+        """Apply new settings without touching the live links."""
+
+    def claim_ownership(self) -> bool:
+        """
+        Check if this process owns the tunnel, taking over if no worker does.
+        A single worker always owns it. With several, an exclusive lock on a
+        file next to the registry elects the owner; the lock is released when
+        the owner exits, so another worker can take over.
+        """
+        if not self.shared or self._owner_lock_fd is not None:
+            return True
+
+        fd = os.open(self._owner_lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._owner_lock_fd = fd
+        logger.info(f"🔥 Worker {os.getpid()} now owns the {self.name} tunnel")
+        return True
+
+    def is_owner(self) -> bool:
+        """Check if this process owns the tunnel, without trying to take it over."""
+        return not self.shared or self._owner_lock_fd is not None
+
+    def release_ownership(self):
+        """Let another worker take over the tunnel."""
+        if self._owner_lock_fd is not None:
+            os.close(self._owner_lock_fd)
+            self._owner_lock_fd = None
+
+    async def _sync(self):
+        """Reload the links if another worker changed them since the last lookup."""
+        if not self.shared:
+            return
+        version = self.registry.data_version()
+        if version is None or version == self._synced_version:
+            return
+
+        if self._sync_lock is None:
+            self._sync_lock = asyncio.Lock()
+        # Concurrent lookups share a single reload
+        async with self._sync_lock:
+            version = self.registry.data_version()
+            if version is None or version == self._synced_version:
+                return
+            records = await asyncio.to_thread(self.registry.load)
+            self._synced_version = version
+            self._load_records(records)
+
+    async def _commit(self):
+        """Write queued link changes now when they are shared with other workers."""
+        if self.registry.write_through:
+            await self.registry.flush()
+
+    def _load_records(self, records):
+        """Replace the in-memory links with the stored ones and reschedule their expiry."""
+        now = time.time()
+        self.links.replace_all(
+            LinkRecord.from_record(record) for record in records
+            if record['expires_at'] is None or record['expires_at'] > now
+        )
+
+    @abstractmethod
+    def is_configured(self) -> bool:
+        """Check if the backend has what it needs to open tunnels."""
+
+    @abstractmethod
+    def is_running(self) -> bool:
+        """Check if the process or server carrying the tunnel is running."""
+
+    @abstractmethod
+    async def start_tunnel(self, port) -> str:
+        """Make sure the shared tunnel to the given local port is open and return its public URL."""
+
+    @abstractmethod
+    async def stop_tunnel(self) -> bool:
+        """Close the shared tunnel once no links need it."""
+
+    @abstractmethod
+    async def shutdown(self) -> bool:
+        """Stop everything the backend started, on add-on shutdown."""
+
+    def start_warm_up(self, port) -> Optional[asyncio.Task]:
+        """
+        Open the shared tunnel in a background task, so startup and the UI do not wait for it.
+        Returns the warm-up task, or None if the backend is not configured.
+        """
+        if not self.is_configured():
+            return None
+        if self.warm_up_state != WARM_UP_READY and (self._warm_up_task is None or self._warm_up_task.done()):
+            self._warm_up_task = asyncio.create_task(self.warm_up(port))
+        return self._warm_up_task
+
+    async def warm_up(self, port) -> bool:
+        """
+        Open the shared tunnel ahead of time so the first link is instant.
+        Moves the state from cold or failed to warming, then to ready or failed.
+        Links restored with an older tunnel URL are pointed at the new one.
+        """
+        if self.warm_up_state == WARM_UP_READY or not self.is_configured():
+            return True
+
+        self.warm_up_state = WARM_UP_WARMING
+        self._warm_up_error = None
+        started = time.monotonic()
+        try:
+            logger.info(f"🔥 Warming up the {self.name} tunnel for faster first tunnel creation...")
+            url = await self.start_tunnel(port)
+        except asyncio.CancelledError:
+            self.warm_up_state = WARM_UP_COLD
+            raise
+        except Exception as e:
+            self.warm_up_state = WARM_UP_FAILED
+            self._warm_up_error = str(e)
+            logger.error(f"Error during {self.name} warm-up: {e}")
+            return False
+
+        self._warm_up_seconds = time.monotonic() - started
+        self.warm_up_state = WARM_UP_READY
+        await self._repoint_links(url)
+        logger.info(f"✅ {self.name} tunnel warmed up in {self._warm_up_seconds:.1f}s: {url}")
+        return True
+
+    async def ensure_tunnel(self, port) -> str:
+        """
+        Get the public URL of the shared tunnel, opening it if needed.
+        A warm-up in progress is joined instead of racing it with a second start.
+        """
+        task = self._warm_up_task
+        if task is not None and not task.done():
+            await asyncio.shield(task)
+        url = await self.start_tunnel(port)
+        if self.warm_up_state != WARM_UP_READY:
+            self.warm_up_state = WARM_UP_READY
+            await self._repoint_links(url)
+        return url
+
+    async def cancel_warm_up(self):
+        """Stop a warm-up still in progress, on shutdown."""
+        task = self._warm_up_task
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._warm_up_task = None
+
+    def get_warm_up_status(self) -> dict:
+        return {
+            "state": self.warm_up_state,
+            "error": self._warm_up_error,
+            "seconds": round(self._warm_up_seconds, 3) if self._warm_up_seconds is not None else None
+        }
+
+    async def _repoint_links(self, tunnel_url: str):
+        """Point links handed out on an older tunnel URL at the current one."""
+        await self._sync()
+        for record in self.links:
+            if record.tunnel_url == tunnel_url:
+                continue
+            record.tunnel_url = tunnel_url
+            record.complete_url = f"{tunnel_url}/run/{record.unique_hash}"
+            self._persist(record)
+        await self._commit()
+
+    async def aclose(self):
+        """Flush and close the link registry."""
+        self.release_ownership()
+        await self.registry.close()
+
+    def start_cleanup_task(self):
+        """Start the expiry scheduler that revokes links at their deadline."""
+        try:
+            self.expiry_scheduler.start()
+        except Exception as e:
+            logger.error(f"Failed to start expiry scheduler: {e}")
+
+    async def _expire_tunnel(self, script_id: str):
+        """Revoke a link whose deadline has passed."""
+        logger.info(f"⌛ Tunnel for script {script_id} expired.")
+        await self._sync()
+        record = self.links.get(script_id)
+        if record is not None and record.expires_at is not None and record.expires_at > time.time():
+            # Extended by another worker since the deadline was scheduled
+            return
+        if self.links.remove(script_id) is not None:
+            logger.info(f"Removed tunnel for script {script_id}.")
+        # Drop the registry row even if the link was already gone locally
+        self.registry.delete(script_id)
+        await self._commit()
+
+        # If no tunnels are left, close the shared tunnel
+        if not self.links:
+            logger.info("All tunnels expired or removed, closing the shared tunnel.")
+            await self.stop_tunnel()
+
+    async def stop_cleanup_task(self):
+        """Stop the expiry scheduler."""
+        await self.expiry_scheduler.stop()
+
+    def generate_complete_url(self, tunnel_url: str, script_id: str) -> str:
+        """
+        Generate the complete URL that directly executes a script.
+        """
+        return f"{tunnel_url}/scripts/run/{script_id}"
+
+    async def get_active_tunnels(self) -> List[LinkRecord]:
+        """Get all active links"""
+        await self._sync()
+        return list(self.links)
+    
+    async def get_tunnel_by_script_id(self, script_id: str) -> Optional[LinkRecord]:
+        """Get the link for a specific script"""
+        await self._sync()
+        return self.links.get(script_id)
+    
+    def generate_unique_hash(self, length=12):
+        """Generate a unique hash for the dynamic endpoint."""
+        while True:
+            hash_str = secrets.token_urlsafe(length)[:length]
+            if not self.links.has_hash(hash_str):
+                return hash_str
+
+    async def add_tunnel(self, script_id: str, tunnel_url: str, timeout_minutes: Optional[int] = None,
+                   unique_hash: Optional[str] = None, created_at: Optional[float] = None) -> LinkRecord:
+        """Publish a link for a script on the given tunnel, with an optional expiration."""
+        await self._sync()
+        unique_hash = unique_hash or self.generate_unique_hash()
+        expires_at = time.time() + timeout_minutes * 60 if timeout_minutes else None
+        record = LinkRecord(
+            script_id,
+            unique_hash,
+            tunnel_url=tunnel_url,
+            complete_url=f"{tunnel_url}/run/{unique_hash}",
+            created_at=created_at if created_at is not None else time.time(),
+            expires_at=expires_at
+        )
+        self.links.put(record)
+        if expires_at is not None:
+            self._log_expiry(record)
+        self._persist(record)
+        await self._commit()
+        return record
+
+    def _persist(self, record: LinkRecord):
+        """Queue the link for the on-disk registry."""
+        self.registry.put(record.to_record())
+
+    def _log_expiry(self, record: LinkRecord):
+        logger.info(f"Tunnel for {record.script_id} will expire at {record.expiration_time.strftime('%Y-%m-%d %H:%M:%S UTC')}")
+
+    async def extend_tunnel(self, script_id: str, minutes: int) -> bool:
+        """
+        Push back the expiration of a link by the given minutes.
+        A link without an expiration starts expiring in that many minutes.
+        Returns False if there is no active tunnel for the script.
+        """
+        await self._sync()
+        if script_id not in self.links:
+            return False
+
+        remaining = self.expiry_scheduler.get_remaining(script_id) or 0
+        record = self.links.set_expiry(script_id, time.time() + remaining + minutes * 60)
+        self._log_expiry(record)
+        self._persist(record)
+        await self._commit()
+        return True
+
+    async def restore_tunnels(self) -> int:
+        """
+        Reload the links stored in the registry after a restart.
+        Expired links are dropped. The rest resolve right away and keep their
+        old URL until the warm-up brings the tunnel back and points them at it.
+        Returns the number of restored links.
+        """
+        records = await asyncio.to_thread(self.registry.load)
+        self.registry.start()
+
+        now = time.time()
+        restored = 0
+        for record in records:
+            if record['expires_at'] is not None and record['expires_at'] <= now:
+                self.registry.delete(record['script_id'])
+                continue
+            self.links.put(LinkRecord.from_record(record))
+            restored += 1
+        await self._commit()
+        if not restored:
+            return 0
+
+        logger.info(f"✅ Restored {restored} tunnels from the registry")
+        return restored
+
+    async def get_script_id_by_hash(self, unique_hash: str):
+        """Get the script_id associated with a unique hash."""
+        await self._sync()
+        record = self.links.get_by_hash(unique_hash)
+        return record.script_id if record is not None else None
+
+    async def remove_tunnel(self, script_id: str):
+        """Remove a link, its hash and its expiry."""
+        await self._sync()
+        if self.links.remove(script_id) is None:
+            return False
+        self.registry.delete(script_id)
+        await self._commit()
+        logger.info(f"Removed tunnel for script {script_id}.")
+        return True
+    
+    async def is_tunnel_active_for_script(self, script_id: str):
+        """Check if there's an active tunnel for a specific script"""
+        await self._sync()
+        return script_id in self.links
+    
+    async def get_tunnel_url_for_script(self, script_id: str):
+        """Get the tunnel URL for a specific script"""
+        await self._sync()
+        record = self.links.get(script_id)
+        return record.tunnel_url if record else None
+    
+    async def get_complete_url_for_script(self, script_id: str):
+        """Get the complete URL for a specific script"""
+        await self._sync()
+        record = self.links.get(script_id)
+        return record.complete_url if record else None
+    
+    async def get_tunnel_count(self):
+        """Get the number of active tunnels"""
+        await self._sync()
+        return len(self.links)
+    
+    async def clear_all_tunnels(self):
+        """Clear all active tunnels"""
+        self.links.clear()
+        self.registry.clear()
+        await self._commit()
+
+    # Legacy methods for backward compatibility
+    def get_tunnel_info(self):
+        """
+        Get information about the active tunnel (legacy method).
+        Returns the first tunnel if multiple exist.
+        """
+        for record in self.links:
+            return record.to_dict()
+        return None
+
+    def is_tunnel_active(self):
+        """
+        Check if there's an active tunnel (legacy method).
+        """
+        return len(self.links) > 0
+
+    def get_tunnel_url(self):
+        """
+        Get the current tunnel URL (legacy method).
+        Returns the first tunnel URL if multiple exist.
+        """
+        for record in self.links:
+            return record.tunnel_url
+        return None
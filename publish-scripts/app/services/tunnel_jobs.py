@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable
+
+from services.tunnel_backend import WARM_UP_WARMING
+from services.circuit_breaker import CircuitOpenError
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class TunnelJob:
+    """State and progress events of a single tunnel creation job."""
+
+    def __init__(self, script_id: str, timeout_minutes: Optional[int] = None):
+        self.job_id = secrets.token_urlsafe(8)
+        self.script_id = script_id
+        self.timeout_minutes = timeout_minutes
+        self.status = 'pending'
+        self.events = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.on_change: Optional[Callable[["TunnelJob"], None]] = None
+        self._changed = asyncio.Event()
+
+    def is_done(self) -> bool:
+        """Check if the job has finished, successfully or not."""
+        return self.status in ('completed', 'failed')
+
+    def _notify(self):
+        """Wake up everyone waiting for progress on this job."""
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+        if self.on_change:
+            self.on_change(self)
+
+    def update(self, status: str, message: str):
+        """Record a progress step."""
+        self.status = status
+        self.events.append({
+            'status': status,
+            'message': message,
+            'timestamp': time.time()
+        })
+        logger.info(f"Tunnel job {self.job_id} ({self.script_id}): {message}")
+        self._notify()
+
+    def complete(self, result: Dict[str, Any]):
+        """Mark the job as successfully completed."""
+        self.result = result
+        self.status_code = 200
+        self.finished_at = time.time()
+        self.update('completed', result.get('message') or 'Tunnel created')
+
+    def fail(self, status_code: int, error: str):
+        """Mark the job as failed."""
+        self.error = error
+        self.status_code = status_code
+        self.finished_at = time.time()
+        self.update('failed', error)
+
+    async def wait_for_update(self, seen_events: int, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the job has more than seen_events events or is done.
+        Returns False if the timeout expired first.
+        """
+        if len(self.events) > seen_events or self.is_done():
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def wait(self):
+        """Wait until the job is done."""
+        while not self.is_done():
+            await self.wait_for_update(len(self.events))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'script_id': self.script_id,
+            'status': self.status,
+            'message': self.events[-1]['message'] if self.events else None,
+            'events': self.events,
+            'result': self.result,
+            'error': self.error,
+            'status_code': self.status_code,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+class SharedTunnelJob(TunnelJob):
+    """
+    Read-only view of a job running in another worker process.
+    It follows the snapshots the owning worker stores in the job store.
+    """
+
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, data: Dict[str, Any], job_store):
+        super().__init__(data['script_id'])
+        self.job_store = job_store
+        self._apply(data)
+
+    def _apply(self, data: Dict[str, Any]):
+        self.job_id = data['job_id']
+        self.status = data['status']
+        self.events = data['events']
+        self.result = data['result']
+        self.error = data['error']
+        self.status_code = data['status_code']
+        self.created_at = data['created_at']
+        self.finished_at = data['finished_at']
+
+    async def wait_for_update(self, seen_events: int, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else asyncio.get_running_loop().time() + timeout
+        while len(self.events) <= seen_events and not self.is_done():
+            if deadline is not None and asyncio.get_running_loop().time() >= deadline:
+                return False
+            await asyncio.sleep(self.POLL_INTERVAL)
+            data = self.job_store.get_job('tunnel', self.job_id)
+            if data:
+                self._apply(data)
+        return True
+
+class TunnelJobManager:
+    """
+    Runs tunnel creation in the background.
+    The Home Assistant existence check and the tunnel start run in
+    parallel, and callers follow progress through the job instead of holding
+    the request open.
+    """
+
+    def __init__(self, tunnel_backend, script_catalog, port: int, max_jobs: int = 100, job_store=None):
+        self.tunnel_backend = tunnel_backend
+        self.script_catalog = script_catalog
+        self.port = port
+        self.max_jobs = max_jobs
+        self.job_store = job_store  # Shares job progress with other worker processes
+        self._jobs: "OrderedDict[str, TunnelJob]" = OrderedDict()
+
+    def get_job(self, job_id: str) -> Optional[TunnelJob]:
+        """Get a job by its id, including jobs running in other workers."""
+        job = self._jobs.get(job_id)
+        if job is None and self.job_store is not None:
+            data = self.job_store.get_job('tunnel', job_id)
+            if data:
+                return SharedTunnelJob(data, self.job_store)
+        return job
+
+    def _publish(self, job: TunnelJob):
+        """Store the job's progress for the other workers."""
+        self.job_store.put_job('tunnel', job.job_id, job.to_dict())
+
+    def get_active_job_for_script(self, script_id: str) -> Optional[TunnelJob]:
+        """Get the unfinished job for a script, if there is one."""
+        for job in self._jobs.values():
+            if job.script_id == script_id and not job.is_done():
+                return job
+        return None
+
+    def create_job(self, script_id: str, timeout_minutes: Optional[int] = None) -> TunnelJob:
+        """
+        Start a tunnel creation job for a script.
+        If a job for the same script is already running it is returned instead.
+        """
+        existing_job = self.get_active_job_for_script(script_id)
+        if existing_job:
+            return existing_job
+
+        job = TunnelJob(script_id, timeout_minutes)
+        if self.job_store is not None:
+            job.on_change = self._publish
+        self._jobs[job.job_id] = job
+        self._prune()
+        job.update('pending', f"Tunnel creation queued for script {script_id}")
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_jobs."""
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id].is_done():
+                del self._jobs[job_id]
+
+    async def _run(self, job: TunnelJob):
+        """Validate the script and bring up the tunnel concurrently."""
+        script_id = job.script_id
+        job.update('starting', f"Checking script {script_id} and starting the tunnel")
+
+        exists_task = asyncio.create_task(self.script_catalog.script_exists(script_id))
+        # Joins the startup warm-up if it is still running
+        tunnel_task = asyncio.create_task(
+            self.tunnel_backend.ensure_tunnel(self.port)
+        )
+        # The agent is shared by all links, so a start is never wasted; just don't leak its errors
+        tunnel_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+        try:
+            if not await exists_task:
+                job.fail(404, f"Script '{script_id}' not found in Home Assistant. Please check the script ID.")
+                return
+            if self.tunnel_backend.warm_up_state == WARM_UP_WARMING:
+                job.update('waiting_for_tunnel', f"Script {script_id} found, waiting for the tunnel warm-up")
+            else:
+                job.update('waiting_for_tunnel', f"Script {script_id} found, waiting for tunnel")
+
+            try:
+                tunnel_url = await tunnel_task
+            except Exception as e:
+                logger.error(f"❌ Error starting tunnel for script {script_id}: {e}")
+                tunnel_url = None
+            if not tunnel_url:
+                job.fail(500, "Failed to create tunnel. Please check your tunnel configuration.")
+                return
+
+            # tunnel_backend.add_tunnel generates the unique hash and complete_url
+            link = await self.tunnel_backend.add_tunnel(
+                script_id, tunnel_url,
+                timeout_minutes=job.timeout_minutes,
+                created_at=time.time()
+            )
+            complete_url = link.complete_url
+
+            logger.info(f"✅ Created tunnel for script {script_id}: {tunnel_url}")
+            logger.info(f"🔗 Complete URL: {complete_url}")
+            logger.info(f"📡 Forwarding to port: {self.port}")
+
+            job.complete({
+                'success': True,
+                'message': f"Tunnel created successfully for script {script_id}",
+                'tunnel_url': tunnel_url,
+                'complete_url': complete_url,
+                'script_id': script_id
+            })
+        except CircuitOpenError as e:
+            logger.warning(f"⚠️  Cannot create tunnel for script {script_id}: {e}")
+            job.fail(503, str(e))
+        except Exception as e:
+            logger.error(f"❌ Error creating tunnel: {e}")
+            job.fail(500, "Internal server error while creating tunnel")
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, List, Any
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    script_id TEXT PRIMARY KEY,
+    unique_hash TEXT NOT NULL UNIQUE,
+    tunnel_url TEXT,
+    complete_url TEXT,
+    created_at REAL,
+    expires_at REAL
+)
+"""
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+# Job snapshots older than this are pruned
+JOB_RETENTION_SECONDS = 3600
+
+COLUMNS = ('script_id', 'unique_hash', 'tunnel_url', 'complete_url', 'created_at', 'expires_at')
+
+class TunnelRegistry:
+    """
+    On-disk registry of published links, so URLs survive restarts.
+    Links are stored in SQLite in WAL mode. Changes are collected in memory
+    and written in one transaction every flush_interval seconds, so a burst
+    of link changes costs a single write to the SD card.
+
+    With write_through, the caller awaits flush() after every change
+    instead, so other worker processes sharing the file see it on their
+    next lookup.
+
+    Each thread gets its own connection, so a flush running in a worker
+    thread never shares a transaction with reads on the event loop. Job
+    snapshots live in a separate file next to the links: they change far
+    more often, and other workers reload every link whenever the links file
+    changes.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 2.0, write_through: bool = False):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.write_through = write_through
+        self.enabled = bool(path) and os.path.isdir(os.path.dirname(os.path.abspath(path)))
+        base, ext = os.path.splitext(path)
+        self.jobs_path = f"{base}-jobs{ext or '.db'}"
+        self._local = threading.local()  # Per-thread connections
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._pending: Dict[str, Optional[Dict[str, Any]]] = {}  # script_id -> record, None to delete
+        self._clear_pending = False
+        self._dirty = asyncio.Event()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+        if self.enabled:
+            logger.info(f"✅ Tunnel registry at {path}")
+        else:
+            logger.warning(f"⚠️  Tunnel registry disabled, links will not survive restarts (path: {path or 'not set'})")
+
+    def _open(self, path: str, schema: str) -> sqlite3.Connection:
+        # Only the calling thread uses the connection; close() may run elsewhere once it is idle
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(schema)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection to the links file."""
+        conn = getattr(self._local, 'links', None)
+        if conn is None:
+            conn = self._local.links = self._open(self.path, SCHEMA)
+        return conn
+
+    def _connect_jobs(self) -> sqlite3.Connection:
+        """Get this thread's connection to the job snapshots file."""
+        conn = getattr(self._local, 'jobs', None)
+        if conn is None:
+            conn = self._local.jobs = self._open(self.jobs_path, JOBS_SCHEMA)
+        return conn
+
+    def data_version(self) -> Optional[int]:
+        """
+        Get a number that changes whenever another connection commits to the file.
+        It is read from the WAL index in shared memory without touching the
+        database pages, so it is cheap enough to call on the event loop for
+        every lookup.
+        """
+        if not self.enabled:
+            return None
+        try:
+            return self._connect().execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"❌ Failed to read tunnel registry version: {e}")
+            return None
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Read every stored link. Blocking; call it off the event loop."""
+        if not self.enabled:
+            return []
+        try:
+            rows = self._connect().execute(f"SELECT {', '.join(COLUMNS)} FROM links").fetchall()
+            return [dict(zip(COLUMNS, row)) for row in rows]
+        except sqlite3.Error as e:
+            logger.error(f"❌ Failed to load tunnel registry: {e}")
+            return []
+
+    def put(self, record: Dict[str, Any]):
+        """Queue a link to be stored."""
+        if self.enabled:
+            self._pending[record['script_id']] = record
+            self._changed()
+
+    def delete(self, script_id: str):
+        """Queue a link to be removed."""
+        if self.enabled:
+            self._pending[script_id] = None
+            self._changed()
+
+    def clear(self):
+        """Queue the removal of every link."""
+        if self.enabled:
+            self._pending.clear()
+            self._clear_pending = True
+            self._changed()
+
+    def _changed(self):
+        """Wake the flush task. In write-through mode the caller flushes right away instead."""
+        if not self.write_through:
+            self._dirty.set()
+
+    def put_job(self, kind: str, job_id: str, data: Dict[str, Any]):
+        """Store a snapshot of a background job so any worker can report on it."""
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            conn = self._connect_jobs()
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, kind, data, updated_at) VALUES (?, ?, ?, ?)",
+                (job_id, kind, json.dumps(data), now)
+            )
+            conn.execute("DELETE FROM jobs WHERE updated_at < ?", (now - JOB_RETENTION_SECONDS,))
+        except sqlite3.Error as e:
+            logger.error(f"❌ Failed to store {kind} job {job_id}: {e}")
+
+    def get_job(self, kind: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get the latest snapshot of a background job stored by any worker."""
+        if not self.enabled:
+            return None
+        try:
+            row = self._connect_jobs().execute(
+                "SELECT data FROM jobs WHERE job_id = ? AND kind = ?", (job_id, kind)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"❌ Failed to read {kind} job {job_id}: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def _write(self, changes: Dict[str, Optional[Dict[str, Any]]], clear: bool):
+        """Apply a batch of changes in a single transaction."""
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            if clear:
+                conn.execute("DELETE FROM links")
+            for script_id, record in changes.items():
+                if record is None:
+                    conn.execute("DELETE FROM links WHERE script_id = ?", (script_id,))
+                else:
+                    conn.execute(
+                        f"INSERT OR REPLACE INTO links ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                        tuple(record.get(column) for column in COLUMNS)
+                    )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def flush(self):
+        """Write all queued changes to disk."""
+        if not self.enabled:
+            return
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._pending and not self._clear_pending:
+                return
+            changes, self._pending = self._pending, {}
+            clear, self._clear_pending = self._clear_pending, False
+            try:
+                await asyncio.to_thread(self._write, changes, clear)
+            except Exception as e:
+                logger.error(f"❌ Failed to write tunnel registry: {e}")
+                if self._clear_pending:
+                    # Cleared while writing: the failed changes are stale
+                    logger.info("Tunnel registry was cleared during the failed write, dropping its changes.")
+                else:
+                    # Keep the changes for the next flush unless newer ones replaced them
+                    for script_id, record in changes.items():
+                        self._pending.setdefault(script_id, record)
+                    self._clear_pending = clear
+                self._dirty.set()
+
+    async def _run(self):
+        """Flush queued changes in batches."""
+        try:
+            while True:
+                await self._dirty.wait()
+                await asyncio.sleep(self.flush_interval)
+                self._dirty.clear()
+                await self.flush()
+        except asyncio.CancelledError:
+            logger.info("Tunnel registry flush task cancelled.")
+            raise
+
+    def start(self):
+        """Start the background flush task."""
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the flush task, write what is left and close the database."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+        await self.flush()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
@@ -1,19 +1,130 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
 from pydantic import Field
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, PydanticBaseSettingsSource
+
+# Add-on options written by the Home Assistant supervisor
+OPTIONS_PATH = os.getenv("OPTIONS_PATH", "/data/options.json")
+
+# Local development overrides, next to the app folder
+ENV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+
+class AddonOptionsSource(PydanticBaseSettingsSource):
+    """
+    Settings from the supervisor's options.json, keyed by the upper-case names.
+    Read on every load so an edited configuration is picked up without a restart.
+    """
+
+    def get_field_value(self, field, field_name):
+        # Values are read all at once in __call__
+        return None, field_name, False
+
+    def __call__(self) -> Dict[str, Any]:
+        try:
+            with open(OPTIONS_PATH, encoding="utf-8") as options_file:
+                options = json.load(options_file)
+        except OSError:
+            # Not running under the supervisor
+            return {}
+        # A malformed file raises, so a reload keeps the current snapshot instead of dropping options
+        if not isinstance(options, dict):
+            raise ValueError(f"{OPTIONS_PATH} does not contain a JSON object")
+        aliases = {field.alias for field in self.settings_cls.model_fields.values()}
+        return {key: value for key, value in options.items() if key in aliases and value is not None}
 
 
 class Settings(BaseSettings):
     hassio_token: str = Field(default="", description="Home Assistant token", alias="HASSIO_TOKEN")
     ha_base_url: str = Field(default="http://supervisor/core/api", description="Home Assistant URL", alias="HA_BASE_URL")
+    ha_websocket_url: str = Field(default="", description="Home Assistant websocket URL (derived from HA_BASE_URL when empty)", alias="HA_WEBSOCKET_URL")
     ngrok_auth_token: str = Field(default="", description="Ngrok authentication token", alias="NGROK_AUTH_TOKEN")
+    ngrok_bin: str = Field(default="ngrok", description="Command used to start the ngrok agent", alias="NGROK_BIN")
+    ngrok_api_url: str = Field(default="http://localhost:4040/api", description="Local API of the ngrok agent", alias="NGROK_API_URL")
+    agent_log_buffer_size: int = Field(default=500, ge=1, description="Lines of ngrok agent output kept for /tunnels/agent-logs", alias="AGENT_LOG_BUFFER_SIZE")
+    tunnel_backend: str = Field(default="ngrok", description="How published links are exposed: ngrok or local (built-in LAN reverse proxy)", alias="TUNNEL_BACKEND")
+    local_proxy_host: str = Field(default="0.0.0.0", description="Interface the local reverse proxy listens on", alias="LOCAL_PROXY_HOST")
+    local_proxy_port: int = Field(default=8098, description="Port the local reverse proxy listens on", alias="LOCAL_PROXY_PORT")
+    local_public_url: str = Field(default="", description="Base URL clients use to reach the local reverse proxy (derived from LOCAL_PROXY_PORT when empty)", alias="LOCAL_PUBLIC_URL")
     port: int = Field(default=8099, description="Port for the FastAPI app and ngrok tunnel to forward to", alias="PORT")
+    web_workers: int = Field(default=1, ge=1, description="Number of worker processes serving the app; with more than one, links are shared through the tunnel registry while rate limits, metrics and run deduplication stay per worker", alias="WEB_WORKERS")
+    ha_request_timeout: float = Field(default=10.0, gt=0, description="Timeout in seconds for each Home Assistant API call", alias="HA_REQUEST_TIMEOUT")
+    ha_max_connections: int = Field(default=10, ge=1, description="Maximum pooled keep-alive connections to Home Assistant", alias="HA_MAX_CONNECTIONS")
+    ha_max_concurrency: int = Field(default=8, ge=1, description="Maximum concurrent in-flight Home Assistant API calls", alias="HA_MAX_CONCURRENCY")
+    ha_retry_attempts: int = Field(default=2, ge=0, description="Extra attempts for failed Home Assistant GET calls", alias="HA_RETRY_ATTEMPTS")
+    ha_retry_backoff: float = Field(default=0.2, ge=0, description="Base delay in seconds for the jittered backoff between retries", alias="HA_RETRY_BACKOFF")
+    ha_retry_max_backoff: float = Field(default=2.0, ge=0, description="Maximum delay in seconds between retries", alias="HA_RETRY_MAX_BACKOFF")
+    ha_breaker_failure_rate: float = Field(default=0.5, gt=0, le=1, description="Share of failed or slow Home Assistant calls that opens the circuit breaker", alias="HA_BREAKER_FAILURE_RATE")
+    ha_breaker_slow_call_seconds: float = Field(default=5.0, gt=0, description="Home Assistant calls slower than this count as failures for the circuit breaker", alias="HA_BREAKER_SLOW_CALL_SECONDS")
+    ha_breaker_window: int = Field(default=20, ge=1, description="Number of recent Home Assistant calls the circuit breaker looks at", alias="HA_BREAKER_WINDOW")
+    ha_breaker_min_calls: int = Field(default=5, ge=1, description="Minimum calls in the window before the circuit breaker can open", alias="HA_BREAKER_MIN_CALLS")
+    ha_breaker_open_seconds: float = Field(default=30.0, gt=0, description="Seconds the circuit breaker fails fast before trying Home Assistant again", alias="HA_BREAKER_OPEN_SECONDS")
+    ha_probe_interval: float = Field(default=15.0, gt=0, description="Seconds between background Home Assistant connectivity checks", alias="HA_PROBE_INTERVAL")
+    ha_probe_timeout: float = Field(default=5.0, gt=0, description="Timeout in seconds for each Home Assistant connectivity check", alias="HA_PROBE_TIMEOUT")
+    tunnel_registry_path: str = Field(default="/data/tunnels.db", description="SQLite file persisting published links (empty to disable)", alias="TUNNEL_REGISTRY_PATH")
+    tunnel_registry_flush_interval: float = Field(default=2.0, gt=0, description="Seconds between batched writes to the tunnel registry", alias="TUNNEL_REGISTRY_FLUSH_INTERVAL")
+    script_dedup_window: float = Field(default=0, ge=0, description="Seconds a finished script run is shared with repeated triggers of the same script; off by default, so only runs still in flight are shared", alias="SCRIPT_DEDUP_WINDOW")
+    run_queue_workers: int = Field(default=4, ge=1, description="Workers executing asynchronous /run calls", alias="RUN_QUEUE_WORKERS")
+    run_queue_max_size: int = Field(default=100, ge=1, description="Maximum asynchronous /run calls waiting for a worker", alias="RUN_QUEUE_MAX_SIZE")
+    batch_run_concurrency: int = Field(default=5, ge=1, description="Maximum scripts of one batch run executing at the same time", alias="BATCH_RUN_CONCURRENCY")
+    run_response_mode: str = Field(default="full", description="Body returned by the run endpoints: full echoes the Home Assistant result, lean returns a small fixed-shape body", alias="RUN_RESPONSE_MODE")
+    batch_run_max_scripts: int = Field(default=50, ge=1, description="Maximum scripts accepted in one batch run", alias="BATCH_RUN_MAX_SCRIPTS")
+    slow_request_threshold_ms: float = Field(default=500, ge=0, description="Requests slower than this are kept for /debug/slow", alias="SLOW_REQUEST_THRESHOLD_MS")
+    slow_request_buffer_size: int = Field(default=100, ge=1, description="Number of slow requests kept for /debug/slow", alias="SLOW_REQUEST_BUFFER_SIZE")
+    run_rate_limit_per_link: float = Field(default=30, ge=0, description="Calls per minute allowed for each published link (0 to disable)", alias="RUN_RATE_LIMIT_PER_LINK")
+    run_rate_limit_link_burst: int = Field(default=10, ge=1, description="Calls a published link may burst above its rate", alias="RUN_RATE_LIMIT_LINK_BURST")
+    run_rate_limit_per_client: float = Field(default=60, ge=0, description="Calls per minute allowed for each client IP on /run (0 to disable)", alias="RUN_RATE_LIMIT_PER_CLIENT")
+    run_rate_limit_client_burst: int = Field(default=20, ge=1, description="Calls a client IP may burst above its rate", alias="RUN_RATE_LIMIT_CLIENT_BURST")
+    rate_limit_max_keys: int = Field(default=10000, ge=1, description="Maximum links or clients tracked by each rate limiter", alias="RATE_LIMIT_MAX_KEYS")
+    settings_reload_interval: float = Field(default=5.0, ge=0, description="Seconds between checks of options.json and .env for changes (0 to disable live reload)", alias="SETTINGS_RELOAD_INTERVAL")
 
     class Config:
-        # Get the current file's directory and use parent directory for .env
-        import os
-        env_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+        # Use the .env file in the parent directory of the app folder
+        env_file = ENV_FILE
         env_file_encoding = "utf-8"
+        # One snapshot is shared by the whole app, so it must not change under its readers
+        frozen = True
+
+    @classmethod
+    def settings_customise_sources(cls, settings_cls, init_settings, env_settings, dotenv_settings, file_secret_settings):
+        # The add-on configuration wins over the environment, which run.sh only fills at startup
+        return init_settings, AddonOptionsSource(settings_cls), env_settings, dotenv_settings, file_secret_settings
+
+
+_snapshot: Optional[Settings] = None
+_snapshot_lock = threading.Lock()
+
+def get_settings(**overrides) -> Settings:
+    """
+    Get the shared settings snapshot, loading it on first use.
+    Overrides build a separate instance that is not cached.
+    """
+    global _snapshot
+    if overrides:
+        return Settings(**overrides)
+    snapshot = _snapshot
+    if snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = Settings()
+            snapshot = _snapshot
+    return snapshot
 
+def reload_settings() -> Tuple[Settings, Settings]:
+    """
+    Re-read every source and swap in the new snapshot.
+    Returns the previous and the new snapshot. If loading fails the
+    current snapshot is kept and the error is raised.
+    """
+    global _snapshot
+    new_settings = Settings()
+    with _snapshot_lock:
+        old_settings = _snapshot or new_settings
+        _snapshot = new_settings
+    return old_settings, new_settings
 
-def get_settings(**overrides):
-    return Settings(**overrides)
\ No newline at end of file
+def get_settings_files() -> List[str]:
+    """Get the files settings are loaded from."""
+    return [OPTIONS_PATH, ENV_FILE]
\ No newline at end of file
@@ -0,0 +1,301 @@
+"""
+Offline benchmark for the add-on.
+
+Starts the fake supervisor (devtools/fake_ha.py), the app with the fake ngrok
+agent (devtools/fake_ngrok.py) as its agent binary, then drives the hot
+endpoints at a fixed concurrency:
+
+    run             GET    /run/{unique_hash}     (links for 2x concurrency scripts, round-robin)
+    scripts         GET    /scripts/
+    tunnels_create  POST   /tunnels/create        (a new link per request)
+    tunnels_delete  DELETE /tunnels/              (one link is created before each timed delete)
+
+For every scenario it reports p50/p95/p99 latency, throughput and errors,
+and compares them against a stored baseline:
+
+    python devtools/bench.py --save-baseline                  # record devtools/bench_baseline.json
+    python devtools/bench.py --ha-latency-ms 50 --concurrency 32
+    python devtools/bench.py --scenarios run,scripts --requests 2000
+
+The exit code is 1 when a scenario regressed by more than --tolerance percent
+(p95 latency up or throughput down), so it can gate changes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Awaitable, Dict, List, Optional
+
+import httpx
+
+DEVTOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(DEVTOOLS_DIR), "app")
+DEFAULT_BASELINE = os.path.join(DEVTOOLS_DIR, "bench_baseline.json")
+SCENARIOS = ("run", "scripts", "tunnels_create", "tunnels_delete")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: List[float], errors: int, wall: float) -> Dict[str, float]:
+    values = sorted(latencies)
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "rps": round((len(values) + errors) / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(values) * 1000, 2) if values else 0.0
+    }
+
+
+async def drive(total: int, concurrency: int, operation: Callable[[int], Awaitable[Optional[float]]]) -> Dict[str, float]:
+    """
+    Run operation(i) for i in range(total) with at most `concurrency` in flight.
+    operation returns the latency to record, or None for a failed request.
+    """
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            try:
+                latency = await operation(i)
+            except httpx.HTTPError:
+                latency = None
+            if latency is None:
+                errors += 1
+            else:
+                latencies.append(latency)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def timed(request: Awaitable[httpx.Response]) -> Optional[float]:
+    started = time.perf_counter()
+    response = await request
+    latency = time.perf_counter() - started
+    return latency if response.is_success else None
+
+
+async def create_link(client: httpx.AsyncClient, script_id: str) -> Optional[str]:
+    """Create a link and return its hash."""
+    response = await client.post("/tunnels/create", params={"wait": "true"}, json={"script_id": script_id})
+    if not response.is_success:
+        return None
+    return response.json()["complete_url"].rsplit("/", 1)[1]
+
+
+async def run_scenarios(args) -> Dict[str, Dict[str, float]]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.app_port}", limits=limits, timeout=60) as client:
+        script_ids = [f"script.fake_script_{i}" for i in range(args.scripts)]
+
+        for scenario in args.scenarios:
+            await client.delete("/tunnels/")
+
+            if scenario == "run":
+                # More links than requests in flight, so concurrent runs never target the same script
+                hashes = [await create_link(client, script_id) for script_id in script_ids[:max(10, args.concurrency * 2)]]
+                hashes = [unique_hash for unique_hash in hashes if unique_hash]
+                if not hashes:
+                    print("run: could not create links, skipping")
+                    continue
+                operation = lambda i: timed(client.get(f"/run/{hashes[i % len(hashes)]}"))
+                total = args.requests
+            elif scenario == "scripts":
+                operation = lambda i: timed(client.get("/scripts/"))
+                total = args.requests
+            elif scenario == "tunnels_create":
+                operation = lambda i: timed(client.post(
+                    "/tunnels/create", params={"wait": "true"}, json={"script_id": script_ids[i]}
+                ))
+                total = min(args.requests, len(script_ids))
+            elif scenario == "tunnels_delete":
+                async def operation(i):
+                    if not await create_link(client, script_ids[i % len(script_ids)]):
+                        return None
+                    return await timed(client.delete("/tunnels/"))
+                total = min(args.requests, 200)
+            else:
+                raise SystemExit(f"Unknown scenario: {scenario}")
+
+            # Warm up connections and caches before timing the read-only scenarios
+            if scenario in ("run", "scripts"):
+                await drive(min(args.concurrency, total), args.concurrency, operation)
+            results[scenario] = await drive(total, args.concurrency, operation)
+            print(format_row(scenario, results[scenario]), flush=True)
+
+        await client.delete("/tunnels/")
+    return results
+
+
+def format_row(name: str, result: Dict[str, float], baseline: Optional[Dict[str, float]] = None) -> str:
+    row = (f"{name:<16}{result['requests']:>8}{result['errors']:>7}{result['rps']:>10}"
+           f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}")
+    if baseline:
+        row += f"   p95 {change(result['p95_ms'], baseline['p95_ms']):>7}  rps {change(result['rps'], baseline['rps']):>7}"
+    return row
+
+
+def change(value: float, base: float) -> str:
+    if not base:
+        return "n/a"
+    return f"{(value - base) / base * 100:+.1f}%"
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """List the scenarios that regressed beyond tolerance percent."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["p95_ms"] and result["p95_ms"] > base["p95_ms"] * (1 + tolerance / 100):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {result['p95_ms']}ms")
+        if base["rps"] and result["rps"] < base["rps"] * (1 - tolerance / 100):
+            regressions.append(f"{name}: rps {base['rps']} -> {result['rps']}")
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {result['errors']}")
+    return regressions
+
+
+def wait_for_http(url: str, timeout: float, process: subprocess.Popen):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Process for {url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+def start_stack(args) -> List[subprocess.Popen]:
+    """Start the fake supervisor and the app (which starts the fake agent itself)."""
+    output = None if args.verbose else subprocess.DEVNULL
+    fake_ha = subprocess.Popen(
+        [sys.executable, os.path.join(DEVTOOLS_DIR, "fake_ha.py"), "--port", str(args.ha_port),
+         "--scripts", str(args.scripts), "--entities", str(args.entities), "--latency-ms", str(args.ha_latency_ms)],
+        stdout=output, stderr=output
+    )
+    wait_for_http(f"http://127.0.0.1:{args.ha_port}/api/", 15, fake_ha)
+
+    env = dict(
+        os.environ,
+        HASSIO_TOKEN="bench",
+        HA_BASE_URL=f"http://127.0.0.1:{args.ha_port}/api",
+        NGROK_AUTH_TOKEN="bench",
+        NGROK_BIN=f"{sys.executable} {os.path.join(DEVTOOLS_DIR, 'fake_ngrok.py')} --api-port {args.agent_port}",
+        NGROK_API_URL=f"http://127.0.0.1:{args.agent_port}/api",
+        TUNNEL_REGISTRY_PATH="",
+        RUN_RATE_LIMIT_PER_LINK="0",
+        RUN_RATE_LIMIT_PER_CLIENT="0",
+        # The run scenario cycles through a few links; deduplication would answer most runs from its cache
+        SCRIPT_DEDUP_WINDOW=str(args.dedup_window),
+        PORT=str(args.app_port)
+    )
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port), "--log-level", "warning"],
+        cwd=APP_DIR, env=env, stdout=output, stderr=output
+    )
+    wait_for_http(f"http://127.0.0.1:{args.app_port}/health/", 60, app)
+    return [app, fake_ha]
+
+
+def stop_stack(processes: List[subprocess.Popen]):
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against the fake supervisor and ngrok agent")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--ha-latency-ms", type=float, default=20, help="Latency of every fake supervisor response")
+    parser.add_argument("--scripts", type=int, default=200, help="Scripts served by the fake supervisor")
+    parser.add_argument("--entities", type=int, default=2000, help="Non-script entities served by the fake supervisor")
+    parser.add_argument("--dedup-window", type=float, default=0, help="SCRIPT_DEDUP_WINDOW of the app; 0 so repeated runs are not answered from the dedup cache")
+    parser.add_argument("--app-port", type=int, default=8199)
+    parser.add_argument("--ha-port", type=int, default=8124)
+    parser.add_argument("--agent-port", type=int, default=4041)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=20, help="Allowed regression in percent")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the fake supervisor and the app")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+
+    print(f"HA latency {args.ha_latency_ms}ms, {args.scripts} scripts, {args.entities} entities, "
+          f"concurrency {args.concurrency}")
+    print(f"{'scenario':<16}{'requests':>8}{'errors':>7}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+
+    processes = start_stack(args)
+    try:
+        results = asyncio.run(run_scenarios(args))
+    finally:
+        stop_stack(processes)
+
+    report = {
+        "config": {key: getattr(args, key) for key in ("requests", "concurrency", "ha_latency_ms", "scripts", "entities", "dedup_window")},
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != report["config"]:
+        print(f"Note: baseline was recorded with {baseline.get('config')}")
+
+    print("\nCompared to baseline:")
+    for name, result in results.items():
+        print(format_row(name, result, baseline["results"].get(name)))
+
+    regressions = compare(results, baseline["results"], args.tolerance)
+    if regressions:
+        print(f"\nRegressions beyond {args.tolerance}%:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.tolerance}%")
+
+
+if __name__ == "__main__":
+    main()
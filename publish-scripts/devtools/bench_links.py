@@ -0,0 +1,115 @@
+"""
+In-process benchmark for the link store behind published links.
+
+Fills a LinkStore with N links (half of them expiring), then measures:
+
+    insert      LinkStore.put for every link
+    lookup      LinkStore.get_by_hash, the lookup on the /run path
+    extend      LinkStore.set_expiry, which reindexes the deadline
+    remove      LinkStore.remove for every link
+
+and the memory each link costs (record, both indexes and its deadline),
+measured with tracemalloc. No server is started:
+
+    python devtools/bench_links.py
+    python devtools/bench_links.py --links 10000,50000,100000
+"""
+import argparse
+import gc
+import os
+import secrets
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+DEVTOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(DEVTOOLS_DIR), "app"))
+
+from services.expiry_scheduler import ExpiryScheduler  # noqa: E402
+from services.link_store import LinkRecord, LinkStore  # noqa: E402
+
+TUNNEL_URL = "https://0123456789ab.ngrok-free.app"
+
+
+async def _never(script_id: str):
+    pass
+
+
+def make_records(count: int) -> List[LinkRecord]:
+    now = time.time()
+    records = []
+    for i in range(count):
+        unique_hash = secrets.token_urlsafe(12)[:12]
+        records.append(LinkRecord(
+            f"script.bench_{i}",
+            unique_hash,
+            tunnel_url=TUNNEL_URL,
+            complete_url=f"{TUNNEL_URL}/run/{unique_hash}",
+            created_at=now,
+            expires_at=now + 3600 + i if i % 2 else None
+        ))
+    return records
+
+
+def per_op_ns(elapsed: float, ops: int) -> float:
+    return round(elapsed / ops * 1e9, 1)
+
+
+def bench(count: int, lookups: int) -> Dict[str, float]:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = make_records(count)
+    store = LinkStore(ExpiryScheduler(_never))
+
+    started = time.perf_counter()
+    for record in records:
+        store.put(record)
+    insert = time.perf_counter() - started
+    bytes_per_link = (tracemalloc.get_traced_memory()[0] - before) / count
+    tracemalloc.stop()
+
+    hashes = [record.unique_hash for record in records]
+    probes = [hashes[i % count] for i in range(lookups)]
+    started = time.perf_counter()
+    for unique_hash in probes:
+        store.get_by_hash(unique_hash)
+    lookup = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for record in records:
+        store.set_expiry(record.script_id, record.created_at + 7200)
+    extend = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for record in records:
+        store.remove(record.script_id)
+    remove = time.perf_counter() - started
+    assert len(store) == 0 and store.get_by_hash(hashes[0]) is None
+
+    return {
+        "links": count,
+        "insert_ns": per_op_ns(insert, count),
+        "lookup_ns": per_op_ns(lookup, lookups),
+        "extend_ns": per_op_ns(extend, count),
+        "remove_ns": per_op_ns(remove, count),
+        "bytes_per_link": round(bytes_per_link)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the published link store")
+    parser.add_argument("--links", default="1000,10000,50000", help="Comma-separated store sizes")
+    parser.add_argument("--lookups", type=int, default=200000, help="Hash lookups per size")
+    args = parser.parse_args()
+
+    columns = ("links", "insert_ns", "lookup_ns", "extend_ns", "remove_ns", "bytes_per_link")
+    print("  ".join(f"{column:>14}" for column in columns))
+    for count in (int(value) for value in args.links.split(",")):
+        result = bench(count, args.lookups)
+        print("  ".join(f"{result[column]:>14}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Local stand-in for the Home Assistant REST and websocket APIs.
+
+Serves enough of the API for the add-on to run offline:
+
+    GET    /api/                              ping
+    GET    /api/states                        all entity states
+    GET    /api/states/{entity_id}            a single state
+    POST   /api/services/{domain}/{service}   call a service
+    WS     /api/websocket                     auth + subscribe_events(state_changed)
+
+Test-only helpers to drive state changes over the websocket:
+
+    POST   /fake/states/{entity_id}           set a state ({"state": ..., "attributes": {...}})
+    DELETE /fake/states/{entity_id}           remove an entity
+
+Usage:
+    python devtools/fake_ha.py --port 8123 --scripts 50 --entities 2000 --latency-ms 20
+    HA_BASE_URL=http://localhost:8123/api HASSIO_TOKEN=dev python app/main.py
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger("fake_ha")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeHomeAssistant:
+    """In-memory Home Assistant state machine with a websocket event bus."""
+
+    def __init__(self, scripts: int = 20, entities: int = 200, latency_ms: float = 0.0,
+                 token: Optional[str] = None):
+        self.latency = latency_ms / 1000.0
+        self.token = token
+        self.states = {}
+        self.service_calls = []
+        self._subscribers = set()
+
+        for i in range(scripts):
+            self.set_state(f"script.fake_script_{i}", "off", {"friendly_name": f"Fake Script {i}"}, notify=False)
+        for i in range(max(entities - scripts, 0)):
+            self.set_state(f"sensor.fake_sensor_{i}", str(i), {
+                "friendly_name": f"Fake Sensor {i}",
+                "unit_of_measurement": "°C",
+                "device_class": "temperature"
+            }, notify=False)
+
+    def set_state(self, entity_id: str, state: str, attributes: Optional[dict] = None, notify: bool = True):
+        old_state = self.states.get(entity_id)
+        now = _now()
+        new_state = {
+            "entity_id": entity_id,
+            "state": state,
+            "attributes": attributes or {},
+            "last_changed": now,
+            "last_updated": now,
+            "context": {"id": "fake", "parent_id": None, "user_id": None}
+        }
+        self.states[entity_id] = new_state
+        if notify:
+            self._broadcast(entity_id, old_state, new_state)
+        return new_state
+
+    def remove_state(self, entity_id: str) -> bool:
+        old_state = self.states.pop(entity_id, None)
+        if old_state is None:
+            return False
+        self._broadcast(entity_id, old_state, None)
+        return True
+
+    def _broadcast(self, entity_id: str, old_state: Optional[dict], new_state: Optional[dict]):
+        event = {
+            "event_type": "state_changed",
+            "data": {"entity_id": entity_id, "old_state": old_state, "new_state": new_state},
+            "origin": "LOCAL",
+            "time_fired": _now()
+        }
+        for queue, subscription_id in list(self._subscribers):
+            queue.put_nowait({"id": subscription_id, "type": "event", "event": event})
+
+    def _authorized(self, token: Optional[str]) -> bool:
+        return bool(token) and (self.token is None or token == self.token)
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    # REST API
+
+    async def ping(self, request: Request):
+        await self._delay()
+        return JSONResponse({"message": "API running."})
+
+    async def get_states(self, request: Request):
+        await self._delay()
+        return JSONResponse(list(self.states.values()))
+
+    async def get_state(self, request: Request):
+        await self._delay()
+        state = self.states.get(request.path_params["entity_id"])
+        if state is None:
+            return JSONResponse({"message": "Entity not found."}, status_code=404)
+        return JSONResponse(state)
+
+    async def call_service(self, request: Request):
+        await self._delay()
+        domain = request.path_params["domain"]
+        service = request.path_params["service"]
+        data = await request.json() if await request.body() else {}
+        self.service_calls.append({"domain": domain, "service": service, "data": data})
+
+        entity_id = data.get("entity_id")
+        if domain == "script" and service == "turn_on" and entity_id in self.states:
+            attributes = self.states[entity_id]["attributes"]
+            return JSONResponse([self.set_state(entity_id, "off", dict(attributes, last_triggered=_now()))])
+        return JSONResponse([])
+
+    async def fake_set_state(self, request: Request):
+        body = await request.json()
+        state = self.set_state(request.path_params["entity_id"], body.get("state", "off"), body.get("attributes"))
+        return JSONResponse(state)
+
+    async def fake_remove_state(self, request: Request):
+        removed = self.remove_state(request.path_params["entity_id"])
+        return JSONResponse({"removed": removed}, status_code=200 if removed else 404)
+
+    # Websocket API
+
+    async def websocket(self, websocket: WebSocket):
+        await websocket.accept()
+        await websocket.send_json({"type": "auth_required", "ha_version": "fake"})
+
+        auth = await websocket.receive_json()
+        if auth.get("type") != "auth" or not self._authorized(auth.get("access_token")):
+            await websocket.send_json({"type": "auth_invalid", "message": "Invalid access token"})
+            await websocket.close()
+            return
+        await websocket.send_json({"type": "auth_ok", "ha_version": "fake"})
+
+        queue: asyncio.Queue = asyncio.Queue()
+        subscriptions = []
+
+        async def sender():
+            while True:
+                await websocket.send_json(await queue.get())
+
+        sender_task = asyncio.create_task(sender())
+        try:
+            while True:
+                message = await websocket.receive_json()
+                message_id = message.get("id")
+                if message.get("type") == "subscribe_events" and message.get("event_type") in ("state_changed", None):
+                    entry = (queue, message_id)
+                    self._subscribers.add(entry)
+                    subscriptions.append(entry)
+                    queue.put_nowait({"id": message_id, "type": "result", "success": True, "result": None})
+                elif message.get("type") == "ping":
+                    queue.put_nowait({"id": message_id, "type": "pong"})
+                else:
+                    queue.put_nowait({"id": message_id, "type": "result", "success": False,
+                                      "error": {"code": "unknown_command", "message": "Unknown command."}})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for entry in subscriptions:
+                self._subscribers.discard(entry)
+            sender_task.cancel()
+
+    def create_app(self) -> Starlette:
+        fake = self
+
+        async def check_auth(request: Request, call_next):
+            if request.url.path.startswith("/api/") and request.url.path != "/api/websocket":
+                header = request.headers.get("authorization", "")
+                if not fake._authorized(header.removeprefix("Bearer ").strip()):
+                    return JSONResponse({"message": "Unauthorized"}, status_code=401)
+            return await call_next(request)
+
+        return Starlette(
+            routes=[
+                Route("/api/", self.ping),
+                Route("/api/states", self.get_states),
+                Route("/api/states/{entity_id}", self.get_state),
+                Route("/api/services/{domain}/{service}", self.call_service, methods=["POST"]),
+                Route("/fake/states/{entity_id}", self.fake_set_state, methods=["POST"]),
+                Route("/fake/states/{entity_id}", self.fake_remove_state, methods=["DELETE"]),
+                WebSocketRoute("/api/websocket", self.websocket),
+            ],
+            middleware=[Middleware(BaseHTTPMiddleware, dispatch=check_auth)]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Home Assistant API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--scripts", type=int, default=20, help="Number of script entities")
+    parser.add_argument("--entities", type=int, default=200, help="Total number of entities")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latency added to every REST call")
+    parser.add_argument("--token", default=None, help="Only accept this token (any token when omitted)")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeHomeAssistant(args.scripts, args.entities, args.latency_ms, args.token)
+    logger.info(f"Serving {len(fake.states)} entities on http://{args.host}:{args.port}/api")
+    uvicorn.run(fake.create_app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
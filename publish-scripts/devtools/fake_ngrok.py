@@ -0,0 +1,159 @@
+"""
+Local stand-in for the ngrok agent and its API.
+
+Serves the subset of the agent API used by NgrokManager:
+
+    GET    /api/tunnels          list tunnels
+    POST   /api/tunnels          open a tunnel ({"name": ..., "proto": "http", "addr": "8099"})
+    GET    /api/tunnels/{name}   a single tunnel
+    DELETE /api/tunnels/{name}   close a tunnel
+
+It accepts (and ignores) the usual ngrok command line arguments and logs in
+ngrok's logfmt format on stdout, so it can stand in for the real binary:
+
+    NGROK_BIN="python devtools/fake_ngrok.py" NGROK_AUTH_TOKEN=dev python app/main.py
+
+Or run it on its own and let the add-on adopt it:
+
+    python devtools/fake_ngrok.py --api-port 4040 --startup-delay 0.5
+
+--noise-lines floods stdout to check the add-on keeps draining it, and
+--fail-auth exits with ngrok's authentication error.
+"""
+import argparse
+import asyncio
+import os
+import secrets
+import socket
+import sys
+import time
+from datetime import datetime, timezone
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+
+def log(level: str, msg: str, **fields):
+    """Print a log line in ngrok's logfmt format."""
+    parts = [f"t={datetime.now(timezone.utc).isoformat()}", f"lvl={level}", f'msg="{msg}"']
+    parts.extend(f"{key}={value}" for key, value in fields.items())
+    print(" ".join(parts), flush=True)
+
+
+class FakeNgrokAgent:
+    """In-memory ngrok agent with named tunnels."""
+
+    def __init__(self, tunnel_delay_ms: float = 0.0, domain: str = "ngrok-free.app", noise_lines: int = 0):
+        self.tunnel_delay = tunnel_delay_ms / 1000.0
+        self.noise_lines = noise_lines
+        self.domain = domain
+        self.tunnels = {}
+
+    def _tunnel(self, name: str, addr: str) -> dict:
+        if addr.isdigit():
+            addr = f"http://localhost:{addr}"
+        return {
+            "name": name,
+            "ID": secrets.token_hex(16),
+            "uri": f"/api/tunnels/{name}",
+            "public_url": f"https://{secrets.token_hex(6)}.{self.domain}",
+            "proto": "https",
+            "config": {"addr": addr, "inspect": True},
+            "metrics": {}
+        }
+
+    def log_noise(self, request: Request):
+        """Log debug lines for a request, like a busy agent does."""
+        for i in range(self.noise_lines):
+            log("dbug", "api request", obj="web", method=request.method, path=request.url.path, n=i, pad="x" * 200)
+
+    async def list_tunnels(self, request: Request):
+        self.log_noise(request)
+        return JSONResponse({"tunnels": list(self.tunnels.values()), "uri": "/api/tunnels"})
+
+    async def start_tunnel(self, request: Request):
+        body = await request.json()
+        name = body.get("name") or f"tunnel-{len(self.tunnels)}"
+        if name in self.tunnels:
+            return JSONResponse({
+                "error_code": 102,
+                "status_code": 400,
+                "msg": f"tunnel '{name}' already exists",
+                "details": {}
+            }, status_code=400)
+
+        if self.tunnel_delay:
+            await asyncio.sleep(self.tunnel_delay)
+        tunnel = self._tunnel(name, str(body.get("addr", "80")))
+        self.tunnels[name] = tunnel
+        log("info", "started tunnel", obj="tunnels", name=name,
+            addr=tunnel["config"]["addr"], url=tunnel["public_url"])
+        return JSONResponse(tunnel, status_code=201)
+
+    async def get_tunnel(self, request: Request):
+        self.log_noise(request)
+        tunnel = self.tunnels.get(request.path_params["name"])
+        if tunnel is None:
+            return JSONResponse({"error_code": 100, "status_code": 404, "msg": "Tunnel not found"}, status_code=404)
+        return JSONResponse(tunnel)
+
+    async def stop_tunnel(self, request: Request):
+        name = request.path_params["name"]
+        if self.tunnels.pop(name, None) is None:
+            return JSONResponse({"error_code": 100, "status_code": 404, "msg": "Tunnel not found"}, status_code=404)
+        log("info", "stopped tunnel", obj="tunnels", name=name)
+        return Response(status_code=204)
+
+    def create_app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/api/tunnels", self.list_tunnels, methods=["GET"]),
+            Route("/api/tunnels", self.start_tunnel, methods=["POST"]),
+            Route("/api/tunnels/{name}", self.get_tunnel, methods=["GET"]),
+            Route("/api/tunnels/{name}", self.stop_tunnel, methods=["DELETE"]),
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local ngrok agent stand-in")
+    parser.add_argument("--api-port", type=int, default=int(os.getenv("FAKE_NGROK_API_PORT", "4040")))
+    parser.add_argument("--startup-delay", type=float, default=float(os.getenv("FAKE_NGROK_STARTUP_DELAY", "0")),
+                        help="Seconds before the agent API starts answering")
+    parser.add_argument("--tunnel-delay-ms", type=float, default=float(os.getenv("FAKE_NGROK_TUNNEL_DELAY_MS", "0")),
+                        help="Latency added to every tunnel creation")
+    parser.add_argument("--noise-lines", type=int, default=int(os.getenv("FAKE_NGROK_NOISE_LINES", "0")),
+                        help="Debug lines logged per API request, to exercise log draining")
+    parser.add_argument("--fail-auth", action="store_true",
+                        help="Log an authentication error and exit, like ngrok with a bad token")
+    # Accept the real ngrok command line (start --none --log=stdout ...) and ignore it
+    args, _ = parser.parse_known_args()
+
+    import uvicorn
+
+    log("info", "no configuration paths supplied")
+    if args.fail_auth:
+        log("eror", "session closing", obj="tunnels.session",
+            err='"authentication failed: The authtoken you specified does not look like a proper ngrok tunnel authtoken."')
+        log("crit", "command failed", err='"authentication failed"')
+        sys.exit(1)
+    if args.startup_delay:
+        time.sleep(args.startup_delay)
+
+    if not os.getenv("NGROK_AUTHTOKEN") and "--authtoken" not in sys.argv:
+        log("warn", "no authtoken configured; fake agent accepts anyway")
+
+    agent = FakeNgrokAgent(args.tunnel_delay_ms, noise_lines=args.noise_lines)
+    # Listen before logging, like ngrok, so the add-on can call the API as soon as it reads the event
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", args.api_port))
+    sock.listen(128)
+    log("info", "starting web service", obj="web", addr=f"127.0.0.1:{args.api_port}", allow_hosts="[]")
+    log("info", "client session established", obj="tunnels.session")
+    server = uvicorn.Server(uvicorn.Config(agent.create_app(), log_level="warning"))
+    server.run(sockets=[sock])
+
+
+if __name__ == "__main__":
+    main()
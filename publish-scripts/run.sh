@@ -62,13 +62,31 @@ else
     echo "Using PORT from environment variable: $PORT"
 fi
 
+# Export optional tuning options from options.json unless already set in the environment
+for OPTION in WEB_WORKERS TUNNEL_BACKEND LOCAL_PUBLIC_URL RUN_RATE_LIMIT_PER_LINK RUN_RATE_LIMIT_LINK_BURST RUN_RATE_LIMIT_PER_CLIENT RUN_RATE_LIMIT_CLIENT_BURST RUN_RESPONSE_MODE; do
+    if [ -z "${!OPTION}" ] && [ -f "/data/options.json" ] && jq -e ".$OPTION" /data/options.json > /dev/null 2>&1; then
+        export "$OPTION=$(jq --raw-output ".$OPTION" /data/options.json)"
+        echo "Using $OPTION from /data/options.json: ${!OPTION}"
+    fi
+done
+
+# One worker unless WEB_WORKERS asks for more. With several workers, links are
+# shared through the tunnel registry and a single worker owns the tunnel agent,
+# but rate limits, metrics, run deduplication, the run queue and the Home
+# Assistant subscription stay per worker.
+if [ -z "$WEB_WORKERS" ] || [ "$WEB_WORKERS" = "0" ]; then
+    WEB_WORKERS=1
+fi
+export WEB_WORKERS
+echo "Using $WEB_WORKERS worker(s)"
+
 # Set the app directory as the base for Python imports
 export PYTHONPATH="/app:${PYTHONPATH:-}"
 
 # Change to the app directory to ensure all imports work correctly
 cd /app
 
-# Start the FastAPI application using Gunicorn with a single Uvicorn worker
+# Start the FastAPI application using Gunicorn with WEB_WORKERS Uvicorn workers
 # The app is located at /app/main.py (module main, FastAPI instance 'app')
 # It will listen on 0.0.0.0:$PORT as defined in config.json ports and Dockerfile EXPOSE
-gunicorn main:app --bind 0.0.0.0:$PORT --worker-class uvicorn.workers.UvicornWorker --workers 1 --log-level info
+gunicorn main:app --bind 0.0.0.0:$PORT --worker-class uvicorn.workers.UvicornWorker --workers $WEB_WORKERS --log-level info
@@ -21,6 +21,17 @@ curl -X GET "http://localhost:8099/scripts/script.yuval_phone_notification_test_
 # Execute a script (requires active tunnel)
 curl -X GET "http://localhost:8099/scripts/run/script.yuval_phone_notification_test_script" | jq
 
+# Execute several scripts concurrently in one request
+curl -X POST "http://localhost:8099/scripts/run-batch" \
+  -H "Content-Type: application/json" \
+  -d '{"script_ids": ["script.turn_on_living_room_lights", "script.yuval_phone_notification_test_script"]}' | jq
+
+# Execute a script through its published link without waiting (returns 202 with a job id)
+curl -X GET "http://localhost:8099/run/your-unique-hash?async=true" | jq
+
+# Get the status and result of a queued run
+curl -X GET "http://localhost:8099/jobs/your-run-job-id" | jq
+
 # =============================================================================
 # TUNNELS ROUTER ENDPOINTS
 # =============================================================================
@@ -32,12 +43,28 @@ curl -X POST "http://localhost:8099/tunnels/create" \
     "script_id": "script.yuval_phone_notification_test_script" | jq
   }'
 
+# Create a tunnel and wait for it instead of getting a job id back
+curl -X POST "http://localhost:8099/tunnels/create?wait=true" \
+  -H "Content-Type: application/json" \
+  -d '{"script_id": "script.yuval_phone_notification_test_script"}' | jq
+
+# Get the status of a tunnel creation job (job_id is returned by /tunnels/create)
+curl -X GET "http://localhost:8099/tunnels/jobs/your-job-id" | jq
+
+# Stream the progress of a tunnel creation job as server-sent events
+curl -N "http://localhost:8099/tunnels/jobs/your-job-id/events"
+
 # Get all active tunnels
 curl -X GET "http://localhost:8099/tunnels/" | jq
 
 # Get information about a specific tunnel
 curl -X GET "http://localhost:8099/tunnels/script.yuval_phone_notification_test_script" | jq
 
+# Extend the expiration of a specific tunnel by 30 minutes
+curl -X POST "http://localhost:8099/tunnels/script.yuval_phone_notification_test_script/extend" \
+  -H "Content-Type: application/json" \
+  -d '{"minutes": 30}' | jq
+
 # Delete a specific tunnel
 curl -X DELETE "http://localhost:8099/tunnels/script.yuval_phone_notification_test_script" | jq
 
@@ -5,6 +5,9 @@ let scriptsData = [];
 let filteredScripts = [];
 let activeTunnelScriptId = null; // Track which script has the active tunnel
 
+// Only the fields the UI renders are requested from the API
+const SCRIPT_FIELDS = 'entity_id,name,state';
+
 // DOM utility functions
 function $(selector) {
     return document.querySelector(selector);
@@ -17,16 +20,46 @@ function createElement(tag, className = '', textContent = '') {
     return element;
 }
 
+// Cached script list, revalidated against the API with its ETag
+function getCachedScripts() {
+    try {
+        const cached = JSON.parse(localStorage.getItem('scriptsCache') || 'null');
+        return cached && cached.etag && Array.isArray(cached.scripts) ? cached : null;
+    } catch(e) {
+        console.error('Error parsing cached scripts from localStorage', e);
+        return null;
+    }
+}
+
+function setCachedScripts(etag, scripts) {
+    try {
+        localStorage.setItem('scriptsCache', JSON.stringify({ etag, scripts }));
+    } catch(e) {
+        console.error('Error saving cached scripts to localStorage', e);
+    }
+}
+
 // API functions
 async function fetchScripts() {
     try {
-        const response = await fetch(`scripts/`);
+        const cached = getCachedScripts();
+        const headers = cached ? { 'If-None-Match': cached.etag } : {};
+        const response = await fetch(`scripts/?fields=${SCRIPT_FIELDS}`, { headers, cache: 'no-store' });
+        if (response.status === 304 && cached) {
+            console.log('Scripts unchanged since last fetch');
+            return cached.scripts;
+        }
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         const data = await response.json();
         console.log('Fetched scripts from API:', data);
-        return data.scripts || [];
+        const scripts = data.scripts || [];
+        const etag = response.headers.get('ETag');
+        if (etag) {
+            setCachedScripts(etag, scripts);
+        }
+        return scripts;
     } catch (error) {
         console.error('Error fetching scripts:', error);
         showError('Failed to load scripts from Home Assistant');
@@ -52,10 +85,17 @@ async function createTunnel(scriptId) {
         
         if (!response.ok) {
             const errorData = await response.json();
-            throw new Error(errorData.detail || `HTTP error! status: ${response.status}`);
+            const error = new Error(errorData.detail || `HTTP error! status: ${response.status}`);
+            error.status = response.status;
+            throw error;
         }
         
         const data = await response.json();
+        
+        // 202 means the tunnel is being created in a background job
+        if (response.status === 202) {
+            return await waitForTunnelJob(data);
+        }
         return data;
     } catch (error) {
         console.error('Error creating tunnel:', error);
@@ -63,6 +103,59 @@ async function createTunnel(scriptId) {
     }
 }
 
+// Follow a tunnel creation job until it completes or fails
+function waitForTunnelJob(job) {
+    return new Promise((resolve, reject) => {
+        const finish = (jobStatus) => {
+            if (jobStatus.status === 'completed') {
+                resolve(jobStatus.result);
+            } else {
+                const error = new Error(jobStatus.error || 'Tunnel creation failed');
+                error.status = jobStatus.status_code;
+                reject(error);
+            }
+        };
+        
+        if (typeof EventSource === 'undefined') {
+            pollTunnelJob(job.status_url).then(finish, reject);
+            return;
+        }
+        
+        const events = new EventSource(job.events_url);
+        events.addEventListener('progress', (event) => {
+            const progress = JSON.parse(event.data);
+            console.log('Tunnel job progress:', progress.message);
+        });
+        events.addEventListener('completed', (event) => {
+            events.close();
+            finish(JSON.parse(event.data));
+        });
+        events.addEventListener('failed', (event) => {
+            events.close();
+            finish(JSON.parse(event.data));
+        });
+        events.onerror = () => {
+            // The stream may be cut by a proxy; fall back to polling
+            events.close();
+            pollTunnelJob(job.status_url).then(finish, reject);
+        };
+    });
+}
+
+async function pollTunnelJob(statusUrl, intervalMs = 500) {
+    while (true) {
+        const response = await fetch(statusUrl);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const jobStatus = await response.json();
+        if (jobStatus.status === 'completed' || jobStatus.status === 'failed') {
+            return jobStatus;
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
 async function deleteTunnel(scriptId) {
     try {
         const response = await fetch(`tunnels/${scriptId}`, {
@@ -98,17 +191,48 @@ async function fetchTunnels() {
 }
 
 // Search functionality
-function filterScripts(searchTerm) {
-    const term = searchTerm.toLowerCase().trim();
+let searchRequestId = 0; // Ignore responses from searches that were superseded
+let searchDebounceTimer = null;
+
+async function searchScripts(term) {
+    const response = await fetch(`scripts/search?q=${encodeURIComponent(term)}&limit=100&fields=${SCRIPT_FIELDS}`);
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const data = await response.json();
+    return data.scripts || [];
+}
+
+async function filterScripts(searchTerm) {
+    const term = searchTerm.trim();
+    const requestId = ++searchRequestId;
     
     if (term === '') {
         filteredScripts = [...scriptsData];
     } else {
-        filteredScripts = scriptsData.filter(script => {
-            const scriptName = script.name || script.entity_id;
-            return scriptName.toLowerCase().includes(term) || 
-                   script.entity_id.toLowerCase().includes(term);
-        });
+        try {
+            const results = await searchScripts(term);
+            if (requestId !== searchRequestId) return;
+            
+            // Reuse the loaded script entries so tunnel state is preserved
+            const scriptsById = new Map(scriptsData.map(script => [script.entity_id, script]));
+            filteredScripts = results.map(result => {
+                let script = scriptsById.get(result.entity_id);
+                if (!script) {
+                    script = { ...result, tunnelInfo: null, isLoading: false };
+                    scriptsData.push(script);
+                }
+                return script;
+            });
+        } catch (error) {
+            console.error('Error searching scripts, filtering locally:', error);
+            const lowerTerm = term.toLowerCase();
+            filteredScripts = scriptsData.filter(script => {
+                const scriptName = script.name || script.entity_id;
+                return scriptName.toLowerCase().includes(lowerTerm) || 
+                       script.entity_id.toLowerCase().includes(lowerTerm);
+            });
+        }
     }
     
     renderScripts();
@@ -120,7 +244,8 @@ function setupSearch() {
     const searchInput = $('#search-input');
     if (searchInput) {
         searchInput.addEventListener('input', (event) => {
-            filterScripts(event.target.value);
+            clearTimeout(searchDebounceTimer);
+            searchDebounceTimer = setTimeout(() => filterScripts(event.target.value), 150);
         });
     }
 }
@@ -414,6 +539,10 @@ async function createTunnelWithRetry(scriptId, maxRetries = 3, delayMs = 1000) {
             lastError = error;
             console.error(`Attempt ${attempt} failed:`, error.message);
             
+            // 503 means Home Assistant is unavailable and the server is failing fast; retrying now won't help
+            if (error.status === 503) {
+                throw error;
+            }
             if (attempt === maxRetries) {
                 throw new Error(`Failed to create tunnel after ${maxRetries} attempts. Last error: ${error.message}`);
             }